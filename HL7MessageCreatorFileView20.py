@@ -4,9 +4,16 @@ import pandas as pd
 import random
 import os
 import re
+import json
+import threading
 from datetime import datetime, timedelta
 from hl7apy.parser import parse_message
 from hl7apy.exceptions import ValidationError
+try:  # Autosave journal lock: fcntl on POSIX, msvcrt on Windows
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
 
 # Color scheme
 BG_COLOR = "#1F2139"  # Dark blue-gray background
@@ -22,6 +29,9 @@ SELECTED_MATCH_BG = "#465BE7"  # Light blue for selected match (updated)
 # Directory setup
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = SCRIPT_DIR  # CSVs and output in script directory
+ENVIRONMENT_PROFILES_PATH = os.path.join(DATA_DIR, "environment_profiles.json")
+JOURNAL_PATH = os.path.join(DATA_DIR, "autosave_journal_fv20.jsonl")  # Edits since the last clean quit, replayed after a crash
+JOURNAL_LOCK_PATH = JOURNAL_PATH + ".lock"  # Held by the running copy that owns the journal
 
 # Default HL7 template
 default_hl7 = """
@@ -71,9 +81,36 @@ case_events = [
     ("out_pacu", "in_pacu+60"),
 ]
 
+# Built-in environment profiles, used when environment_profiles.json is missing.
+# Each profile maps a base field to where its value goes in the SIU message:
+# a segment field (optionally one component of it) or its own OBX segment.
+default_environment_profiles = {
+    "US Demo": {
+        "laterality": {"segment": "AIS", "field": 12, "by_sequence": True},
+        "anesthesiaType": {"segment": "AIS", "field": 11, "format": "{value}^", "by_sequence": True},
+        "isolations": {"segment": "PV2", "field": 7, "create_after": "PV1"},
+    },
+    "UCH": {
+        "laterality": {"segment": "AIS", "field": 3, "component": 5, "by_sequence": True},
+        "anesthesiaType": {"obx": "ST", "identifier": "ANESTHESIA^Anesthesia Type"},
+        "isolations": {"obx": "ST", "identifier": "ISOLATION^Risk Factor", "format": "^{value}", "repeat": True},
+    },
+}
+
 # Default font
 DEFAULT_FONT = ("Arial", 10)
 
+# Creator session files: a JSON header line, then one JSON line per patient
+SESSION_FORMAT = "hl7-creator-session-fv20"  # Each app has its own, as their patient records differ
+SESSION_VERSION = 1
+
+# Autosave journal: edits arriving within this many seconds share one fsync
+JOURNAL_FLUSH_INTERVAL = 0.5
+# The journal is rewritten as a snapshot once this many records have been appended,
+# checked every JOURNAL_COMPACT_INTERVAL milliseconds
+JOURNAL_COMPACT_RECORDS = 5000
+JOURNAL_COMPACT_INTERVAL = 60000
+
 # Helper function to validate HHMMSS time format
 def is_valid_time(time_str):
     if not time_str:
@@ -84,6 +121,421 @@ def is_valid_time(time_str):
     except ValueError:
         return False
 
+# Templates are edited as a list of segments, each a list of fields
+def parse_segments(template):
+    return [line.split("|") for line in template.splitlines()]
+
+def serialize_segments(segments):
+    return "\n".join("|".join(fields) for fields in segments)
+
+def find_segment(segments, name, default=None):
+    return next((i for i, fields in enumerate(segments) if fields[0] == name), default)
+
+def load_environment_profiles(path=ENVIRONMENT_PROFILES_PATH):
+    if not os.path.exists(path):
+        return default_environment_profiles
+    with open(path, encoding="utf-8") as f:
+        profiles = json.load(f)
+    if not isinstance(profiles, dict) or not profiles:
+        raise ValueError(f"{os.path.basename(path)} must map environment names to field placements")
+    return profiles
+
+def set_field_value(fields, field, component, value):
+    if len(fields) <= field:
+        fields.extend([""] * (field + 1 - len(fields)))
+    if component is None:
+        fields[field] = value
+    else:
+        components = fields[field].split("^")
+        if len(components) <= component:
+            components.extend([""] * (component + 1 - len(components)))
+        components[component] = value
+        fields[field] = "^".join(components)
+
+def compile_field_placement(spec):
+    segment = spec["segment"]
+    field = int(spec["field"])
+    component = int(spec["component"]) - 1 if spec.get("component") else None
+    value_format = spec.get("format", "{value}")
+    by_sequence = bool(spec.get("by_sequence", False))
+    create_after = spec.get("create_after")
+
+    def place(segments, values):
+        found = False
+        for fields in segments:
+            if fields[0] != segment:
+                continue
+            found = True
+            if by_sequence:
+                # The Nth segment (by set ID) takes the Nth procedure's value
+                seq = int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else 1
+                value = values[seq - 1] if seq - 1 < len(values) else ""
+            else:
+                value = values[0]
+            if value:
+                set_field_value(fields, field, component, value_format.replace("{value}", value))
+        if not found and create_after and values[0]:
+            insert_idx = find_segment(segments, create_after)
+            if insert_idx is not None:
+                new_fields = [segment] + [""] * (field + 1)
+                set_field_value(new_fields, field, component, value_format.replace("{value}", values[0]))
+                segments.insert(insert_idx + 1, new_fields)
+    return place
+
+def compile_obx_placement(spec):
+    value_type = spec["obx"]
+    identifier = spec["identifier"]
+    value_format = spec.get("format", "{value}")
+    repeat = bool(spec.get("repeat", False))
+
+    def place(segments, values):
+        if not values[0]:
+            return
+        # Repeating fields get one OBX per ~-separated value
+        items = [item.strip() for item in values[0].split("~")] if repeat else [values[0]]
+        insert_idx = find_segment(segments, "AIS", len(segments))
+        obx_count = sum(1 for fields in segments if fields[0] == "OBX")
+        for item in items:
+            if not item:
+                continue
+            obx_count += 1
+            value = value_format.replace("{value}", item)
+            obx = f"OBX|{obx_count}|{value_type}|{identifier}||{value}|||||||||{{YYYYMMDD}}{{eventTime}}00||||||||||||||||||"
+            segments.insert(insert_idx, obx.split("|"))
+            insert_idx += 1
+    return place
+
+def compile_environment_profiles(profiles):
+    # Resolve every profile into an ordered table of (field key, placer) so
+    # generating a message does no config lookups or environment branching
+    tables = {}
+    for name, placements in profiles.items():
+        table = []
+        for field_name, spec in placements.items():
+            key = field_name if field_name.startswith("{") else f"{{{field_name}}}"
+            try:
+                if "obx" in spec:
+                    table.append((key, compile_obx_placement(spec)))
+                elif "segment" in spec and "field" in spec:
+                    table.append((key, compile_field_placement(spec)))
+                else:
+                    raise ValueError("needs either 'obx' or 'segment' and 'field'")
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Environment '{name}', field '{field_name}': {e}") from e
+        tables[name] = tuple(table)
+    return tables
+
+class FieldExtractor:
+    """Reads a set of fields from a message in one pass, splitting each segment once."""
+
+    def __init__(self, rules):
+        self.rules = {}
+        for rule in rules:
+            when = rule.get("when")
+            self.rules.setdefault(rule["segment"], []).append((rule["key"], tuple(rule["locations"]), when))
+        # Segments are only split as far as the last field any of their rules reads
+        for segment, segment_rules in self.rules.items():
+            fields = [field for _, locations, when in segment_rules for field, _ in locations]
+            fields += [when[0] for _, _, when in segment_rules if when is not None]
+            self.rules[segment] = (max(fields) + 1, tuple(segment_rules))
+
+    def extract(self, message_text):
+        values = {}
+        rules = self.rules
+        for line in message_text.splitlines():
+            segment = rules.get(line[:3])
+            if segment is None:
+                continue
+            max_split, segment_rules = segment
+            parts = line.split("|", max_split)
+            field_count = len(parts)
+            for key, locations, when in segment_rules:
+                if when is not None and (when[0] >= field_count or when[1] not in parts[when[0]]):
+                    continue
+                # First non-empty location wins; later segments override earlier ones
+                for field, component in locations:
+                    if field >= field_count:
+                        continue
+                    value = parts[field]
+                    if component is not None:
+                        components = value.split("^")
+                        value = components[component - 1] if len(components) >= component else ""
+                    if value:
+                        values[key] = value
+                        break
+        return values
+
+    def locate(self, message_text):
+        """key -> (line_index, start, end) of each value extract() returns, for Text widget indexes."""
+        spans = {}
+        rules = self.rules
+        for line_idx, line in enumerate(message_text.splitlines()):
+            segment = rules.get(line[:3])
+            if segment is None:
+                continue
+            max_split, segment_rules = segment
+            parts = line.split("|", max_split)
+            field_count = len(parts)
+            starts = [0]
+            for part in parts[:-1]:
+                starts.append(starts[-1] + len(part) + 1)
+            for key, locations, when in segment_rules:
+                if when is not None and (when[0] >= field_count or when[1] not in parts[when[0]]):
+                    continue
+                for field, component in locations:
+                    if field >= field_count:
+                        continue
+                    value = parts[field]
+                    start = starts[field]
+                    if component is not None:
+                        components = value.split("^")
+                        if len(components) < component:
+                            continue
+                        start += sum(len(piece) + 1 for piece in components[:component - 1])
+                        value = components[component - 1]
+                    if value:
+                        spans[key] = (line_idx, start, start + len(value))
+                        break
+        return spans
+
+def new_staff_entry(role=None, staff_id="{staffID}"):
+    staff = {"lastName": "", "firstName": "", "id": staff_id}
+    if role is not None:
+        staff["role"] = role
+    return staff
+
+class PatientRecord:
+    """One Creator patient as plain strings. Only the patient on screen is bound to Tk variables,
+    so records are cheap to keep in bulk and can be handed to worker threads or processes."""
+    __slots__ = ("base_values", "procedure_specialty", "message_type", "environment", "fixed_staff",
+                 "additional_surgeons", "staff_members", "procedures", "allergies", "messages", "session_line")
+
+    def __init__(self, environment):
+        self.base_values = {p['key']: 'IP' if p['key'] == '{encounterType}' else 'N/A' if p['key'] == '{laterality}' else '' for p in base_prompts}
+        self.procedure_specialty = "GEN"
+        self.message_type = "Scheduled & Case Events"
+        self.environment = environment  # Environment profile name
+        self.fixed_staff = {role_info["role"]: new_staff_entry(staff_id="{surgeonID}" if role_info["role"] == "Primary Surgeon" else "{staffID}")
+                            for role_info in fixed_roles}
+        self.additional_surgeons = []
+        self.staff_members = []
+        self.procedures = []
+        self.allergies = []
+        self.messages = []
+        self.session_line = None  # JSON line of a restored record not yet parsed
+
+    @classmethod
+    def from_session_line(cls, line):
+        record = cls.__new__(cls)
+        record.session_line = line
+        return record
+
+    def __getattr__(self, name):
+        # Only reached for unset slots: a restored record parses its session line on first use
+        if name == "session_line" or name not in PatientRecord.__slots__ or self.session_line is None:
+            raise AttributeError(name)
+        self.load_session_line(self.session_line)
+        return getattr(self, name)
+
+    def load_session_line(self, line):
+        self.load_session_data(json.loads(line))
+
+    def load_session_data(self, data):
+        self.__init__(data["environment"])
+        self.base_values.update(data["base_values"])
+        self.procedure_specialty = data["procedure_specialty"]
+        self.message_type = data["message_type"]
+        self.fixed_staff.update(data["fixed_staff"])
+        self.additional_surgeons = data["additional_surgeons"]
+        self.staff_members = data["staff_members"]
+        self.procedures = data["procedures"]
+        self.allergies = data["allergies"]
+        self.messages = [tuple(message) for message in data["messages"]]
+
+    def to_session_line(self):
+        # A restored record nobody has looked at is written back unchanged, without parsing it
+        if self.session_line is not None:
+            return self.session_line
+        return json.dumps({
+            "base_values": self.base_values,
+            "procedure_specialty": self.procedure_specialty,
+            "message_type": self.message_type,
+            "environment": self.environment,
+            "fixed_staff": self.fixed_staff,
+            "additional_surgeons": self.additional_surgeons,
+            "staff_members": self.staff_members,
+            "procedures": self.procedures,
+            "allergies": self.allergies,
+            "messages": self.messages,
+        }, separators=(",", ":"))
+
+    def field_path(self, store, key):
+        """Path of store[key] within this record, as written to the autosave journal; None if not found."""
+        if store is self.base_values:
+            return ["base_values", key]
+        for role, staff in self.fixed_staff.items():
+            if staff is store:
+                return ["fixed_staff", role, key]
+        for name in ("procedures", "staff_members", "additional_surgeons"):
+            for index, item in enumerate(getattr(self, name)):
+                if item is store:
+                    return [name, index, key]
+        return None
+
+    def set_field(self, path, value):
+        if len(path) == 1:
+            setattr(self, path[0], value)
+            return
+        target = getattr(self, path[0])
+        for key in path[1:-1]:
+            target = target[key]
+        target[path[-1]] = value
+
+def write_session(path, patients, current_index, last_mrn):
+    header = {"format": SESSION_FORMAT, "version": SESSION_VERSION, "patients": len(patients),
+              "current": current_index, "last_mrn": last_mrn}
+    lines = [json.dumps(header)]
+    lines.extend(patient.to_session_line() for patient in patients)
+    # Write beside the target and rename, so a failed save leaves the previous session intact
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+def read_session(path):
+    """Returns (patients, header). Patient lines are kept as text until each record is first used."""
+    with open(path, 'r') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get("format") != SESSION_FORMAT:
+            raise ValueError(f"{os.path.basename(path)} is not a Creator session file")
+        if header["version"] > SESSION_VERSION:
+            raise ValueError(f"{os.path.basename(path)} was saved by a newer version of this application")
+        patients = [PatientRecord.from_session_line(line.rstrip("\n")) for line in f if line.strip()]
+    if len(patients) != header["patients"]:
+        raise ValueError(f"{os.path.basename(path)} is truncated")
+    return patients, header
+
+class Journal:
+    """Append-only JSON lines log of edits. append() only queues a record; a writer thread
+    writes what has queued up in batches, with one fsync per batch. If a write fails the
+    thread stops, keeps the error in `error` and later records are dropped."""
+
+    def __init__(self, path, flush_interval=JOURNAL_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.appended = 0  # Records since the journal was last compacted
+        self.condition = threading.Condition()
+        self.io_lock = threading.Lock()  # Held while the file is written or replaced
+        self.closing = threading.Event()
+        self.error = None
+        self.file = open(path, 'a')
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def append(self, record):
+        self.append_line(json.dumps(record, separators=(",", ":")))
+
+    def append_line(self, line):
+        with self.condition:
+            if self.error is not None:
+                return
+            self.pending.append(line)
+            self.appended += 1
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closing.is_set():
+                    self.condition.wait()
+            if not self.closing.is_set():
+                self.closing.wait(self.flush_interval)
+            with self.io_lock:
+                with self.condition:
+                    batch = self.pending
+                    self.pending = []
+                try:
+                    if batch:
+                        self.file.write("\n".join(batch) + "\n")
+                        self.file.flush()
+                        os.fsync(self.file.fileno())
+                except OSError as e:
+                    with self.condition:
+                        self.error = e
+                        self.pending = []
+                    return
+            if self.closing.is_set() and not batch:
+                return
+
+    def compact(self, lines):
+        """Replace the journal with lines that rebuild the current state. Records still queued
+        are dropped, as the snapshot was taken after they were made. If the replace fails the
+        journal is left as it was and appending carries on."""
+        with self.io_lock:
+            # Windows cannot replace a file that is still open
+            self.file.close()
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    f.write("".join(line + "\n" for line in lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            finally:
+                self.file = open(self.path, 'a')
+            with self.condition:
+                self.pending = []
+                self.appended = 0
+
+    def close(self):
+        self.closing.set()
+        with self.condition:
+            self.condition.notify()
+        self.thread.join()
+        try:
+            self.file.close()
+        except OSError:
+            pass  # Unwritten data after a failed write; the error has already been reported
+
+def read_journal(path):
+    """Records in a journal, stopping at a torn last line left by a crash mid-write."""
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+def lock_file(path):
+    """Open path and take an exclusive lock on it, returning the open file, or None if
+    another process holds the lock. The OS drops the lock when its holder exits, so a
+    crashed instance never leaves a stale lock behind."""
+    f = open(path, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    f.seek(0)
+    f.truncate()
+    f.write(f"{os.getpid()}\n")  # For whoever finds the lock file; the lock itself is what counts
+    f.flush()
+    return f
+
 # Custom UppercaseEntry widget with dynamic width
 class UppercaseEntry(tk.Entry):
     def __init__(self, master, base_width=20, min_width=10, *args, **kwargs):
@@ -112,6 +564,8 @@ class HL7MessageApp:
         self.default_height = 1232
         self.root.geometry(f"{self.default_width}x{self.default_height}")
         self.root.minsize(800, 600)
+        # Closing the window is a normal quit, so it confirms and discards the autosave journal too
+        self.root.protocol("WM_DELETE_WINDOW", self.quit)
         self.entry_widgets = []
         self.root.bind("<Configure>", self.on_window_resize)
 
@@ -146,6 +600,14 @@ class HL7MessageApp:
             self.root.quit()
             return
 
+        # Load environment profiles and compile their field placements
+        try:
+            self.environment_tables = compile_environment_profiles(load_environment_profiles())
+        except Exception as e:
+            messagebox.showwarning("Environment Profiles", f"Failed to load environment profiles, using built-in defaults: {e}")
+            self.environment_tables = compile_environment_profiles(default_environment_profiles)
+        self.default_environment = next(iter(self.environment_tables))
+
         # Initialize state
         self.patients = []
         self.current_patient_index = -1
@@ -170,8 +632,10 @@ class HL7MessageApp:
         self.file_menu = tk.Menu(self.menu_bar, tearoff=0, font=DEFAULT_FONT)
         self.file_menu.add_command(label="New Patient (Ctrl+N)", command=self.create_new_patient)
         self.file_menu.add_command(label="Open File(s) (Ctrl+O)", command=self.open_files)
+        self.file_menu.add_command(label="Open Session...", command=self.open_session)
         self.file_menu.add_command(label="Save (Ctrl+S)", command=self.save_files)
         self.file_menu.add_command(label="Save & Exit (Ctrl+Shift+S)", command=self.save_and_exit)
+        self.file_menu.add_command(label="Save Session...", command=self.save_session)
         self.file_menu.add_command(label="Quit (Ctrl+Q)", command=self.quit)
         self.menu_bar.add_cascade(label="File", menu=self.file_menu)
         view_menu = tk.Menu(self.menu_bar, tearoff=0, font=DEFAULT_FONT)
@@ -187,6 +651,12 @@ class HL7MessageApp:
         self.content_frame = tk.Frame(root, bg=BG_COLOR)
         self.content_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+        # Restore work from the autosave journal if the last run did not quit normally
+        self.journal = None
+        self.journal_lock = None
+        self.journal_compact_warned = False
+        self.start_journal()
+
         # Start in Creator mode
         self.set_mode("Creator")
 
@@ -203,11 +673,15 @@ class HL7MessageApp:
             self.root.title("HL7 Message Creator")
             self.file_menu.entryconfig("New Patient (Ctrl+N)", state="normal")
             self.file_menu.entryconfig("Open File(s) (Ctrl+O)", state="disabled")
+            self.file_menu.entryconfig("Open Session...", state="normal")
+            self.file_menu.entryconfig("Save Session...", state="normal")
             self.setup_creator()
         elif mode == "Editor":
             self.root.title("HL7 Message Editor")
             self.file_menu.entryconfig("New Patient (Ctrl+N)", state="disabled")
             self.file_menu.entryconfig("Open File(s) (Ctrl+O)", state="normal")
+            self.file_menu.entryconfig("Open Session...", state="disabled")
+            self.file_menu.entryconfig("Save Session...", state="disabled")
             self.setup_editor()
 
     def open_help(self):
@@ -277,13 +751,14 @@ Creator Mode allows you to generate HL7 messages for new patients.
   - **Date Buttons**: Set the scheduled date to -1 Day, Today, or +1 Day.
   - **Time Buttons**: Adjust the scheduled time by -1 Hour, Now, or +1 Hour.
 - Select an **Encounter Type** (e.g., Inpatient, Emergent) via radio buttons.
-- Select an **Environment** (US Demo or UCH) to control how fields map to HL7 segments.
+- Select an **Environment** (US Demo, UCH, or any site in `environment_profiles.json`) to control how fields map to HL7 segments.
 - Specify the **Message Type** (Scheduled, Scheduled & Case Events, or Scheduled & Canceled) to define the output messages.
 
 *New Fields* #new-fields
 The application now supports additional clinical fields that are environment-specific:
 
 - **Environment**: Select "US Demo" or "UCH" to control how the new fields map to HL7 segments. This affects Anesthesia Type, Laterality, and Isolations placement.
+  Environments are read from `environment_profiles.json` next to the application; add a site there to make it selectable. The built-in US Demo and UCH profiles are used if the file is missing.
 
 - **ASA Score**: Select the patient's ASA physical status classification (1-6). This appears as an OBX segment in both environments.
 
@@ -318,6 +793,8 @@ The application now supports additional clinical fields that are environment-spe
 - Preview the generated message in the text area below the input fields.
 - Save messages via **File > Save** (Ctrl+S) or **Save & Exit** (Ctrl+Shift+S), selecting an output directory.
 - Messages are saved as `.hl7` files, named with the patient’s name and a sequence number (e.g., `JohnDoe-00.hl7`).
+- **File > Save Session...** saves every patient (fields, procedures, staff, allergies, message type, environment and any generated messages) to a `.hl7session` file, and **File > Open Session...** restores them later, replacing the current patients. Each patient is only read in full when you view it, so large sessions open quickly.
+- Work in progress is also autosaved as you type to `autosave_journal_fv20.jsonl` next to the application. If the application does not quit normally (a crash or power loss), you are offered to restore the patients and any unsaved Editor edits the next time it starts. Quitting with **File > Quit** or by closing the window discards the journal. If a second copy of the application is started while one is running, only the first autosaves.
 
 **Editor Mode** #editor-mode
 Editor Mode is used to modify existing HL7 messages.
@@ -442,18 +919,200 @@ For further assistance, contact the application support team or refer to the **H
         )
         if not out_dir:
             return
+        self.creator_load_records(range(len(self.patients)))
         total_messages = 0
         total_patients = 0
         for patient in self.patients:
-            if patient['messages']:
+            if patient.messages:
                 total_patients += 1
-                total_messages += len(patient['messages'])
-                base_name = f"{patient['base_vars']['{patientFirstName}'].get() or 'First'}{patient['base_vars']['{patientLastName}'].get() or 'Last'}"
-                for msg, idx in patient['messages']:
+                total_messages += len(patient.messages)
+                base_name = f"{patient.base_values['{patientFirstName}'] or 'First'}{patient.base_values['{patientLastName}'] or 'Last'}"
+                for msg, idx in patient.messages:
                     with open(os.path.join(out_dir, f"{base_name}-{idx}.hl7"), 'w') as f:
                         f.write(msg)
         messagebox.showinfo("Save Complete", f"Saved {total_messages} messages for {total_patients} patients to {out_dir}")
 
+    def save_session(self):
+        if not self.patients:
+            messagebox.showwarning("Nothing to Save", "Create a patient first.")
+            return
+        path = filedialog.asksaveasfilename(title="Save Session", initialdir=DATA_DIR, defaultextension=".hl7session",
+                                            filetypes=[("Creator Session", "*.hl7session")])
+        if not path:
+            return
+        try:
+            write_session(path, self.patients, self.current_patient_index, self.last_mrn)
+        except OSError as e:
+            messagebox.showerror("Save Failed", str(e))
+            return
+        messagebox.showinfo("Save Complete", f"Saved {len(self.patients)} patients to {os.path.basename(path)}")
+
+    def open_session(self):
+        if self.mode != "Creator":
+            messagebox.showwarning("Invalid Mode", "Sessions are only available in Creator mode.")
+            return
+        path = filedialog.askopenfilename(title="Open Session", initialdir=DATA_DIR,
+                                          filetypes=[("Creator Session", "*.hl7session"), ("All Files", "*.*")])
+        if not path:
+            return
+        if self.patients and not messagebox.askyesno("Open Session", "Replace the current patients with the saved session?"):
+            return
+        try:
+            patients, header = read_session(path)
+            last_mrn = header["last_mrn"]
+            current = min(max(header["current"], 0), len(patients) - 1)
+            # Decode the patient to be shown now, so a file this app cannot read fails before anything is replaced
+            if patients:
+                patients[current].load_session_line(patients[current].session_line)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            messagebox.showerror("Open Failed", str(e))
+            return
+        self.patients = patients
+        self.last_mrn = max(self.last_mrn, last_mrn)
+        if not patients:
+            self.current_patient_index = -1
+            self.create_new_patient()
+            return
+        self.current_patient_index = current
+        self.compact_journal()
+        self.creator_load_patient()
+
+    def start_journal(self):
+        # The lock stays held until quit, so another running copy never replays or deletes this journal
+        try:
+            self.journal_lock = lock_file(JOURNAL_LOCK_PATH)
+        except OSError as e:
+            messagebox.showwarning("Autosave Disabled", f"Could not lock the autosave journal: {e}")
+            return
+        if self.journal_lock is None:
+            messagebox.showwarning("Autosave Disabled", "Another copy of the application is running and using the autosave "
+                                                        "journal. Work in this window will not be autosaved.")
+            return
+        recovered = False
+        if os.path.exists(JOURNAL_PATH):
+            try:
+                records = read_journal(JOURNAL_PATH)
+            except OSError:
+                records = []
+            if records and messagebox.askyesno("Recover Unsaved Work", "The application did not quit normally last time. "
+                                               "Restore patients and Editor edits from the autosave journal?"):
+                self.replay_journal(records)
+                recovered = True
+        try:
+            if not recovered and os.path.exists(JOURNAL_PATH):
+                os.remove(JOURNAL_PATH)
+            self.journal = Journal(JOURNAL_PATH)
+        except OSError as e:
+            messagebox.showwarning("Autosave Disabled", f"Could not open the autosave journal: {e}")
+            return
+        if recovered:
+            self.compact_journal()
+        self.root.after(JOURNAL_COMPACT_INTERVAL, self.journal_compact_tick)
+
+    def replay_journal(self, records):
+        patients = []
+        current = -1
+        editor_edits = {}
+        for record in records:
+            try:
+                op = record["op"]
+                if op == "reset":
+                    patients = []
+                    self.last_mrn = max(self.last_mrn, record["last_mrn"])
+                elif op == "patient":
+                    if "line" in record:
+                        patient = PatientRecord.from_session_line(record["line"])
+                    else:
+                        patient = PatientRecord(self.default_environment)
+                        patient.load_session_data(record["record"])
+                    if record["i"] == len(patients):
+                        patients.append(patient)
+                        current = record["i"]
+                    else:
+                        patients[record["i"]] = patient
+                    self.last_mrn = max(self.last_mrn, record["last_mrn"])
+                elif op == "set":
+                    patients[record["i"]].set_field(record["path"], record["value"])
+                elif op == "current":
+                    current = record["i"]
+                elif op == "editor":
+                    for file_path in record.get("files") or [record["file"]]:
+                        editor_edits[file_path] = record["text"]
+                elif op == "saved":
+                    editor_edits.clear()
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue  # A record from a damaged journal; keep whatever else can be restored
+        self.patients = patients
+        self.current_patient_index = min(max(current, 0), len(patients) - 1)
+        # Recovered Editor edits are reopened as messages ready for File > Save
+        patient_groups = {}
+        for file_path, message_text in sorted(editor_edits.items()):
+            self.edited_messages[file_path] = message_text
+            message = {'file_path': file_path, 'message_text': message_text, 'parsed_values': self.parse_hl7_message(message_text)}
+            patient_groups.setdefault(os.path.basename(file_path).split('-')[0], []).append(message)
+        self.patient_blocks = [{'patient_name': patient_name, 'messages': messages} for patient_name, messages in patient_groups.items()]
+        if self.patient_blocks:
+            messagebox.showinfo("Recover Unsaved Work", f"Restored {len(patients)} patients and {len(editor_edits)} edited Editor messages. "
+                                                        "Switch to Editor Mode and use File > Save to write the messages.")
+
+    def journal_active(self):
+        # The writer thread cannot show dialogs, so a failed write is reported on the next record
+        if self.journal is not None and self.journal.error is not None:
+            error = self.journal.error
+            self.journal.close()
+            self.journal = None
+            messagebox.showwarning("Autosave Disabled", f"Could not write the autosave journal, autosave is now off: {error}")
+        return self.journal is not None
+
+    def journal_append(self, record):
+        if self.journal_active():
+            self.journal.append(record)
+
+    def journal_patient(self, index=None):
+        # Records changed in code are journaled whole; typed edits go field by field through journal_field
+        if self.journal_active():
+            index = self.current_patient_index if index is None else index
+            self.journal.append_line(self.journal_patient_line(index, self.patients[index]))
+
+    def journal_patient_line(self, index, patient):
+        # A restored record nobody has looked at is journaled as its session line, still unparsed
+        # and as a JSON string, so a damaged line cannot break the journal around it
+        if patient.session_line is not None:
+            return f'{{"op":"patient","i":{index},"last_mrn":{self.last_mrn},"line":{json.dumps(patient.session_line)}}}'
+        return f'{{"op":"patient","i":{index},"last_mrn":{self.last_mrn},"record":{patient.to_session_line()}}}'
+
+    def journal_field(self, store, key):
+        patient = self.patients[self.current_patient_index]
+        path = patient.field_path(store, key)
+        if path is None:
+            self.journal_patient()
+        else:
+            self.journal_append({"op": "set", "i": self.current_patient_index, "path": path, "value": store[key]})
+
+    def journal_snapshot(self):
+        lines = [json.dumps({"op": "reset", "last_mrn": self.last_mrn})]
+        lines.extend(self.journal_patient_line(index, patient) for index, patient in enumerate(self.patients))
+        if self.mode == "Creator" and 0 <= self.current_patient_index < len(self.patients):
+            lines.append(json.dumps({"op": "current", "i": self.current_patient_index}))
+        lines.extend(json.dumps({"op": "editor", "file": file_path, "text": message_text}) for file_path, message_text in self.edited_messages.items())
+        return lines
+
+    def compact_journal(self):
+        if not self.journal_active():
+            return
+        try:
+            self.journal.compact(self.journal_snapshot())
+        except OSError as e:
+            # The journal keeps growing but is still complete; warn once rather than on every tick
+            if not self.journal_compact_warned:
+                self.journal_compact_warned = True
+                messagebox.showwarning("Autosave", f"Could not compact the autosave journal, it will keep growing: {e}")
+
+    def journal_compact_tick(self):
+        if self.journal_active() and self.journal.appended >= JOURNAL_COMPACT_RECORDS:
+            self.compact_journal()
+        self.root.after(JOURNAL_COMPACT_INTERVAL, self.journal_compact_tick)
+
     def editor_save_files(self):
         out_dir = filedialog.askdirectory(
             title="Select Save Directory",
@@ -471,6 +1130,7 @@ For further assistance, contact the application support team or refer to the **H
                 with open(os.path.join(out_dir, file_name), 'w') as f:
                     f.write(edited_message)
                 total_messages += 1
+        self.journal_append({"op": "saved"})
         messagebox.showinfo("Save Complete", f"Saved {total_messages} edited messages to {out_dir}")
 
     def save_and_exit(self):
@@ -479,25 +1139,33 @@ For further assistance, contact the application support team or refer to the **H
 
     def quit(self):
         if messagebox.askyesno("Confirm Quit", "Unsaved changes will be lost. Quit?"):
+            if self.journal is not None:
+                self.journal.close()
+            if self.journal_lock is not None:
+                if os.path.exists(JOURNAL_PATH):
+                    os.remove(JOURNAL_PATH)
+                self.journal_lock.close()
             self.root.quit()
 
     ### Date/Time/DOB Methods
     def set_today_date(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            patient["base_vars"]["{YYYYMMDD}"].set(datetime.now().strftime("%Y%m%d"))
+            patient.base_values["{YYYYMMDD}"] = datetime.now().strftime("%Y%m%d")
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def adjust_date(self, days):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            date_str = patient["base_vars"]["{YYYYMMDD}"].get()
+            date_str = patient.base_values["{YYYYMMDD}"]
             if date_str == "{YYYYMMDD}" or not date_str:
                 return
             try:
                 date = datetime.strptime(date_str, "%Y%m%d")
                 new_date = date + timedelta(days=days)
-                patient["base_vars"]["{YYYYMMDD}"].set(new_date.strftime("%Y%m%d"))
+                patient.base_values["{YYYYMMDD}"] = new_date.strftime("%Y%m%d")
+                self.creator_refresh_fields()
                 self.creator_update_preview()
             except ValueError:
                 messagebox.showwarning("Invalid Input", "Date must be in YYYYMMDD format.")
@@ -505,21 +1173,23 @@ For further assistance, contact the application support team or refer to the **H
     def set_now_time(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            patient["base_vars"]["{scheduledTime}"].set(datetime.now().strftime("%H%M%S"))
+            patient.base_values["{scheduledTime}"] = datetime.now().strftime("%H%M%S")
+            self.creator_refresh_fields()
             self.update_time_button_states()
             self.creator_update_preview()
 
     def adjust_time(self, hours):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            time_str = patient["base_vars"]["{scheduledTime}"].get()
+            time_str = patient.base_values["{scheduledTime}"]
             if time_str == "{scheduledTime}" or not time_str:
                 return
             try:
                 time = datetime.strptime(time_str, "%H%M%S")
                 new_time = time + timedelta(hours=hours)
                 if 0 <= new_time.hour <= 23:
-                    patient["base_vars"]["{scheduledTime}"].set(new_time.strftime("%H%M%S"))
+                    patient.base_values["{scheduledTime}"] = new_time.strftime("%H%M%S")
+                    self.creator_refresh_fields()
                     self.update_time_button_states()
                     self.creator_update_preview()
                 else:
@@ -529,7 +1199,7 @@ For further assistance, contact the application support team or refer to the **H
 
     def update_time_button_states(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            time_str = self.patients[self.current_patient_index]["base_vars"]["{scheduledTime}"].get()
+            time_str = self.patients[self.current_patient_index].base_values["{scheduledTime}"]
             if time_str == "{scheduledTime}" or not time_str:
                 self.time_minus_button.config(state="normal", fg=TEXT_COLOR)
                 self.time_plus_button.config(state="normal", fg=TEXT_COLOR)
@@ -548,7 +1218,8 @@ For further assistance, contact the application support team or refer to the **H
             end_date = datetime(2025, 12, 31)
             days = (end_date - start_date).days
             random_date = start_date + timedelta(days=random.randint(0, days))
-            self.patients[self.current_patient_index]["base_vars"]["{patientDOB}"].set(random_date.strftime("%Y%m%d"))
+            self.patients[self.current_patient_index].base_values["{patientDOB}"] = random_date.strftime("%Y%m%d")
+            self.creator_refresh_fields()
             self.update_dob_age()
             self.creator_update_preview()
 
@@ -564,7 +1235,8 @@ For further assistance, contact the application support team or refer to the **H
                 month = random.randint(1, 12)
                 day = random.randint(1, 28)  # Safe for all months
                 dob = datetime(birth_year, month, day)
-                self.patients[self.current_patient_index]["base_vars"]["{patientDOB}"].set(dob.strftime("%Y%m%d"))
+                self.patients[self.current_patient_index].base_values["{patientDOB}"] = dob.strftime("%Y%m%d")
+                self.creator_refresh_fields()
                 self.update_dob_age()
                 self.creator_update_preview()
             except ValueError:
@@ -572,7 +1244,7 @@ For further assistance, contact the application support team or refer to the **H
 
     def update_dob_age(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            dob_str = self.patients[self.current_patient_index]["base_vars"]["{patientDOB}"].get()
+            dob_str = self.patients[self.current_patient_index].base_values["{patientDOB}"]
             if dob_str == "{patientDOB}" or not dob_str:
                 self.dob_age_var.set("")
                 return
@@ -630,11 +1302,15 @@ For further assistance, contact the application support team or refer to the **H
         # Message type radio buttons frame
         message_type_frame = tk.Frame(self.creator_button_frame_top, bg=BG_COLOR)
         message_type_frame.pack(side=tk.RIGHT)
-        dummy_var = tk.StringVar(value="Scheduled & Case Events")  # Default
+        # Widget variables show the current patient only; creator_load_patient points them at its record
+        self.creator_bindings = {}
+        self.creator_loading = False
+        self.message_type_var = tk.StringVar(value="Scheduled & Case Events")  # Default
+        self.message_type_var.trace_add("write", self.creator_message_type_written)
         options = ["Scheduled", "Scheduled & Case Events", "Scheduled & Canceled"]
         for option in options:
             rb = tk.Radiobutton(
-                message_type_frame, text=option, variable=dummy_var, value=option,
+                message_type_frame, text=option, variable=self.message_type_var, value=option,
                 bg=BG_COLOR, fg=TEXT_COLOR, selectcolor=PREVIEW_BG, font=DEFAULT_FONT
             )
             rb.pack(side=tk.LEFT, padx=5)
@@ -643,6 +1319,7 @@ For further assistance, contact the application support team or refer to the **H
         self.base_prompts_frame = tk.Frame(self.creator_content_frame, bg=BG_COLOR)
         self.base_prompts_frame.pack(fill=tk.X, pady=5)
         self.base_entries = {}
+        self.base_vars = {}
         self.staff_entries = {}
         self.additional_staff = []
         self.additional_surgeons = []
@@ -810,36 +1487,38 @@ For further assistance, contact the application support team or refer to the **H
     def apply_procedure_selection(self, proc_name, proc_id, proc_desc, proc_needs, proc_cpt, proc_specialty):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            if not patient["base_vars"]["{procedure}"].get() and not patient["procedures"]:
-                patient["base_vars"]["{procedure}"].set(proc_name)
-                patient["base_vars"]["{procedureId}"].set(proc_id)
-                patient["base_vars"]["{procedureDescription}"].set(proc_desc)
-                patient["base_vars"]["{specialNeeds}"].set(proc_needs)
-                patient["base_vars"]["{cptCode}"].set(proc_cpt)
-                patient['procedure_specialty'].set(proc_specialty)
+            if not patient.base_values["{procedure}"] and not patient.procedures:
+                patient.base_values["{procedure}"] = proc_name
+                patient.base_values["{procedureId}"] = proc_id
+                patient.base_values["{procedureDescription}"] = proc_desc
+                patient.base_values["{specialNeeds}"] = proc_needs
+                patient.base_values["{cptCode}"] = proc_cpt
+                patient.procedure_specialty = proc_specialty
             else:
                 new_proc = {
-                    "{procedure}": tk.StringVar(value=proc_name),
-                    "{procedureId}": tk.StringVar(value=proc_id),
-                    "{procedureDescription}": tk.StringVar(value=proc_desc),
-                    "{specialNeeds}": tk.StringVar(value=proc_needs),
+                    "{procedure}": proc_name,
+                    "{procedureId}": proc_id,
+                    "{procedureDescription}": proc_desc,
+                    "{specialNeeds}": proc_needs,
                 }
-                patient["procedures"].append(new_proc)
+                patient.procedures.append(new_proc)
                 self.add_procedure_fields(new_proc)
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def choose_random_procedure(self):
         if 0 <= self.current_patient_index < len(self.patients):
             proc = self.procedures.sample(1).iloc[0]
             patient = self.patients[self.current_patient_index]
-            if patient["procedures"]:
-                last_proc = patient["procedures"][-1]
+            if patient.procedures:
+                last_proc = patient.procedures[-1]
                 for key, value in zip(["{procedure}", "{procedureId}", "{procedureDescription}", "{specialNeeds}"], [proc["name"], proc["id"], proc["description"], proc["special_needs"]]):
-                    last_proc[key].set(value)
+                    last_proc[key] = value
             else:
-                for key, value in zip(["{procedure}", "{procedureId}", "{procedureDescription}", "{specialNeeds}", "{cptCode}"], [proc["name"], proc["id"], proc["description"], proc["special_needs"], proc["cpt"]]):
-                    patient["base_vars"][key].set(value)
-                patient['procedure_specialty'].set(proc["specialty"])
+                for key, value in zip(["{procedure}", "{procedureId}", "{procedureDescription}", "{specialNeeds}", "{cptCode}"], [proc["name"], proc["id"], proc["description"], proc["special_needs"], str(proc["cpt"])]):
+                    patient.base_values[key] = value
+                patient.procedure_specialty = proc["specialty"]
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def toggle_procedure_browser(self):
@@ -893,12 +1572,15 @@ For further assistance, contact the application support team or refer to the **H
     def setup_base_prompts(self):
         self.encounter_radios = []
         self.environment_radios = []
-        dummy_var = tk.StringVar()  # Temporary variable for radio buttons before patient is loaded
-        dummy_env_var = tk.StringVar(value="US Demo")  # Temporary variable for environment radio buttons
+        self.environment_var = tk.StringVar(value=self.default_environment)
+        self.environment_var.trace_add("write", self.creator_environment_written)
         for prompt in base_prompts:
             frame = tk.Frame(self.base_prompts_frame, bg=BG_COLOR)
             frame.pack(fill=tk.X, pady=2)
             tk.Label(frame, text=prompt['prompt'], fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=5)
+            if prompt['key'] != "{environment}":
+                var = self.creator_var()
+                self.base_vars[prompt['key']] = var
             if prompt['key'] == "{encounterType}":
                 radio_frame = tk.Frame(frame, bg=BG_COLOR)
                 radio_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
@@ -912,7 +1594,7 @@ For further assistance, contact the application support team or refer to the **H
                 }
                 for option, code in encounter_options.items():
                     rb = tk.Radiobutton(
-                        radio_frame, text=option, variable=dummy_var, value=code,
+                        radio_frame, text=option, variable=var, value=code,
                         bg=BG_COLOR, fg=TEXT_COLOR, selectcolor=PREVIEW_BG, font=DEFAULT_FONT
                     )
                     rb.pack(side=tk.LEFT, padx=5)
@@ -920,10 +1602,9 @@ For further assistance, contact the application support team or refer to the **H
             elif prompt['key'] == "{environment}":
                 radio_frame = tk.Frame(frame, bg=BG_COLOR)
                 radio_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
-                environment_options = ["US Demo", "UCH"]
-                for option in environment_options:
+                for option in self.environment_tables:
                     rb = tk.Radiobutton(
-                        radio_frame, text=option, variable=dummy_env_var, value=option,
+                        radio_frame, text=option, variable=self.environment_var, value=option,
                         bg=BG_COLOR, fg=TEXT_COLOR, selectcolor=PREVIEW_BG, font=DEFAULT_FONT
                     )
                     rb.pack(side=tk.LEFT, padx=5)
@@ -932,7 +1613,7 @@ For further assistance, contact the application support team or refer to the **H
                 # Add suggestions label
                 suggestions_label = tk.Label(frame, text="(1, 2, 3, 4, 5, 6)", fg="#888888", bg=BG_COLOR, font=("Courier New", 8))
                 suggestions_label.pack(side=tk.LEFT, padx=5)
-                entry = UppercaseEntry(frame, base_width=10, min_width=5, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+                entry = UppercaseEntry(frame, base_width=10, min_width=5, textvariable=var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
                 entry.pack(side=tk.LEFT, padx=5)
                 self.base_entries[prompt['key']] = entry
                 self.entry_widgets.append(entry)
@@ -940,12 +1621,12 @@ For further assistance, contact the application support team or refer to the **H
                 # Add suggestions label
                 suggestions_label = tk.Label(frame, text="(General, MAC, Regional, Local, Spinal, Epidural)", fg="#888888", bg=BG_COLOR, font=("Courier New", 8))
                 suggestions_label.pack(side=tk.LEFT, padx=5)
-                entry = UppercaseEntry(frame, base_width=20, min_width=10, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+                entry = UppercaseEntry(frame, base_width=20, min_width=10, textvariable=var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
                 entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
                 self.base_entries[prompt['key']] = entry
                 self.entry_widgets.append(entry)
             elif prompt['key'] == "{isolations}":
-                entry = UppercaseEntry(frame, base_width=30, min_width=20, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+                entry = UppercaseEntry(frame, base_width=30, min_width=20, textvariable=var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
                 entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
                 self.base_entries[prompt['key']] = entry
                 self.entry_widgets.append(entry)
@@ -957,18 +1638,14 @@ For further assistance, contact the application support team or refer to the **H
                 radio_frame = tk.Frame(frame, bg=BG_COLOR)
                 radio_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
                 laterality_options = [("L", "L"), ("R", "R"), ("B", "B"), ("N/A", "N/A")]
-                # Create a dummy variable that will be replaced when patient is loaded
-                dummy_var = tk.StringVar(value="N/A")
                 for option_text, option_value in laterality_options:
                     rb = tk.Radiobutton(
-                        radio_frame, text=option_text, variable=dummy_var, value=option_value,
+                        radio_frame, text=option_text, variable=var, value=option_value,
                         bg=BG_COLOR, fg=TEXT_COLOR, selectcolor=PREVIEW_BG, font=DEFAULT_FONT
                     )
                     rb.pack(side=tk.LEFT, padx=5)
-                # Store the radio frame for later binding to the actual patient variable
-                self.base_entries[prompt['key']] = {'radio_frame': radio_frame, 'dummy_var': dummy_var}
             else:
-                entry = UppercaseEntry(frame, base_width=20, min_width=10, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+                entry = UppercaseEntry(frame, base_width=20, min_width=10, textvariable=var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
                 entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
                 self.base_entries[prompt['key']] = entry
                 self.entry_widgets.append(entry)
@@ -1010,31 +1687,20 @@ For further assistance, contact the application support team or refer to the **H
 
         self.staff_group_frame = tk.Frame(self.base_prompts_frame, bg=BG_COLOR)
         self.staff_group_frame.pack(fill=tk.X, pady=10)
-        self.fixed_roles = [
-            {"role": "Primary Surgeon", "code": "1.1^Primary", "last_key": "{primaryLastName}", "first_key": "{primaryFirstName}"},
-            {"role": "Circulator", "code": "4.20^Circulator", "last_key": "{lastName}", "first_key": "{firstName}"},
-            {"role": "Scrub", "code": "4.150^Scrub", "last_key": "{lastName}", "first_key": "{firstName}"},
-            {"role": "CRNA", "code": "2.20^ANE CRNA", "last_key": "{lastName}", "first_key": "{firstName}"},
-            {"role": "Anesthesiologist", "code": "2.139^Anesthesiologist", "last_key": "{lastName}", "first_key": "{firstName}"},
-        ]
+        self.fixed_roles = fixed_roles
         for i, role_info in enumerate(self.fixed_roles):
             row_frame = tk.Frame(self.staff_group_frame, bg=BG_COLOR)
             row_frame.grid(row=i, column=0, sticky="w", pady=2)
             tk.Label(row_frame, text=f"{role_info['role']}:", fg=TEXT_COLOR, bg=BG_COLOR, width=15, anchor="w", font=DEFAULT_FONT).pack(side=tk.LEFT, padx=5)
             tk.Label(row_frame, text="Last:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-            last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+            last_var = self.creator_var()
+            first_var = self.creator_var()
+            last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=last_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
             last_entry.pack(side=tk.LEFT, padx=2)
             tk.Label(row_frame, text="First:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-            first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+            first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=first_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
             first_entry.pack(side=tk.LEFT, padx=2)
-            last_var = tk.StringVar()
-            first_var = tk.StringVar()
-            id_var = tk.StringVar(value="{surgeonID}" if role_info["role"] == "Primary Surgeon" else "{staffID}")
-            last_entry.config(textvariable=last_var)
-            first_entry.config(textvariable=first_var)
-            last_var.trace_add("write", lambda *args: self.creator_update_preview())
-            first_var.trace_add("write", lambda *args: self.creator_update_preview())
-            self.staff_entries[role_info["role"]] = {"lastName": last_var, "firstName": first_var, "id": id_var}
+            self.staff_entries[role_info["role"]] = {"lastName": last_var, "firstName": first_var}
             self.entry_widgets.append(last_entry)
             self.entry_widgets.append(first_entry)
 
@@ -1042,29 +1708,31 @@ For further assistance, contact the application support team or refer to the **H
         if 0 <= self.current_patient_index < len(self.patients):
             name = self.patient_names.sample(1).iloc[0]
             patient = self.patients[self.current_patient_index]
-            patient["base_vars"]["{patientFirstName}"].set(name["First Name"])
-            patient["base_vars"]["{patientLastName}"].set(name["Last Name"])
+            patient.base_values["{patientFirstName}"] = name["First Name"]
+            patient.base_values["{patientLastName}"] = name["Last Name"]
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def random_surgeon(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
             surgeon = self.surgeon_names.sample(1).iloc[0]
-            self.staff_entries["Primary Surgeon"]["firstName"].set(surgeon["First Name"])
-            self.staff_entries["Primary Surgeon"]["lastName"].set(surgeon["Last Name"])
-            self.staff_entries["Primary Surgeon"]["id"].set(str(surgeon["ID"]))
-            for additional_surgeon in patient['additional_surgeons']:
+            patient.fixed_staff["Primary Surgeon"]["firstName"] = surgeon["First Name"]
+            patient.fixed_staff["Primary Surgeon"]["lastName"] = surgeon["Last Name"]
+            patient.fixed_staff["Primary Surgeon"]["id"] = str(surgeon["ID"])
+            for additional_surgeon in patient.additional_surgeons:
                 additional_surgeon_surgeon = self.surgeon_names.sample(1).iloc[0]
-                additional_surgeon["firstName"].set(additional_surgeon_surgeon["First Name"])
-                additional_surgeon["lastName"].set(additional_surgeon_surgeon["Last Name"])
-                additional_surgeon["id"].set(str(additional_surgeon_surgeon["ID"]))
+                additional_surgeon["firstName"] = additional_surgeon_surgeon["First Name"]
+                additional_surgeon["lastName"] = additional_surgeon_surgeon["Last Name"]
+                additional_surgeon["id"] = str(additional_surgeon_surgeon["ID"])
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def random_staff(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
             num_fixed_roles = 4  # Circulator, Scrub, CRNA, Anesthesiologist
-            num_additional_staff = len(patient['staff_members'])
+            num_additional_staff = len(patient.staff_members)
             total_roles = num_fixed_roles + num_additional_staff
             if total_roles > len(self.staff_names):
                 messagebox.showwarning("Insufficient Staff", "Not enough unique staff members for all roles. Using duplicates.")
@@ -1073,59 +1741,59 @@ For further assistance, contact the application support team or refer to the **H
                 unique_staff = self.staff_names.sample(total_roles, replace=False)
             for i, role in enumerate(["Circulator", "Scrub", "CRNA", "Anesthesiologist"]):
                 staff = unique_staff.iloc[i]
-                self.staff_entries[role]["firstName"].set(staff["First Name"])
-                self.staff_entries[role]["lastName"].set(staff["Last Name"])
-                self.staff_entries[role]["id"].set(str(staff["ID"]))
-            for j, staff_member in enumerate(patient['staff_members']):
+                patient.fixed_staff[role]["firstName"] = staff["First Name"]
+                patient.fixed_staff[role]["lastName"] = staff["Last Name"]
+                patient.fixed_staff[role]["id"] = str(staff["ID"])
+            for j, staff_member in enumerate(patient.staff_members):
                 staff = unique_staff.iloc[num_fixed_roles + j]
-                staff_member["firstName"].set(staff["First Name"])
-                staff_member["lastName"].set(staff["Last Name"])
-                staff_member["id"].set(str(staff["ID"]))
+                staff_member["firstName"] = staff["First Name"]
+                staff_member["lastName"] = staff["Last Name"]
+                staff_member["id"] = str(staff["ID"])
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def add_surgeon(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            surgeon = {"role": tk.StringVar(value="Assistant Surgeon"), "lastName": tk.StringVar(value=""), "firstName": tk.StringVar(value=""), "id": tk.StringVar(value="{staffID}")}
-            self.patients[self.current_patient_index]['additional_surgeons'].append(surgeon)
+            surgeon = new_staff_entry("Assistant Surgeon")
+            self.patients[self.current_patient_index].additional_surgeons.append(surgeon)
             self.add_surgeon_fields(surgeon)
+            self.journal_patient()
 
     def remove_last_surgeon(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            if patient['additional_surgeons']:
-                patient['additional_surgeons'].pop()
+            if patient.additional_surgeons:
+                patient.additional_surgeons.pop()
                 self.additional_surgeons[-1]['frame'].destroy()
                 self.additional_surgeons.pop()
+                self.journal_patient()
             else:
-                self.staff_entries["Primary Surgeon"]["lastName"].set("")
-                self.staff_entries["Primary Surgeon"]["firstName"].set("")
-                self.staff_entries["Primary Surgeon"]["id"].set("{surgeonID}")
+                patient.fixed_staff["Primary Surgeon"].update(lastName="", firstName="", id="{surgeonID}")
+                self.creator_refresh_fields()
             self.creator_update_preview()
 
     def add_staff_member(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            staff = {"role": tk.StringVar(value="Staff"), "lastName": tk.StringVar(value=""), "firstName": tk.StringVar(value=""), "id": tk.StringVar(value="{staffID}")}
-            self.patients[self.current_patient_index]['staff_members'].append(staff)
+            staff = new_staff_entry("Staff")
+            self.patients[self.current_patient_index].staff_members.append(staff)
             self.add_staff_fields(staff)
+            self.journal_patient()
 
     def remove_last_staff_member(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            if patient['staff_members']:
-                patient['staff_members'].pop()
+            if patient.staff_members:
+                patient.staff_members.pop()
                 self.additional_staff[-1]['frame'].destroy()
                 self.additional_staff.pop()
+                self.journal_patient()
             else:
-                for role in ["Circulator", "Scrub", "CRNA", "Anesthesiologist"]:
-                    if self.staff_entries[role]["lastName"].get() or self.staff_entries[role]["firstName"].get():
-                        self.staff_entries[role]["lastName"].set("")
-                        self.staff_entries[role]["firstName"].set("")
-                        self.staff_entries[role]["id"].set("{staffID}")
-                        return
-                if self.staff_entries["Primary Surgeon"]["lastName"].get() or self.staff_entries["Primary Surgeon"]["firstName"].get():
-                    self.staff_entries["Primary Surgeon"]["lastName"].set("")
-                    self.staff_entries["Primary Surgeon"]["firstName"].set("")
-                    self.staff_entries["Primary Surgeon"]["id"].set("{surgeonID}")
+                for role in ["Circulator", "Scrub", "CRNA", "Anesthesiologist", "Primary Surgeon"]:
+                    staff = patient.fixed_staff[role]
+                    if staff["lastName"] or staff["firstName"]:
+                        staff.update(lastName="", firstName="", id="{surgeonID}" if role == "Primary Surgeon" else "{staffID}")
+                        break
+                self.creator_refresh_fields()
             self.creator_update_preview()
 
     def random_patient_full(self):
@@ -1134,42 +1802,41 @@ For further assistance, contact the application support team or refer to the **H
             name = self.patient_names.sample(1).iloc[0]
             first_name = name["First Name"]
             last_name = name["Last Name"]
-            patient["base_vars"]["{patientFirstName}"].set(first_name)
-            patient["base_vars"]["{patientLastName}"].set(last_name)
+            patient.base_values["{patientFirstName}"] = first_name
+            patient.base_values["{patientLastName}"] = last_name
             gender = "F" if first_name.lower()[-1] in ['a', 'e', 'i'] else "M"
-            patient["base_vars"]["{patientGender}"].set(gender)
+            patient.base_values["{patientGender}"] = gender
             self.random_dob()
             self.last_mrn += 1
-            patient["base_vars"]["{patientMRN}"].set(str(self.last_mrn))
+            patient.base_values["{patientMRN}"] = str(self.last_mrn)
             duration = random.randint(60, 120)
-            patient["base_vars"]["{duration}"].set(str(duration))
+            patient.base_values["{duration}"] = str(duration)
             proc = self.procedures.sample(1).iloc[0]
-            patient["base_vars"]["{procedure}"].set(proc["name"])
-            patient["base_vars"]["{procedureId}"].set(proc["id"])
-            patient["base_vars"]["{procedureDescription}"].set(proc["description"])
-            patient["base_vars"]["{specialNeeds}"].set(proc["special_needs"])
-            patient["base_vars"]["{cptCode}"].set(proc["cpt"])
-            patient['procedure_specialty'].set(proc["specialty"])
+            patient.base_values["{procedure}"] = proc["name"]
+            patient.base_values["{procedureId}"] = proc["id"]
+            patient.base_values["{procedureDescription}"] = proc["description"]
+            patient.base_values["{specialNeeds}"] = proc["special_needs"]
+            patient.base_values["{cptCode}"] = str(proc["cpt"])
+            patient.procedure_specialty = proc["specialty"]
             surgeon = self.surgeon_names.sample(1).iloc[0]
-            self.staff_entries["Primary Surgeon"]["firstName"].set(surgeon["First Name"])
-            self.staff_entries["Primary Surgeon"]["lastName"].set(surgeon["Last Name"])
-            self.staff_entries["Primary Surgeon"]["id"].set(str(surgeon["ID"]))
+            patient.fixed_staff["Primary Surgeon"]["firstName"] = surgeon["First Name"]
+            patient.fixed_staff["Primary Surgeon"]["lastName"] = surgeon["Last Name"]
+            patient.fixed_staff["Primary Surgeon"]["id"] = str(surgeon["ID"])
             self.random_staff()  # Call to assign unique staff
-            patient["base_vars"]["{YYYYMMDD}"].set(datetime.now().strftime("%Y%m%d"))
-            patient["base_vars"]["{scheduledTime}"].set(datetime.now().strftime("%H%M%S"))
+            patient.base_values["{YYYYMMDD}"] = datetime.now().strftime("%Y%m%d")
+            patient.base_values["{scheduledTime}"] = datetime.now().strftime("%H%M%S")
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def clear_all(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            for var in patient['base_vars'].values():
-                var.set("")
-            patient['base_vars']['{encounterType}'].set("IP")  # Reset to default
-            patient['message_type'].set("Scheduled & Case Events")  # Reset to default
-            for role in self.staff_entries:
-                self.staff_entries[role]["lastName"].set("")
-                self.staff_entries[role]["firstName"].set("")
-                self.staff_entries[role]["id"].set("{surgeonID}" if role == "Primary Surgeon" else "{staffID}")
+            for key in patient.base_values:
+                patient.base_values[key] = ""
+            patient.base_values['{encounterType}'] = "IP"  # Reset to default
+            patient.message_type = "Scheduled & Case Events"  # Reset to default
+            for role, staff in patient.fixed_staff.items():
+                staff.update(lastName="", firstName="", id="{surgeonID}" if role == "Primary Surgeon" else "{staffID}")
             for item in self.additional_staff + self.additional_surgeons:
                 item['frame'].destroy()
             self.additional_staff = []
@@ -1177,10 +1844,11 @@ For further assistance, contact the application support team or refer to the **H
             for frame in self.procedure_frames:
                 frame.destroy()
             self.procedure_frames = []
-            patient['procedures'] = []
-            patient['staff_members'] = []
-            patient['additional_surgeons'] = []
-            patient['allergies'] = []
+            patient.procedures = []
+            patient.staff_members = []
+            patient.additional_surgeons = []
+            patient.allergies = []
+            self.creator_refresh_fields()
             self.update_allergies_display()
             self.creator_update_preview()
 
@@ -1188,17 +1856,16 @@ For further assistance, contact the application support team or refer to the **H
         row = len(self.staff_entries) + len(self.additional_staff)
         row_frame = tk.Frame(self.staff_group_frame, bg=BG_COLOR)
         row_frame.grid(row=row, column=0, sticky="w", pady=2)
-        role_entry = UppercaseEntry(row_frame, base_width=15, min_width=10, textvariable=staff["role"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        role_var, last_var, first_var = (self.bind_creator_var(self.creator_var(), staff, key) for key in ("role", "lastName", "firstName"))
+        role_entry = UppercaseEntry(row_frame, base_width=15, min_width=10, textvariable=role_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         role_entry.pack(side=tk.LEFT, padx=5)
         tk.Label(row_frame, text=":", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT)
         tk.Label(row_frame, text="Last:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-        last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=staff["lastName"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=last_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         last_entry.pack(side=tk.LEFT, padx=2)
         tk.Label(row_frame, text="First:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-        first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=staff["firstName"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=first_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         first_entry.pack(side=tk.LEFT, padx=2)
-        for var in [staff["role"], staff["lastName"], staff["firstName"]]:
-            var.trace_add("write", lambda *args: self.creator_update_preview())
         self.additional_staff.append({"frame": row_frame, "vars": staff})
         self.entry_widgets.extend([role_entry, last_entry, first_entry])
 
@@ -1206,17 +1873,16 @@ For further assistance, contact the application support team or refer to the **H
         row = len(self.staff_entries) + len(self.additional_surgeons)
         row_frame = tk.Frame(self.staff_group_frame, bg=BG_COLOR)
         row_frame.grid(row=row, column=0, sticky="w", pady=2)
-        role_entry = UppercaseEntry(row_frame, base_width=15, min_width=10, textvariable=surgeon["role"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        role_var, last_var, first_var = (self.bind_creator_var(self.creator_var(), surgeon, key) for key in ("role", "lastName", "firstName"))
+        role_entry = UppercaseEntry(row_frame, base_width=15, min_width=10, textvariable=role_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         role_entry.pack(side=tk.LEFT, padx=5)
         tk.Label(row_frame, text=":", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT)
         tk.Label(row_frame, text="Last:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-        last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=surgeon["lastName"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=last_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         last_entry.pack(side=tk.LEFT, padx=2)
         tk.Label(row_frame, text="First:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-        first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=surgeon["firstName"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=first_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         first_entry.pack(side=tk.LEFT, padx=2)
-        for var in [surgeon["role"], surgeon["lastName"], surgeon["firstName"]]:
-            var.trace_add("write", lambda *args: self.creator_update_preview())
         self.additional_surgeons.append({"frame": row_frame, "vars": surgeon})
         self.entry_widgets.extend([role_entry, last_entry, first_entry])
 
@@ -1231,103 +1897,127 @@ For further assistance, contact the application support team or refer to the **H
         if self.mode != "Creator":
             messagebox.showwarning("Invalid Mode", "New Patient is only available in Creator mode.")
             return
-        patient = {
-            'base_vars': {p['key']: tk.StringVar(value='IP' if p['key'] == '{encounterType}' else 'N/A' if p['key'] == '{laterality}' else '') for p in base_prompts},
-            'procedures': [],
-            'staff_members': [],
-            'additional_surgeons': [],
-            'allergies': [],
-            'messages': [],
-            'procedure_specialty': tk.StringVar(value="GEN"),
-            'message_type': tk.StringVar(value="Scheduled & Case Events"),  # Default message type
-            'environment': tk.StringVar(value="US Demo")  # Environment: US Demo or UCH
-        }
-        self.patients.append(patient)
+        self.patients.append(PatientRecord(self.default_environment))
         self.current_patient_index = len(self.patients) - 1
+        self.journal_patient()
         self.creator_load_patient()
 
-    def creator_load_patient(self):
+    def creator_var(self):
+        var = tk.StringVar()
+        var.trace_add("write", self.creator_var_written)
+        return var
+
+    def bind_creator_var(self, var, store, key):
+        # Point a widget variable at one field of the current patient's record
+        self.creator_bindings.pop(str(var), None)
+        var.set(store[key])
+        self.creator_bindings[str(var)] = (var, store, key)
+        return var
+
+    def creator_var_written(self, name, *args):
+        binding = self.creator_bindings.get(name)
+        if binding is not None:
+            var, store, key = binding
+            store[key] = var.get()
+            if not self.creator_loading:
+                self.journal_field(store, key)
+                self.creator_update_preview()
+
+    def creator_message_type_written(self, *args):
+        if 0 <= self.current_patient_index < len(self.patients):
+            self.patients[self.current_patient_index].message_type = self.message_type_var.get()
+            if not self.creator_loading:
+                self.journal_append({"op": "set", "i": self.current_patient_index, "path": ["message_type"], "value": self.message_type_var.get()})
+                self.creator_update_preview()
+
+    def creator_environment_written(self, *args):
+        if 0 <= self.current_patient_index < len(self.patients):
+            self.patients[self.current_patient_index].environment = self.environment_var.get()
+            if not self.creator_loading:
+                self.journal_append({"op": "set", "i": self.current_patient_index, "path": ["environment"], "value": self.environment_var.get()})
+                self.creator_update_preview()
+
+    def creator_refresh_fields(self):
+        # Show record values that were changed in code rather than typed
         patient = self.patients[self.current_patient_index]
+        self.creator_loading = True
+        for var, store, key in self.creator_bindings.values():
+            if var.get() != store[key]:
+                var.set(store[key])
+        self.message_type_var.set(patient.message_type)
+        self.environment_var.set(patient.environment)
+        self.creator_loading = False
+        self.journal_patient()
+
+    def creator_load_records(self, indexes):
+        """Decode restored session records before they are used. One that cannot be read is
+        replaced with an empty patient, with a warning naming it."""
+        damaged = []
+        for index in indexes:
+            patient = self.patients[index]
+            if patient.session_line is None:
+                continue
+            try:
+                patient.load_session_line(patient.session_line)
+            except (ValueError, KeyError, TypeError) as e:
+                self.patients[index] = PatientRecord(self.default_environment)
+                self.journal_patient(index)
+                damaged.append(f"Patient {index + 1}: {e!r}")
+        if damaged:
+            messagebox.showwarning("Damaged Session Records", "These patients could not be read from the session file "
+                                   "and were replaced with empty patients:\n\n" + "\n".join(damaged[:20]))
 
-        # Backward compatibility: add missing fields for old patient objects
-        if 'environment' not in patient:
-            patient['environment'] = tk.StringVar(value="US Demo")
-
-        if 'allergies' not in patient:
-            patient['allergies'] = []
-
-        new_fields = ['{asaScore}', '{anesthesiaType}', '{isolations}', '{laterality}']
-        for field in new_fields:
-            if field not in patient['base_vars']:
-                default_value = 'N/A' if field == '{laterality}' else ''
-                patient['base_vars'][field] = tk.StringVar(value=default_value)
-
-        for rb in self.encounter_radios:
-            rb.config(variable=patient['base_vars']['{encounterType}'])
-        for rb in self.environment_radios:
-            rb.config(variable=patient['environment'])
-        for rb in self.message_type_radios:
-            rb.config(variable=patient['message_type'])
-
-        # Add trace for environment changes
-        patient['environment'].trace_add("write", lambda *args: self.creator_update_preview())
-
-        for key, entry in self.base_entries.items():
-            var = patient['base_vars'][key]
-            # Handle special case for laterality radio buttons
-            if isinstance(entry, dict) and 'radio_frame' in entry:
-                # Update all radio buttons in the frame to use the patient's variable
-                for widget in entry['radio_frame'].winfo_children():
-                    if isinstance(widget, tk.Radiobutton):
-                        widget.config(variable=var)
-            else:
-                entry.config(textvariable=var)
-            if var.trace_info():
-                var.trace_remove("write", var.trace_info()[0][1])
-            var.trace_add("write", lambda *args: self.creator_update_preview())
-        patient['message_type'].trace_add("write", lambda *args: self.creator_update_preview())
-        for role in self.staff_entries:
-            self.staff_entries[role]["lastName"].set("")
-            self.staff_entries[role]["firstName"].set("")
-            self.staff_entries[role]["id"].set("{surgeonID}" if role == "Primary Surgeon" else "{staffID}")
+    def creator_load_patient(self):
+        self.creator_load_records([self.current_patient_index])
+        patient = self.patients[self.current_patient_index]
+        self.creator_loading = True
+        self.creator_bindings = {}
+        for key, var in self.base_vars.items():
+            self.bind_creator_var(var, patient.base_values, key)
+        for role, entries in self.staff_entries.items():
+            for key, var in entries.items():
+                self.bind_creator_var(var, patient.fixed_staff[role], key)
+        self.message_type_var.set(patient.message_type)
+        self.environment_var.set(patient.environment)
         for item in self.additional_staff + self.additional_surgeons:
             item['frame'].destroy()
         self.additional_staff = []
         self.additional_surgeons = []
-        for staff in patient['staff_members']:
+        for staff in patient.staff_members:
             self.add_staff_fields(staff)
-        for surgeon in patient['additional_surgeons']:
+        for surgeon in patient.additional_surgeons:
             self.add_surgeon_fields(surgeon)
         for widget in self.procedures_frame.winfo_children():
             widget.destroy()
         self.procedure_frames = []
-        for proc in patient['procedures']:
-            # Backward compatibility: add laterality to procedures if missing
-            if '{laterality}' not in proc:
-                proc['{laterality}'] = tk.StringVar(value='N/A')
+        for proc in patient.procedures:
             self.add_procedure_fields(proc)
+        self.creator_loading = False
         self.update_allergies_display()
         self.creator_update_preview()
         self.creator_update_button_states()
 
     def add_procedure(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            proc = {f['key']: tk.StringVar(value='N/A' if f['key'] == '{laterality}' else '') for f in procedure_fields}
-            self.patients[self.current_patient_index]['procedures'].append(proc)
+            proc = {f['key']: 'N/A' if f['key'] == '{laterality}' else '' for f in procedure_fields}
+            self.patients[self.current_patient_index].procedures.append(proc)
             self.add_procedure_fields(proc)
+            self.journal_patient()
             self.creator_update_preview()
 
     def remove_last_procedure(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            if patient['procedures']:
-                patient['procedures'].pop()
+            if patient.procedures:
+                patient.procedures.pop()
                 if self.procedure_frames:
                     self.procedure_frames[-1].destroy()
                     self.procedure_frames.pop()
+                self.journal_patient()
             else:
                 for key in ["{procedure}", "{procedureDescription}", "{specialNeeds}", "{procedureId}", "{cptCode}"]:
-                    patient['base_vars'][key].set("")
+                    patient.base_values[key] = ""
+                self.creator_refresh_fields()
             self.creator_update_preview()
 
     def add_procedure_fields(self, proc):
@@ -1338,6 +2028,7 @@ For further assistance, contact the application support team or refer to the **H
             subframe = tk.Frame(frame, bg=BG_COLOR)
             subframe.pack(fill=tk.X, pady=2)
             tk.Label(subframe, text=field['prompt'], fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=5)
+            var = self.bind_creator_var(self.creator_var(), proc, field['key'])
 
             # Handle laterality as radio buttons
             if field.get('type') == 'radio' and field['key'] == '{laterality}':
@@ -1346,15 +2037,13 @@ For further assistance, contact the application support team or refer to the **H
                 laterality_options = [("L", "L"), ("R", "R"), ("B", "B"), ("N/A", "N/A")]
                 for option_text, option_value in laterality_options:
                     rb = tk.Radiobutton(
-                        radio_frame, text=option_text, variable=proc[field['key']], value=option_value,
+                        radio_frame, text=option_text, variable=var, value=option_value,
                         bg=BG_COLOR, fg=TEXT_COLOR, selectcolor=PREVIEW_BG, font=DEFAULT_FONT
                     )
                     rb.pack(side=tk.LEFT, padx=5)
-                proc[field['key']].trace_add("write", lambda *args: self.creator_update_preview())
             else:
-                entry = UppercaseEntry(subframe, base_width=20, min_width=10, textvariable=proc[field['key']], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+                entry = UppercaseEntry(subframe, base_width=20, min_width=10, textvariable=var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
                 entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
-                proc[field['key']].trace_add("write", lambda *args: self.creator_update_preview())
                 self.entry_widgets.append(entry)
 
     def populate_allergy_tree(self, filter_text=""):
@@ -1376,7 +2065,8 @@ For further assistance, contact the application support team or refer to the **H
             values = self.allergy_tree.item(item, "values")
             if values:
                 allergy = {"allergyID": values[0], "allergyName": values[1], "allergyReaction": values[2], "allergySeverity": values[3]}
-                self.patients[self.current_patient_index]['allergies'].append(allergy)
+                self.patients[self.current_patient_index].allergies.append(allergy)
+                self.journal_patient()
                 self.update_allergies_display()
                 self.creator_update_preview()
 
@@ -1386,13 +2076,14 @@ For further assistance, contact the application support team or refer to the **H
             values = self.allergy_tree.item(item, "values")
             if values:
                 allergy = {"allergyID": values[0], "allergyName": values[1], "allergyReaction": values[2], "allergySeverity": values[3]}
-                self.patients[self.current_patient_index]['allergies'].append(allergy)
+                self.patients[self.current_patient_index].allergies.append(allergy)
+                self.journal_patient()
                 self.update_allergies_display()
                 self.creator_update_preview()
 
     def update_allergies_display(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            allergies = self.patients[self.current_patient_index]['allergies']
+            allergies = self.patients[self.current_patient_index].allergies
             if allergies:
                 display_text = ", ".join([allergy['allergyName'] for allergy in allergies])
             else:
@@ -1402,31 +2093,16 @@ For further assistance, contact the application support team or refer to the **H
     def creator_update_preview(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            template = self.build_template(patient)
-
-            # Add ASA Score OBX (both environments)
-            template = self.add_asa_obx_segment(template, patient)
-
-            # Add staff segments
-            template = self.add_staff_segment(template)
-
-            # Add laterality to AIS (environment-dependent)
-            template = self.add_laterality_to_ais(template, patient)
-
-            # Add anesthesia type (environment-dependent)
-            template = self.add_anesthesia_type(template, patient)
-
-            # Add isolations (environment-dependent)
-            template = self.add_isolations(template, patient)
-            message_type = patient['message_type'].get()
+            template = self.build_case_template(patient)
+            message_type = patient.message_type
             if message_type == "Scheduled & Case Events":
                 preview_template = template  # Full template with OBX for event messages
                 trigger_event = "S14"
             else:
                 preview_template = "\n".join(line for line in template.splitlines() if not line.startswith("OBX"))  # Without OBX
                 trigger_event = "S12" if message_type == "Scheduled" else "S15"
-            base_values = {k: v.get() for k, v in patient['base_vars'].items()}
-            base_values["{specialty}"] = patient['procedure_specialty'].get()
+            base_values = dict(patient.base_values)
+            base_values["{specialty}"] = patient.procedure_specialty
             preview_text = preview_template
             for key, val in base_values.items():
                 if val:
@@ -1435,8 +2111,8 @@ For further assistance, contact the application support team or refer to the **H
 
             # Add ADT message preview
             al1_segments = []
-            if patient['allergies']:
-                for i, allergy in enumerate(patient['allergies'], start=1):
+            if patient.allergies:
+                for i, allergy in enumerate(patient.allergies, start=1):
                     reaction = allergy['allergyReaction'] if allergy['allergyReaction'] else ""
                     severity = allergy['allergySeverity'] if allergy['allergySeverity'] else ""
                     al1_segment = f"AL1|{i}||{allergy['allergyID']}^{allergy['allergyName']}|{severity}|{reaction}|"
@@ -1453,245 +2129,98 @@ For further assistance, contact the application support team or refer to the **H
             self.creator_preview_text.delete(1.0, tk.END)
             self.creator_preview_text.insert(tk.END, preview_text)
 
-    def build_template(self, patient):
-        template = default_hl7
-        for i, proc in enumerate(patient['procedures'], start=2):
-            proc_values = {k: v.get() for k, v in proc.items() if v.get()}
-            template = self.add_procedure_segments(template, i, proc_values)
-        return template
-
-    def add_procedure_segments(self, template, proc_num, proc_values):
-        lines = template.splitlines()
-        start_idx = next(i for i, line in enumerate(lines) if line.startswith("AIS|1|"))
-        end_idx = next(i for i, line in enumerate(lines) if line.startswith("NTE|2|")) + 1
-        proc_block = lines[start_idx:end_idx]
-        new_block = []
-        nte_count = 2 * (proc_num - 1)
-        for line in proc_block:
-            if line.startswith("AIS|1|"):
-                new_line = line.replace("AIS|1|", f"AIS|{proc_num}|")
-            elif line.startswith("NTE|1|"):
-                nte_count += 1
-                new_line = line.replace("NTE|1|", f"NTE|{nte_count}|")
-            elif line.startswith("NTE|2|"):
-                nte_count += 1
-                new_line = line.replace("NTE|2|", f"NTE|{nte_count}|")
-            else:
-                new_line = line
-            for key, val in proc_values.items():
-                if val:
-                    new_line = new_line.replace(key, val)
-            new_block.append(new_line)
-        insert_idx = next(i for i, line in enumerate(lines) if line.startswith("NTE|2|")) + 1
-        lines[insert_idx:insert_idx] = new_block
-        return "\n".join(lines)
-
-    def add_staff_segment(self, template):
-        lines = template.splitlines()
-        lines = [line for line in lines if not line.startswith("AIP|")]
-        insert_idx = next(i for i, line in enumerate(lines) if line.startswith("AIL|")) + 1
+    # Transforms applied in order by build_case_template. Each stage takes the
+    # parsed segment list and the patient and edits the segments in place, so
+    # a case is split and joined once however many stages contribute to it.
+    case_stages = (
+        "add_procedure_segments",
+        "add_asa_obx_segment",
+        "add_staff_segment",
+        "add_environment_fields",
+    )
+
+    def build_case_template(self, patient):
+        segments = parse_segments(default_hl7)
+        for stage in self.case_stages:
+            getattr(self, stage)(segments, patient)
+        return serialize_segments(segments)
+
+    def add_procedure_segments(self, segments, patient):
+        for proc_num, proc in enumerate(patient.procedures, start=2):
+            proc_values = {k: v for k, v in proc.items() if v}
+            start_idx = next(i for i, fields in enumerate(segments) if fields[:2] == ["AIS", "1"])
+            end_idx = next(i for i, fields in enumerate(segments) if fields[:2] == ["NTE", "2"]) + 1
+            new_block = []
+            nte_count = 2 * (proc_num - 1)
+            for fields in segments[start_idx:end_idx]:
+                fields = list(fields)
+                if fields[0] == "AIS":
+                    fields[1] = str(proc_num)
+                elif fields[0] == "NTE":
+                    nte_count += 1
+                    fields[1] = str(nte_count)
+                for key, val in proc_values.items():
+                    fields = [field.replace(key, val) for field in fields]
+                new_block.append(fields)
+            segments[end_idx:end_idx] = new_block
+
+    def add_staff_segment(self, segments, patient):
+        segments[:] = [fields for fields in segments if fields[0] != "AIP"]
+        insert_idx = find_segment(segments, "AIL") + 1
         new_aip_lines = []
-        patient = self.patients[self.current_patient_index]
-        specialty = patient['procedure_specialty'].get() if patient['base_vars']['{procedure}'].get() else "GEN"
-        primary_last = self.staff_entries["Primary Surgeon"]["lastName"].get() or "{primaryLastName}"
-        primary_first = self.staff_entries["Primary Surgeon"]["firstName"].get() or "{primaryFirstName}"
-        surgeon_id = self.staff_entries["Primary Surgeon"]["id"].get() or "{surgeonID}"
+        staff_entries = patient.fixed_staff
+        specialty = patient.procedure_specialty if patient.base_values['{procedure}'] else "GEN"
+        primary_last = staff_entries["Primary Surgeon"]["lastName"] or "{primaryLastName}"
+        primary_first = staff_entries["Primary Surgeon"]["firstName"] or "{primaryFirstName}"
+        surgeon_id = staff_entries["Primary Surgeon"]["id"] or "{surgeonID}"
         aip_line = f"AIP|1||{surgeon_id}^{primary_last}^{primary_first}^W^^^^^EPIC^^^^PROVID|1.1^Primary Surgeon|{specialty}|{{YYYYMMDD}}{{scheduledTime}}|0|S|{{duration}}|S"
         new_aip_lines.append(aip_line)
-        for i, surgeon in enumerate(patient['additional_surgeons'], start=2):
-            last_name = surgeon["lastName"].get() or "{lastName}"
-            first_name = surgeon["firstName"].get() or "{firstName}"
-            staff_id = surgeon["id"].get() or "{staffID}"
+        for i, surgeon in enumerate(patient.additional_surgeons, start=2):
+            last_name = surgeon["lastName"] or "{lastName}"
+            first_name = surgeon["firstName"] or "{firstName}"
+            staff_id = surgeon["id"] or "{staffID}"
             role_code = f"1.{i}^Assistant Surgeon"
             aip_line = f"AIP|{i}||{staff_id}^{last_name}^{first_name}^W^^^^^EPIC^^^^PROVID|{role_code}|{specialty}|{{YYYYMMDD}}{{scheduledTime}}|0|S|{{duration}}|S"
             new_aip_lines.append(aip_line)
-        aip_count = len(patient['additional_surgeons']) + 1
+        aip_count = len(patient.additional_surgeons) + 1
         for role in ["Circulator", "Scrub", "CRNA", "Anesthesiologist"]:
             aip_count += 1
-            last_name = self.staff_entries[role]["lastName"].get() or "{lastName}"
-            first_name = self.staff_entries[role]["firstName"].get() or "{firstName}"
-            staff_id = self.staff_entries[role]["id"].get() or "{staffID}"
+            last_name = staff_entries[role]["lastName"] or "{lastName}"
+            first_name = staff_entries[role]["firstName"] or "{firstName}"
+            staff_id = staff_entries[role]["id"] or "{staffID}"
             role_info = next(r for r in self.fixed_roles if r["role"] == role)
             aip_line = f"AIP|{aip_count}||{staff_id}^{last_name}^{first_name}^W^^^^^EPIC^^^^PROVID|{role_info['code']}|GEN|{{YYYYMMDD}}{{scheduledTime}}|0|S|{{duration}}|S"
             new_aip_lines.append(aip_line)
-        for staff in patient['staff_members']:
+        for staff in patient.staff_members:
             aip_count += 1
-            role = staff["role"].get() or "Staff"
-            last_name = staff["lastName"].get() or "{lastName}"
-            first_name = staff["firstName"].get() or "{firstName}"
-            staff_id = staff["id"].get() or "{staffID}"
+            role = staff["role"] or "Staff"
+            last_name = staff["lastName"] or "{lastName}"
+            first_name = staff["firstName"] or "{firstName}"
+            staff_id = staff["id"] or "{staffID}"
             aip_line = f"AIP|{aip_count}||{staff_id}^{last_name}^{first_name}^L^^^^^^EPIC^^^^PROVID|{role}||{{YYYYMMDD}}{{scheduledTime}}|0|S|{{duration}}|S"
             new_aip_lines.append(aip_line)
-        lines[insert_idx:insert_idx] = new_aip_lines
-        return "\n".join(lines)
+        segments[insert_idx:insert_idx] = parse_segments("\n".join(new_aip_lines))
 
-    def add_asa_obx_segment(self, template, patient):
-        asa_score = patient['base_vars']['{asaScore}'].get()
+    def add_asa_obx_segment(self, segments, patient):
+        asa_score = patient.base_values['{asaScore}']
         if not asa_score or asa_score == '{asaScore}':
-            return template
-
-        lines = template.splitlines()
-        # Find insertion point: before AIS segment
-        insert_idx = next((i for i, line in enumerate(lines) if line.startswith("AIS")), len(lines))
-
-        # Calculate OBX sequence number
-        obx_count = sum(1 for line in lines if line.startswith("OBX"))
-        obx_seq = obx_count + 1
+            return
 
-        # Create ASA OBX segment
+        # Insert before the AIS segment, numbered after the existing OBX segments
+        insert_idx = find_segment(segments, "AIS", len(segments))
+        obx_seq = sum(1 for fields in segments if fields[0] == "OBX") + 1
         asa_obx = f"OBX|{obx_seq}|DTM|ASA^ASA Score||{asa_score}|||||||||{{YYYYMMDD}}{{eventTime}}00||||||||||||||||||"
-        lines.insert(insert_idx, asa_obx)
-
-        return "\n".join(lines)
-
-    def add_laterality_to_ais(self, template, patient):
-        environment = patient['environment'].get()
-        lines = template.splitlines()
-        new_lines = []
-
-        # Build a list of procedures with laterality values
-        # First procedure (AIS|1|) comes from base_vars (for backward compatibility)
-        # Additional procedures (AIS|2|, AIS|3|, etc.) come from patient['procedures']
-        procedures_laterality = []
-
-        # Check if base_vars has laterality (backward compatibility)
-        if '{laterality}' in patient['base_vars']:
-            base_laterality = patient['base_vars']['{laterality}'].get()
-            procedures_laterality.append(base_laterality if base_laterality and base_laterality != '{laterality}' else "")
-        else:
-            procedures_laterality.append("")
-
-        # Add laterality from additional procedures
-        for proc in patient['procedures']:
-            if '{laterality}' in proc:
-                laterality = proc['{laterality}'].get()
-                procedures_laterality.append(laterality if laterality and laterality != '{laterality}' else "")
-            else:
-                procedures_laterality.append("")
-
-        ais_index = 0
-        for line in lines:
-            if line.startswith("AIS|"):
-                parts = line.split("|")
-                # Get the AIS sequence number (1-indexed)
-                ais_seq = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
-
-                # Get laterality for this AIS segment (0-indexed in our list)
-                laterality = procedures_laterality[ais_seq - 1] if ais_seq - 1 < len(procedures_laterality) else ""
-
-                if laterality:
-                    if environment == "US Demo":
-                        # Add to AIS.12.1
-                        while len(parts) < 13:
-                            parts.append("")
-                        parts[12] = laterality
-                        line = "|".join(parts)
-
-                    elif environment == "UCH":
-                        # Add to AIS.3.4
-                        if len(parts) > 3:
-                            ais3_parts = parts[3].split("^")
-                            while len(ais3_parts) < 5:  # Need 5 components (0-4)
-                                ais3_parts.append("")
-                            ais3_parts[4] = laterality  # AIS.3.4 is 5th component (0-indexed)
-                            parts[3] = "^".join(ais3_parts)
-                            line = "|".join(parts)
-
-            new_lines.append(line)
-
-        return "\n".join(new_lines)
-
-    def add_anesthesia_type(self, template, patient):
-        anesthesia = patient['base_vars']['{anesthesiaType}'].get()
-        environment = patient['environment'].get()
-
-        if not anesthesia or anesthesia == '{anesthesiaType}':
-            return template
-
-        lines = template.splitlines()
-
-        if environment == "US Demo":
-            # Add to AIS.11.1 (first procedure only)
-            new_lines = []
-            for line in lines:
-                if line.startswith("AIS|"):
-                    parts = line.split("|")
-                    # Only apply to first AIS segment (AIS|1|)
-                    if len(parts) > 1 and parts[1] == "1":
-                        while len(parts) < 12:
-                            parts.append("")
-                        # Format with component separator for HL7 parsing
-                        # AIS.11.1 = anesthesia type, remaining components empty
-                        parts[11] = f"{anesthesia}^" if anesthesia else ""
-                        line = "|".join(parts)
-                new_lines.append(line)
-            return "\n".join(new_lines)
-
-        elif environment == "UCH":
-            # Add as OBX segment (MDM pattern)
-            insert_idx = next((i for i, line in enumerate(lines) if line.startswith("AIS")), len(lines))
-            obx_count = sum(1 for line in lines if line.startswith("OBX"))
-            obx_seq = obx_count + 1
-
-            anesthesia_obx = f"OBX|{obx_seq}|ST|ANESTHESIA^Anesthesia Type||{anesthesia}|||||||||{{YYYYMMDD}}{{eventTime}}00||||||||||||||||||"
-            lines.insert(insert_idx, anesthesia_obx)
-            return "\n".join(lines)
-
-    def add_isolations(self, template, patient):
-        isolations = patient['base_vars']['{isolations}'].get()
-        environment = patient['environment'].get()
-
-        if not isolations or isolations == '{isolations}':
-            return template
-
-        lines = template.splitlines()
-
-        if environment == "US Demo":
-            # Add PV2 segment with PV2.7 field
-            pv2_exists = any(line.startswith("PV2|") for line in lines)
-
-            if pv2_exists:
-                # Update existing PV2.7
-                new_lines = []
-                for line in lines:
-                    if line.startswith("PV2|"):
-                        parts = line.split("|")
-                        while len(parts) < 8:
-                            parts.append("")
-                        parts[7] = isolations  # PV2.7 (user enters with ~ delimiter)
-                        line = "|".join(parts)
-                    new_lines.append(line)
-                return "\n".join(new_lines)
-            else:
-                # Create new PV2 segment after PV1
-                pv1_idx = next((i for i, line in enumerate(lines) if line.startswith("PV1|")), -1)
-                if pv1_idx >= 0:
-                    pv2_line = f"PV2|||||||{isolations}|"
-                    lines.insert(pv1_idx + 1, pv2_line)
-                return "\n".join(lines)
-
-        elif environment == "UCH":
-            # Add as OBX segment(s) with valueType='ST'
-            insert_idx = next((i for i, line in enumerate(lines) if line.startswith("AIS")), len(lines))
-            obx_count = sum(1 for line in lines if line.startswith("OBX"))
-
-            # Split on ~ if multiple isolations
-            isolation_list = isolations.split("~") if "~" in isolations else [isolations]
-
-            for isolation in isolation_list:
-                isolation = isolation.strip()
-                if not isolation:
-                    continue
-
-                obx_seq = obx_count + 1
-                obx_count += 1
-
-                # UCH format: OBX.5.2 contains isolation when OBX.2='ST'
-                isolation_obx = f"OBX|{obx_seq}|ST|ISOLATION^Risk Factor||^{isolation}|||||||||{{YYYYMMDD}}{{eventTime}}00||||||||||||||||||"
-                lines.insert(insert_idx, isolation_obx)
-                insert_idx += 1
-
-            return "\n".join(lines)
+        segments.insert(insert_idx, asa_obx.split("|"))
+
+    def add_environment_fields(self, segments, patient):
+        table = self.environment_tables.get(patient.environment, ())
+        for key, place in table:
+            # First value comes from base_values, the rest from each added procedure
+            values = [patient.base_values.get(key, "")]
+            values.extend(proc.get(key, "") for proc in patient.procedures)
+            values = [value if value != key else "" for value in values]
+            if any(values):
+                place(segments, values)
 
     def validate_new_fields(self, patient):
         warnings = []
@@ -1699,14 +2228,14 @@ For further assistance, contact the application support team or refer to the **H
         # ASA Score validation removed - now free text field
 
         # Validate Laterality in procedures
-        for i, proc in enumerate(patient['procedures'], start=1):
+        for i, proc in enumerate(patient.procedures, start=1):
             if '{laterality}' in proc:
-                laterality = proc['{laterality}'].get()
+                laterality = proc['{laterality}']
                 if laterality and laterality not in ["", "L", "R", "B", "N/A"]:
                     warnings.append(f"Procedure {i} Laterality must be L, R, B, or N/A")
 
         # Validate isolations format
-        isolations = patient['base_vars']['{isolations}'].get()
+        isolations = patient.base_values['{isolations}']
         if isolations and "~" in isolations:
             parts = isolations.split("~")
             if any(not p.strip() for p in parts):
@@ -1721,7 +2250,7 @@ For further assistance, contact the application support team or refer to the **H
         return template
 
     def build_event_messages(self, template, base_values, duration_min):
-        message_type = self.patients[self.current_patient_index]['message_type'].get()
+        message_type = self.patients[self.current_patient_index].message_type
         s12_template = "\n".join(line for line in template.splitlines() if not line.startswith("OBX"))
         event_template = template  # Full template with OBX for event messages
         scheduled_time = base_values.get("{scheduledTime}", "{scheduledTime}")
@@ -1810,32 +2339,17 @@ For further assistance, contact the application support team or refer to the **H
                 if not messagebox.askyesno("Validation Warnings", warning_msg):
                     return
 
-            template = self.build_template(patient)
-
-            # Add ASA Score OBX (both environments)
-            template = self.add_asa_obx_segment(template, patient)
-
-            # Add staff segments
-            template = self.add_staff_segment(template)
-
-            # Add laterality to AIS (environment-dependent)
-            template = self.add_laterality_to_ais(template, patient)
-
-            # Add anesthesia type (environment-dependent)
-            template = self.add_anesthesia_type(template, patient)
-
-            # Add isolations (environment-dependent)
-            template = self.add_isolations(template, patient)
-            base_values = {k: v.get() for k, v in patient['base_vars'].items()}
-            base_values["{specialty}"] = patient['procedure_specialty'].get()
+            template = self.build_case_template(patient)
+            base_values = dict(patient.base_values)
+            base_values["{specialty}"] = patient.procedure_specialty
             duration = base_values.get("{duration}", "")
             duration_min = int(duration) if duration.isdigit() else random.randint(60, 120)
-            patient['messages'] = self.build_event_messages(template, base_values, duration_min)
+            patient.messages = self.build_event_messages(template, base_values, duration_min)
 
             # Generate ADT message with allergies
             al1_segments = []
-            if patient['allergies']:
-                for i, allergy in enumerate(patient['allergies'], start=1):
+            if patient.allergies:
+                for i, allergy in enumerate(patient.allergies, start=1):
                     reaction = allergy['allergyReaction'] if allergy['allergyReaction'] else ""
                     severity = allergy['allergySeverity'] if allergy['allergySeverity'] else ""
                     al1_segment = f"AL1|{i}||{allergy['allergyID']}^{allergy['allergyName']}|{severity}|{reaction}|"
@@ -1847,18 +2361,21 @@ For further assistance, contact the application support team or refer to the **H
                 if val:
                     adt_message = adt_message.replace(key, val)
             adt_message = adt_message.replace("{eventTime}", base_values.get("{scheduledTime}", "{eventTime}"))
-            patient['messages'].append((adt_message, "ADT"))
+            patient.messages.append((adt_message, "ADT"))
+            self.journal_patient()
 
             messagebox.showinfo("Success", "Patient messages generated. Edit fields as needed.")
 
     def creator_prev_patient(self):
         if self.current_patient_index > 0:
             self.current_patient_index -= 1
+            self.journal_append({"op": "current", "i": self.current_patient_index})
             self.creator_load_patient()
 
     def creator_next_patient(self):
         if self.current_patient_index < len(self.patients) - 1:
             self.current_patient_index += 1
+            self.journal_append({"op": "current", "i": self.current_patient_index})
             self.creator_load_patient()
 
     ### Editor Mode
@@ -1898,6 +2415,7 @@ For further assistance, contact the application support team or refer to the **H
             self.editor_content_frame, width=80, height=20, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR, font=DEFAULT_FONT, state="disabled"
         )
         self.editor_preview_text.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        self.preview_spans = None
 
         self.direct_edit_frame = tk.Frame(self.editor_content_frame, bg=BG_COLOR)
         self.direct_edit_frame.pack(fill=tk.X, pady=5)
@@ -1928,49 +2446,7 @@ For further assistance, contact the application support team or refer to the **H
         self.editor_update_preview()
 
     def parse_hl7_message(self, message_text):
-        parsed_values = {}
-        lines = message_text.splitlines()
-        for line in lines:
-            if line.startswith("AIL"):
-                parts = line.split("|")
-                if len(parts) > 3:
-                    location_parts = parts[3].split("^")
-                    if len(location_parts) >= 2:
-                        parsed_values["{locationOR}"] = location_parts[1]
-                        parsed_values["{locationDepartment}"] = location_parts[3]
-            elif line.startswith("PID"):
-                parts = line.split("|")
-                if len(parts) > 3:
-                    parsed_values["{patientMRN}"] = parts[3].split("^")[0]
-            elif line.startswith("OBX"):
-                parts = line.split("|")
-                if len(parts) > 3:
-                    obx3 = parts[3]  # Identifier
-                    if "ASA" in obx3 and len(parts) > 5:
-                        parsed_values["{asaScore}"] = parts[5]
-                    elif "ANESTHESIA" in obx3 and len(parts) > 5:
-                        parsed_values["{anesthesiaType}"] = parts[5]
-                    elif "ISOLATION" in obx3 and len(parts) > 5:
-                        # For UCH: OBX.5.2
-                        if "^" in parts[5]:
-                            parsed_values["{isolations}"] = parts[5].split("^")[1]
-            elif line.startswith("PV2"):
-                parts = line.split("|")
-                if len(parts) > 7 and parts[7]:
-                    parsed_values["{isolations}"] = parts[7]  # PV2.7
-            elif line.startswith("AIS"):
-                parts = line.split("|")
-                # Parse laterality from AIS.12 or AIS.3.4
-                if len(parts) > 12 and parts[12]:
-                    parsed_values["{laterality}"] = parts[12]  # US Demo
-                elif len(parts) > 3 and "^" in parts[3]:
-                    ais3_parts = parts[3].split("^")
-                    if len(ais3_parts) > 4 and ais3_parts[4]:
-                        parsed_values["{laterality}"] = ais3_parts[4]  # UCH
-                # Parse anesthesia from AIS.11
-                if len(parts) > 11 and parts[11]:
-                    parsed_values["{anesthesiaType}"] = parts[11]  # US Demo
-        return parsed_values
+        return editor_field_extractor.extract(message_text)
 
     def editor_load_message(self):
         if 0 <= self.current_patient_index < len(self.patient_blocks) and 0 <= self.current_message_index < len(self.patient_blocks[self.current_patient_index]['messages']):
@@ -2008,29 +2484,15 @@ For further assistance, contact the application support team or refer to the **H
 
     def editor_highlight_field(self, key):
         self.editor_preview_text.tag_remove("highlight", "1.0", tk.END)
-        message = self.editor_preview_text.get("1.0", tk.END).strip()
-        field_map = {
-            "{locationDepartment}": ("AIL", 3, 2),
-            "{locationOR}": ("AIL", 3, 1),
-            "{patientMRN}": ("PID", 3, 1),
-            # Add more mappings as needed
-        }
-        if key in field_map:
-            segment, field_idx, component_idx = field_map[key]
-            for i, line in enumerate(message.splitlines()):
-                if line.startswith(segment):
-                    parts = line.split("|")
-                    if len(parts) > field_idx:
-                        field = parts[field_idx]
-                        components = field.split("^")
-                        if len(components) >= component_idx:
-                            value = components[component_idx - 1]
-                            start_idx = line.find(value)
-                            start_pos = f"{i+1}.{start_idx}"
-                            end_pos = f"{i+1}.{start_idx + len(value)}"
-                            self.editor_preview_text.tag_add("highlight", start_pos, end_pos)
-                            self.editor_preview_text.tag_config("highlight", background="yellow", foreground="black")
-                            break
+        # Offsets are cached against the previewed text and recomputed only when it changes
+        message_text = self.editor_preview_text.get("1.0", "end-1c")
+        if self.preview_spans is None or self.preview_spans[0] != message_text:
+            self.preview_spans = (message_text, editor_field_extractor.locate(message_text))
+        span = self.preview_spans[1].get(key)
+        if span:
+            line_idx, start, end = span
+            self.editor_preview_text.tag_add("highlight", f"{line_idx+1}.{start}", f"{line_idx+1}.{end}")
+            self.editor_preview_text.tag_config("highlight", background="yellow", foreground="black")
 
     def editor_apply_changes(self):
         if self.apply_mode.get() == "Current":
@@ -2046,6 +2508,7 @@ For further assistance, contact the application support team or refer to the **H
             updated_text = self.editor_preview_text.get("1.0", tk.END).strip()
             self.edited_messages[message['file_path']] = updated_text
             message['message_text'] = updated_text
+            self.journal_append({"op": "editor", "file": message['file_path'], "text": updated_text})
             messagebox.showinfo("Applied", "Changes applied to current message")
         else:
             messagebox.showwarning("No Message", "No message selected")
@@ -2059,6 +2522,8 @@ For further assistance, contact the application support team or refer to the **H
                 updated_text = self.editor_preview_text.get("1.0", tk.END).strip()
                 self.edited_messages[message['file_path']] = updated_text
                 message['message_text'] = updated_text
+            # Every message gets the same text, so one record covers the whole block
+            self.journal_append({"op": "editor", "files": [message['file_path'] for message in patient_block['messages']], "text": updated_text})
             messagebox.showinfo("Applied", f"Changes applied to all {len(patient_block['messages'])} messages in this patient block")
         else:
             messagebox.showwarning("No Patient Block", "No patient block selected")
@@ -2080,6 +2545,7 @@ For further assistance, contact the application support team or refer to the **H
                 parse_message(updated_text)  # Validate HL7 message
                 self.edited_messages[message['file_path']] = updated_text
                 message['message_text'] = updated_text
+                self.journal_append({"op": "editor", "file": message['file_path'], "text": updated_text})
                 messagebox.showinfo("Saved", "Direct edits saved to current message")
             except ValidationError as e:
                 messagebox.showwarning("Validation Error", f"Invalid HL7 message: {e}")
@@ -2095,6 +2561,7 @@ For further assistance, contact the application support team or refer to the **H
                     self.message_backups[message['file_path']] = original_text
                     self.edited_messages[message['file_path']] = updated_text
                     message['message_text'] = updated_text
+                self.journal_append({"op": "editor", "files": [message['file_path'] for message in patient_block['messages']], "text": updated_text})
                 messagebox.showinfo("Saved", f"Direct edits saved to all {len(patient_block['messages'])} messages in this patient block")
             except ValidationError as e:
                 messagebox.showwarning("Validation Error", f"Invalid HL7 message: {e}")
@@ -2160,6 +2627,30 @@ procedure_fields = [
     {"prompt": "Special Needs:", "key": "{specialNeeds}"},
 ]
 
+fixed_roles = [
+    {"role": "Primary Surgeon", "code": "1.1^Primary", "last_key": "{primaryLastName}", "first_key": "{primaryFirstName}"},
+    {"role": "Circulator", "code": "4.20^Circulator", "last_key": "{lastName}", "first_key": "{firstName}"},
+    {"role": "Scrub", "code": "4.150^Scrub", "last_key": "{lastName}", "first_key": "{firstName}"},
+    {"role": "CRNA", "code": "2.20^ANE CRNA", "last_key": "{lastName}", "first_key": "{firstName}"},
+    {"role": "Anesthesiologist", "code": "2.139^Anesthesiologist", "last_key": "{lastName}", "first_key": "{firstName}"},
+]
+
+# Where the Editor reads each field from. A location is (field, component), with
+# component None for the whole field; "when" limits a rule to segments whose given
+# field contains the text, so OBX values are picked by their identifier.
+editor_field_rules = [
+    {"key": "{locationOR}", "segment": "AIL", "locations": [(3, 2)]},
+    {"key": "{locationDepartment}", "segment": "AIL", "locations": [(3, 4)]},
+    {"key": "{patientMRN}", "segment": "PID", "locations": [(3, 1)]},
+    {"key": "{asaScore}", "segment": "OBX", "locations": [(5, None)], "when": (3, "ASA")},
+    {"key": "{anesthesiaType}", "segment": "OBX", "locations": [(5, None)], "when": (3, "ANESTHESIA")},
+    {"key": "{isolations}", "segment": "OBX", "locations": [(5, 2)], "when": (3, "ISOLATION")},  # UCH
+    {"key": "{isolations}", "segment": "PV2", "locations": [(7, None)]},  # US Demo
+    {"key": "{laterality}", "segment": "AIS", "locations": [(12, None), (3, 5)]},  # US Demo, then UCH
+    {"key": "{anesthesiaType}", "segment": "AIS", "locations": [(11, None)]},  # US Demo
+]
+editor_field_extractor = FieldExtractor(editor_field_rules)
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = HL7MessageApp(root)
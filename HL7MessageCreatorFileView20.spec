@@ -5,7 +5,7 @@ a = Analysis(
     ['HL7MessageCreatorFileView20.py'],
     pathex=[],
     binaries=[],
-    datas=[('procedures.csv', '.'), ('staff_names.csv', '.'), ('surgeon_names.csv', '.'), ('patient_names.csv', '.')],
+    datas=[('procedures.csv', '.'), ('staff_names.csv', '.'), ('surgeon_names.csv', '.'), ('patient_names.csv', '.'), ('environment_profiles.json', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -1,12 +1,46 @@
 import tkinter as tk
-from tkinter import scrolledtext, messagebox, ttk, filedialog
+from tkinter import scrolledtext, messagebox, ttk, filedialog, simpledialog
 import pandas as pd
+import numpy as np
 import random
 import os
 import re
+import sys
+import time
+import asyncio
+import bisect
+import difflib
+import hashlib
+import heapq
+import itertools
+import json
+import multiprocessing
+import sqlite3
+import tempfile
+import threading
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from hl7apy.parser import parse_message
-from hl7apy.exceptions import ValidationError
+try:  # Only needed for deep validation
+    from hl7apy.parser import parse_message
+    from hl7apy.consts import VALIDATION_LEVEL
+except ImportError:
+    parse_message = None
+try:  # Case data export writes Parquet when available, NumPy .npz otherwise
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+try:  # Only needed for .hl7.zst archives
+    import zstandard
+except ImportError:
+    zstandard = None
+try:  # Autosave journal lock: fcntl on POSIX, msvcrt on Windows
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
 
 # Color scheme
 BG_COLOR = "#1F2139"  # Dark blue-gray background
@@ -18,10 +52,16 @@ TITLE_EDITOR = "#7DCAE3"  # Light blue for Editor
 DITHERED_TEXT = "#808080"  # Gray for disabled elements or autocompleted text
 MATCH_BG = "#2C3DAA"  # Blue for matching procedures (updated)
 SELECTED_MATCH_BG = "#465BE7"  # Light blue for selected match (updated)
+SEGMENT_NAME_COLOR = "#7DCAE3"  # Light blue for segment names in previews
+SEPARATOR_COLOR = "#808080"  # Gray for field and component separators
+PLACEHOLDER_COLOR = "#F0A050"  # Orange for placeholders left unfilled
 
 # Directory setup
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = SCRIPT_DIR  # CSVs and output in script directory
+VALIDATION_CACHE_PATH = os.path.join(DATA_DIR, "validation_cache.sqlite")  # Deep validation results by message hash
+JOURNAL_PATH = os.path.join(DATA_DIR, "autosave_journal.jsonl")  # Edits since the last clean quit, replayed after a crash
+JOURNAL_LOCK_PATH = JOURNAL_PATH + ".lock"  # Held by the running copy that owns the journal
 
 # Default HL7 template for SIU messages
 default_hl7 = r"""
@@ -71,9 +111,70 @@ case_events = [
     ("out_pacu", "in_pacu+60"),
 ]
 
+# Procedure specialties (procedures.csv) covered by each surgeon specialty (surgeon_names.csv),
+# with how likely a surgeon is to be picked for them relative to other surgeons
+surgeon_specialties = {
+    "gen": {"GEN": 1.0},
+    "obgyn": {"GYN": 1.0},
+    "ent": {"ENT": 1.0},
+    "ortho": {"ORTHO": 1.0, "POD": 0.25},
+    "cardio": {"CARD": 1.0, "CV": 0.5},
+    "thoracic": {"CV": 1.0, "CARD": 0.5},
+    "vascular": {"CV": 1.0},
+    "neuro": {"NEURO": 1.0},
+    "uro": {"URO": 1.0},
+    "plastic": {"PLAS": 1.0},
+    "podiatry": {"POD": 1.0},
+}
+
 # Default font
 DEFAULT_FONT = ("Arial", 10)
 
+# Saves with more files than this are spread across a writer pool
+PARALLEL_WRITE_THRESHOLD = 64
+MAX_WRITER_THREADS = 8
+
+# Deep validation of fewer new messages than this runs in-process rather than in a process pool
+PARALLEL_VALIDATION_THRESHOLD = 64
+
+# Message archives are written in independently compressed blocks of about this many bytes
+ARCHIVE_BLOCK_SIZE = 1 << 20
+
+# Messages written per transaction when saving to a corpus store
+CORPUS_BATCH_SIZE = 1000
+
+# Rows buffered per table before the case data export writes a column batch
+EXPORT_BATCH_SIZE = 10000
+
+# Number of Editor operations kept for undo
+UNDO_LIMIT = 100
+
+# Lines inserted per idle callback when a preview replaces a large block of text
+PREVIEW_CHUNK_LINES = 500
+
+# Creator session files: a JSON header line, then one JSON line per patient
+SESSION_FORMAT = "hl7-creator-session"  # Each app has its own, as their patient records differ
+SESSION_VERSION = 1
+
+# Autosave journal: edits arriving within this many seconds share one fsync
+JOURNAL_FLUSH_INTERVAL = 0.5
+# The journal is rewritten as a snapshot once this many records have been appended,
+# checked every JOURNAL_COMPACT_INTERVAL milliseconds
+JOURNAL_COMPACT_RECORDS = 5000
+JOURNAL_COMPACT_INTERVAL = 60000
+
+# MLLP sender defaults
+MLLP_DEFAULT_DESTINATION = "localhost:2575"
+MLLP_CONNECTIONS = 4  # Persistent connections in the pool
+MLLP_WINDOW = 8  # Messages in flight per connection before waiting for ACKs
+MLLP_ACK_TIMEOUT = 30  # Seconds
+
+# Fan-out sender defaults (per destination)
+FANOUT_QUEUE_SIZE = 1000  # Messages buffered before the overflow policy applies
+FANOUT_IN_FLIGHT = 16  # Deliveries running at once
+FANOUT_ATTEMPTS = 3  # Tries per message, with exponential backoff between them
+FANOUT_RETRY_DELAY = 0.5  # Seconds before the first retry
+
 # Helper function to validate HHMMSS time format
 def is_valid_time(time_str):
     if not time_str:
@@ -84,6 +185,2047 @@ def is_valid_time(time_str):
     except ValueError:
         return False
 
+# Time of each case event for a case starting at base_dt, with a couple of minutes of jitter
+def compute_case_event_times(base_dt, duration_min):
+    event_dts = {}
+    for event_name, offset in case_events:
+        if isinstance(offset, str):
+            if offset.startswith("duration"):
+                parts = offset.split("-")
+                if len(parts) == 2 and parts[1].isdigit():
+                    delta = int(parts[1])
+                    minutes = duration_min - delta
+                else:
+                    minutes = 0
+            else:
+                match = re.match(r"(\w+)([+-]\d+)", offset)
+                if match:
+                    base_event, delta_str = match.groups()
+                    delta = int(delta_str)
+                    if base_event in event_dts:
+                        base_event_dt = event_dts[base_event]
+                        event_dt = base_event_dt + timedelta(minutes=delta + random.randint(-2, 2))
+                        event_dts[event_name] = event_dt
+                        continue
+                minutes = 0
+        else:
+            minutes = offset
+        event_dt = base_dt + timedelta(minutes=minutes + random.randint(-2, 2))
+        event_dts[event_name] = event_dt
+    return event_dts
+
+# Scheduled start of a case, or None without a valid time; the date defaults to 1970-01-01
+def case_start(base_values):
+    scheduled_time = base_values.get("{scheduledTime}", "")
+    if not is_valid_time(scheduled_time):
+        return None
+    try:
+        return datetime.strptime(base_values.get("{YYYYMMDD}", "") + scheduled_time, "%Y%m%d%H%M%S")
+    except ValueError:
+        return datetime.strptime("19700101" + scheduled_time, "%Y%m%d%H%M%S")
+
+# Pack cases into ORs for one day. Longest cases are placed first, each in the room that
+# frees up earliest, and every case is followed by a turnover gap. Times are minutes from
+# midnight. Returns (room index, start minute) per case, or None if the case doesn't fit
+# before day_end in any room. O(n log n + n log rooms).
+def schedule_or_day(durations, rooms, day_start, day_end, turnover):
+    placements = [None] * len(durations)
+    free_at = [(day_start, room) for room in range(rooms)]  # Sorted, so already a heap
+    for case in sorted(range(len(durations)), key=lambda i: -durations[i]):
+        start, room = free_at[0]
+        if start + durations[case] > day_end:
+            continue  # The earliest free room can't fit it, so neither can the others
+        placements[case] = (room, start)
+        heapq.heapreplace(free_at, (start + durations[case] + turnover, room))
+    return placements
+
+class AliasSampler:
+    """Weighted random choice in O(1) per draw (Vose's alias method), after O(n) setup."""
+
+    def __init__(self, items, weights):
+        self.items = list(items)
+        count = len(self.items)
+        total = float(sum(weights))
+        scaled = [weight * count / total for weight in weights]
+        self.probability = [1.0] * count
+        self.alias = list(range(count))
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            low, high = small.pop(), large.pop()
+            self.probability[low] = scaled[low]
+            self.alias[low] = high
+            scaled[high] -= 1.0 - scaled[low]
+            (small if scaled[high] < 1.0 else large).append(high)
+
+    def sample(self):
+        i = random.randrange(len(self.items))
+        return self.items[i] if random.random() < self.probability[i] else self.items[self.alias[i]]
+
+def build_surgeon_index(surgeon_names):
+    """Samplers of surgeon IDs per procedure specialty, plus "" for all surgeons."""
+    weighted = {}
+    for _, row in surgeon_names.iterrows():
+        for specialty, weight in surgeon_specialties.get(str(row.get("Specialty", "")).strip().lower(), {}).items():
+            weighted.setdefault(specialty, []).append((str(row["ID"]), weight))
+    index = {specialty: AliasSampler(*zip(*pairs)) for specialty, pairs in weighted.items()}
+    index[""] = AliasSampler(map(str, surgeon_names["ID"]), [1.0] * len(surgeon_names))
+    return index
+
+class RosterAllocator:
+    """Books people onto cases without double-booking. Each person's bookings are kept as
+    sorted, non-overlapping intervals, so checking or adding one is a binary search."""
+
+    def __init__(self, people, gap=0):
+        self.people = list(people)
+        self.gap = gap  # Minutes a person needs between cases
+        self.starts = {person: [] for person in self.people}
+        self.ends = {person: [] for person in self.people}
+
+    def is_free(self, person, start, end):
+        starts = self.starts[person]
+        i = bisect.bisect_left(starts, end + self.gap)
+        # Only the last booking starting before this one ends can overlap it
+        return i == 0 or self.ends[person][i - 1] + self.gap <= start
+
+    def book(self, person, start, end):
+        i = bisect.bisect_left(self.starts[person], start)
+        self.starts[person].insert(i, start)
+        self.ends[person].insert(i, end)
+
+    def allocate(self, start, end, count=1, exclude=(), candidates=None):
+        """Book up to count free people for [start, end). Candidates are tried in the order
+        given; without them the search starts at a random person so work is spread out.
+        Returns the people booked; fewer than count if not enough are free."""
+        chosen = []
+        if candidates is None:
+            if not self.people:
+                return chosen
+            offset = random.randrange(len(self.people))
+            candidates = self.people[offset:] + self.people[:offset]
+        for person in candidates:
+            if person not in exclude and person not in chosen and self.is_free(person, start, end):
+                chosen.append(person)
+                if len(chosen) == count:
+                    break
+        for person in chosen:
+            self.book(person, start, end)
+        return chosen
+
+# mkstemp creates files readable only by their owner; the process umask is read once
+# here, as reading it means briefly setting it and writes happen on worker threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def copy_target_mode(tmp_path, path):
+    # Give a temp file the mode the target would otherwise have: the existing file's
+    # mode when replacing one, or the umask default for a new file
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(tmp_path, mode)
+
+# Write to a temp file beside the target and rename it into place, so a crash
+# never leaves a half-written message behind
+def atomic_write_text(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        copy_target_mode(tmp_path, path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_files(jobs):
+    """Atomically write (path, text) pairs, in parallel for large change sets."""
+    if len(jobs) <= PARALLEL_WRITE_THRESHOLD:
+        for path, text in jobs:
+            atomic_write_text(path, text)
+        return
+    workers = min(MAX_WRITER_THREADS, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in pool.map(lambda job: atomic_write_text(*job), jobs):
+            pass
+
+# Message archives (.hl7.gz / .hl7.zst) hold many messages in one file. Messages are
+# compressed in blocks, and each block is preceded by a small separately compressed
+# header listing its messages and the compressed size of the block, so a reader can
+# index the archive by skipping from header to header and only inflate the block it
+# needs. Headers and blocks are ordinary gzip members or zstd frames, so the whole
+# file also decompresses with zcat/zstdcat. Header entries are JSON [length, name]
+# lines (format 2), so names may hold any character; format 1 used tab-separated
+# lines and is still read.
+def is_archive_path(path):
+    return path.lower().endswith((".hl7.gz", ".hl7.zst"))
+
+def _archive_codec(path):
+    if path.lower().endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("Reading and writing .hl7.zst archives requires the zstandard package")
+        return "zst"
+    return "gz"
+
+def _compress(codec, data):
+    if codec == "zst":
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip member
+    return compressor.compress(data) + compressor.flush()
+
+def _decompressor(codec):
+    return zstandard.ZstdDecompressor().decompressobj() if codec == "zst" else zlib.decompressobj(31)
+
+class ArchiveWriter:
+    """Streams (name, text) messages into a compressed archive, one block at a time."""
+
+    def __init__(self, path, block_size=ARCHIVE_BLOCK_SIZE):
+        self.path = path
+        self.codec = _archive_codec(path)
+        self.block_size = block_size
+        self.entries = []
+        self.chunks = []
+        self.pending = 0
+        self.count = 0
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp")
+        self.file = os.fdopen(fd, "wb")
+
+    def add(self, name, message_text):
+        data = message_text.encode("utf-8")
+        self.entries.append((name, len(data)))
+        self.chunks.append(data)
+        self.pending += len(data)
+        self.count += 1
+        if self.pending >= self.block_size:
+            self.flush_block()
+
+    def flush_block(self):
+        if not self.entries:
+            return
+        block = _compress(self.codec, b"".join(self.chunks))
+        header = f"#HL7ARCHIVE 2 {len(block)}\n" + "".join(json.dumps([length, name]) + "\n" for name, length in self.entries)
+        self.file.write(_compress(self.codec, header.encode("utf-8")))
+        self.file.write(block)
+        self.entries = []
+        self.chunks = []
+        self.pending = 0
+
+    def close(self):
+        # Like atomic_write_text, the archive only replaces the target once complete
+        try:
+            self.flush_block()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            copy_target_mode(self.tmp_path, self.path)
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_archive(path, named_messages):
+    with ArchiveWriter(path) as writer:
+        for name, message_text in named_messages:
+            writer.add(name, message_text)
+    return writer.count
+
+class MessageArchive:
+    """Index of a message archive. Only block headers are read up front; read(i) inflates
+    the block holding message i, keeping the last block for sequential browsing."""
+
+    def __init__(self, path):
+        self.path = path
+        self.codec = _archive_codec(path)
+        self.blocks = []  # (offset, compressed size) of each block
+        self.entries = []  # (name, block index, start, length)
+        self.cached_block = (None, None)
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            offset = 0
+            while True:
+                f.seek(offset)
+                header, header_size = self._read_member(f)
+                if header is None:
+                    break
+                lines = header.decode("utf-8").splitlines()
+                magic, version, block_size = lines[0].split(" ")
+                if magic != "#HL7ARCHIVE" or version not in ("1", "2"):
+                    raise ValueError(f"{os.path.basename(path)} is not an HL7 message archive")
+                start = 0
+                for line in lines[1:]:
+                    length, name = json.loads(line) if version == "2" else line.split("\t", 1)
+                    self.entries.append((name, len(self.blocks), start, int(length)))
+                    start += int(length)
+                self.blocks.append((offset + header_size, int(block_size)))
+                offset += header_size + int(block_size)
+                if offset > file_size:
+                    raise ValueError(f"{os.path.basename(path)} is truncated")
+
+    def _read_member(self, f):
+        # Inflate one gzip member / zstd frame from the current position; returns (data, compressed size)
+        decompressor = _decompressor(self.codec)
+        data = []
+        consumed = 0
+        while not decompressor.eof:
+            chunk = f.read(4096)
+            if not chunk:
+                if consumed == 0:
+                    return None, 0
+                raise ValueError(f"{os.path.basename(self.path)} is truncated")
+            data.append(decompressor.decompress(chunk))
+            consumed += len(chunk)
+        return b"".join(data), consumed - len(decompressor.unused_data)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def names(self):
+        return [entry[0] for entry in self.entries]
+
+    def read(self, index):
+        name, block_index, start, length = self.entries[index]
+        if self.cached_block[0] != block_index:
+            offset, size = self.blocks[block_index]
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                compressed = f.read(size)
+            decompressor = _decompressor(self.codec)
+            data = decompressor.decompress(compressed)
+            if not decompressor.eof:
+                raise ValueError(f"{os.path.basename(self.path)} is damaged")
+            self.cached_block = (block_index, data)
+        return self.cached_block[1][start:start + length].decode("utf-8")
+
+_arrow_types = {"str": "string", "int": "int64", "datetime": "timestamp[s]"}
+_numpy_types = {"str": str, "int": "int64", "datetime": "datetime64[s]"}
+
+class ColumnarWriter:
+    """Writes one table in column batches: Parquet row groups when pyarrow is installed,
+    otherwise a compressed NumPy .npz with one array per column."""
+
+    def __init__(self, path_base, columns):
+        self.columns = columns  # name -> "str", "int" or "datetime"
+        self.rows = []
+        self.count = 0
+        if pa is not None:
+            self.path = path_base + ".parquet"
+            self.schema = pa.schema([(name, pa.type_for_alias(_arrow_types[kind])) for name, kind in columns.items()])
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+        else:
+            self.path = path_base + ".npz"
+            self.batches = {name: [] for name in columns}
+
+    def append(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= EXPORT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        values = list(zip(*self.rows))
+        if pa is not None:
+            self.writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(values, self.schema)], schema=self.schema))
+        else:
+            for (name, kind), column in zip(self.columns.items(), values):
+                self.batches[name].append(np.array(column, dtype=_numpy_types[kind]))
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if pa is not None:
+            self.writer.close()
+        else:
+            np.savez_compressed(self.path, **{
+                name: np.concatenate(parts) if parts else np.array([], dtype=_numpy_types[self.columns[name]])
+                for name, parts in self.batches.items()
+            })
+
+def export_case_records(directory, records):
+    """Write case records (see creator_case_record) as cases, staff, procedures, allergies and
+    case_events tables. Returns the row count of each table."""
+    value_columns = {p['key'][1:-1]: "str" for p in base_prompts}
+    tables = {
+        "cases": {"case_id": "int", **value_columns, "specialty": "str", "message_type": "str", "duration_min": "int", "scheduled_start": "datetime"},
+        "staff": {"case_id": "int", "mrn": "str", "role": "str", "staff_id": "str", "last_name": "str", "first_name": "str"},
+        "procedures": {"case_id": "int", "mrn": "str", "sequence": "int", "procedure": "str", "procedure_id": "str", "description": "str", "special_needs": "str"},
+        "allergies": {"case_id": "int", "mrn": "str", "allergy_id": "str", "allergy_name": "str", "reaction": "str", "severity": "str"},
+        "case_events": {"case_id": "int", "mrn": "str", "event": "str", "event_time": "datetime"},
+    }
+    writers = {name: ColumnarWriter(os.path.join(directory, name), columns) for name, columns in tables.items()}
+    try:
+        for case_id, record in enumerate(records, start=1):
+            values = record['values']
+            mrn = values.get("{patientMRN}", "")
+            writers["cases"].append((case_id, *(values.get(p['key'], "") for p in base_prompts), values.get("{specialty}", ""),
+                                     record['message_type'], record['duration_min'], record['start']))
+            for role, staff_id, last_name, first_name in record['staff']:
+                writers["staff"].append((case_id, mrn, role, staff_id, last_name, first_name))
+            procedures = [{f['key']: values.get(f['key'], "") for f in procedure_fields}] + record['procedures']
+            for sequence, proc in enumerate(procedures, start=1):
+                writers["procedures"].append((case_id, mrn, sequence, *(proc.get(f['key'], "") for f in procedure_fields)))
+            for allergy in record['allergies']:
+                writers["allergies"].append((case_id, mrn, allergy['allergyID'], allergy['allergyName'], allergy['allergyReaction'] or "", allergy['allergySeverity'] or ""))
+            for event_name, event_dt in record['event_times'].items():
+                writers["case_events"].append((case_id, mrn, event_name, event_dt))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {name: writer.count for name, writer in writers.items()}
+
+# Indexed metadata columns of a corpus store and the field each is read from
+corpus_columns = {
+    "mrn": "PID-3.1",
+    "last_name": "PID-5.1",
+    "first_name": "PID-5.2",
+    "message_type": "MSH-9.1",
+    "trigger_event": "MSH-9.2",
+    "case_event": "OBX-3",
+    "scheduled_date": "SCH-11.4",
+    "procedure": "AIS-3.2",
+}
+
+class CorpusStore:
+    """SQLite archive of messages with indexed metadata, for corpora too large for loose files.
+    An existing file must already hold the corpus schema; with create=True a new or empty
+    database is given it. Any other SQLite file is left untouched and raises ValueError."""
+
+    def __init__(self, path, create=False):
+        self.path = path
+        self.extractor = FieldExtractor(corpus_columns)
+        if not create and not os.path.isfile(path):
+            raise ValueError(f"{os.path.basename(path)} does not exist")
+        self.connection = sqlite3.connect(path)
+        try:
+            self.check_schema(create)
+        except BaseException:
+            self.connection.close()
+            raise
+
+    def check_schema(self, create):
+        tables = {name for (name,) in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "messages" in tables:
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(messages)")}
+            if not {"id", "name", "body", "updated_at", *corpus_columns} <= columns:
+                raise ValueError(f"{os.path.basename(self.path)} is not a corpus store")
+        elif tables or not create:
+            raise ValueError(f"{os.path.basename(self.path)} is not a corpus store")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; commits skip the extra fsync
+        if "messages" in tables:
+            return
+        with self.connection:
+            self.connection.execute(
+                f"CREATE TABLE messages (id INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+                f"{', '.join(f'{column} TEXT' for column in corpus_columns)}, body TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX messages_mrn ON messages (mrn)")
+            self.connection.execute("CREATE INDEX messages_last_name ON messages (last_name COLLATE NOCASE)")
+            self.connection.execute("CREATE INDEX messages_scheduled_date ON messages (scheduled_date)")
+
+    def metadata(self, message_text):
+        values = self.extractor.extract(message_text)
+        if values.get("scheduled_date"):
+            values["scheduled_date"] = values["scheduled_date"][:8]  # Date only, without the time
+        return [values.get(column) for column in corpus_columns]
+
+    def add_messages(self, named_messages, batch_size=CORPUS_BATCH_SIZE):
+        now = time.time()
+        placeholders = ", ".join("?" * (len(corpus_columns) + 3))
+        statement = f"INSERT INTO messages (name, {', '.join(corpus_columns)}, body, updated_at) VALUES ({placeholders})"
+        count = 0
+        batch = []
+        for name, message_text in named_messages:
+            batch.append((name, *self.metadata(message_text), message_text, now))
+            if len(batch) >= batch_size:
+                with self.connection:
+                    self.connection.executemany(statement, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            with self.connection:
+                self.connection.executemany(statement, batch)
+            count += len(batch)
+        return count
+
+    def update_messages(self, updates):
+        """updates: (id, message_text) pairs; metadata is re-read from the new text."""
+        now = time.time()
+        statement = f"UPDATE messages SET {', '.join(f'{column} = ?' for column in corpus_columns)}, body = ?, updated_at = ? WHERE id = ?"
+        with self.connection:
+            self.connection.executemany(statement, [(*self.metadata(message_text), message_text, now, message_id) for message_id, message_text in updates])
+
+    def find(self, mrn=None, last_name=None):
+        """(id, name, mrn, last_name, first_name, body) rows for one patient, in insertion order."""
+        if mrn is not None:
+            query, value = "mrn = ?", mrn
+        else:
+            query, value = "last_name = ? COLLATE NOCASE", last_name
+        return self.connection.execute(
+            f"SELECT id, name, mrn, last_name, first_name, body FROM messages WHERE {query} ORDER BY id", (value,)
+        ).fetchall()
+
+    def close(self):
+        self.connection.close()
+
+# Field path syntax: SEG[occurrence]-field[repetition].component.subcomponent
+# e.g. PID-3.1, AIL-3.4, NTE[2]-3, PV2-7[2]. Indexes are 1-based; occurrence and
+# repetition default to 1, and a path without a component addresses the whole field.
+FIELD_PATH_RE = re.compile(r"^([A-Z][A-Z0-9]{2})(?:\[(\d+)\])?-(\d+)(?:\[(\d+)\])?(?:\.(\d+)(?:\.(\d+))?)?$")
+
+def segment_separator(message_text):
+    # Files written by this tool use \n; messages from other systems often use \r
+    if "\r\n" in message_text:
+        return "\r\n"
+    if "\r" in message_text:
+        return "\r"
+    return "\n"
+
+class FieldPath:
+    """Accessor compiled from a field path string. Use compile_field_path() to get one."""
+    __slots__ = ("path", "segment", "occurrence", "field_index", "repetition", "component", "subcomponent", "levels")
+
+    def __init__(self, path):
+        match = FIELD_PATH_RE.match(path)
+        if not match:
+            raise ValueError(f"Invalid HL7 field path: {path}")
+        segment, occurrence, field, repetition, component, subcomponent = match.groups()
+        if segment == "MSH" and int(field) == 1:
+            raise ValueError("MSH-1 is the field separator and cannot be addressed")
+        self.path = path
+        self.segment = segment
+        self.occurrence = int(occurrence or 1)
+        # MSH-1 is the field separator itself, so MSH fields sit one position to the left
+        self.field_index = int(field) - 1 if segment == "MSH" else int(field)
+        self.repetition = int(repetition or 1)
+        self.component = int(component) if component else 0
+        self.subcomponent = int(subcomponent) if subcomponent else 0
+        self.levels = self._levels()
+
+    def __repr__(self):
+        return f"FieldPath({self.path!r})"
+
+    def _levels(self):
+        # (separator, 1-based index) for each level below the field
+        if self.segment == "MSH" and self.field_index == 1:
+            return []  # MSH-2 holds the encoding characters themselves
+        levels = [("~", self.repetition)]
+        if self.component:
+            levels.append(("^", self.component))
+            if self.subcomponent:
+                levels.append(("&", self.subcomponent))
+        return levels
+
+    def find_line(self, lines):
+        seen = 0
+        for i, line in enumerate(lines):
+            if line[:3] == self.segment and (len(line) == 3 or line[3] == "|"):
+                seen += 1
+                if seen == self.occurrence:
+                    return i
+        return -1
+
+    def get_from_segment(self, line):
+        return self.get_from_fields(line.split("|"))
+
+    def get_from_fields(self, parts):
+        if len(parts) <= self.field_index:
+            return None
+        value = parts[self.field_index]
+        for separator, index in self.levels:
+            if separator not in value:
+                # Unsplit value: only its first piece exists
+                if index > 1:
+                    return None
+                continue
+            pieces = value.split(separator)
+            if len(pieces) < index:
+                return None
+            value = pieces[index - 1]
+        return value
+
+    def set_in_segment(self, line, new_value):
+        parts = line.split("|")
+        while len(parts) <= self.field_index:
+            parts.append("")
+        levels = self.levels
+        parts[self.field_index] = self._set_level(parts[self.field_index], levels, new_value) if levels else new_value
+        return "|".join(parts)
+
+    def _set_level(self, value, levels, new_value):
+        separator, index = levels[0]
+        pieces = value.split(separator)
+        while len(pieces) < index:
+            pieces.append("")
+        if len(levels) > 1:
+            pieces[index - 1] = self._set_level(pieces[index - 1], levels[1:], new_value)
+        else:
+            pieces[index - 1] = new_value
+        return separator.join(pieces)
+
+    def span_in_segment(self, line):
+        # Character offsets (start, end) of the addressed value within the segment line
+        parts = line.split("|")
+        if len(parts) <= self.field_index:
+            return None
+        start = sum(len(part) + 1 for part in parts[:self.field_index])
+        value = parts[self.field_index]
+        for separator, index in self.levels:
+            pieces = value.split(separator)
+            if len(pieces) < index:
+                return None
+            start += sum(len(piece) + 1 for piece in pieces[:index - 1])
+            value = pieces[index - 1]
+        return start, start + len(value)
+
+    def get(self, message_text):
+        return self.get_from_lines(message_text.splitlines())
+
+    def get_from_lines(self, lines):
+        line_idx = self.find_line(lines)
+        if line_idx < 0:
+            return None
+        return self.get_from_segment(lines[line_idx])
+
+    def set(self, message_text, new_value):
+        """Return message_text with the addressed value replaced; unchanged if the segment is missing."""
+        separator = segment_separator(message_text)
+        lines = message_text.split(separator)
+        line_idx = self.find_line(lines)
+        if line_idx < 0:
+            return message_text
+        lines[line_idx] = self.set_in_segment(lines[line_idx], new_value)
+        return separator.join(lines)
+
+    def locate(self, message_text):
+        """Return (line_index, start, end) of the addressed value, with line_index 0-based."""
+        lines = message_text.split(segment_separator(message_text))
+        line_idx = self.find_line(lines)
+        if line_idx < 0:
+            return None
+        span = self.span_in_segment(lines[line_idx])
+        if span is None:
+            return None
+        return line_idx, span[0], span[1]
+
+_compiled_field_paths = {}
+
+def compile_field_path(path):
+    accessor = _compiled_field_paths.get(path)
+    if accessor is None:
+        accessor = _compiled_field_paths[path] = FieldPath(path)
+    return accessor
+
+class FieldExtractor:
+    """Reads a fixed set of field paths from a message in one pass over its segments."""
+
+    def __init__(self, fields):
+        # fields: key -> field path. Accessors are grouped by the segment occurrence
+        # they read, so each segment is split once however many fields it holds.
+        self.keys = tuple(fields)
+        self.groups = {}
+        for key, path in fields.items():
+            accessor = compile_field_path(path)
+            reader = (key, accessor.field_index, tuple(accessor.levels))
+            self.groups.setdefault(accessor.segment, {}).setdefault(accessor.occurrence, []).append(reader)
+        # Segments are only split as far as their last requested field
+        for occurrences in self.groups.values():
+            for occurrence, readers in occurrences.items():
+                occurrences[occurrence] = (max(reader[1] for reader in readers) + 1, tuple(readers))
+        self.group_count = sum(len(occurrences) for occurrences in self.groups.values())
+
+    def extract(self, message_text):
+        return self.extract_lines(message_text.splitlines())
+
+    def extract_lines(self, lines):
+        """Dict of key -> value for every field present in the message."""
+        values = {}
+        seen = {}
+        remaining = self.group_count
+        groups = self.groups
+        for line in lines:
+            name = line[:3]
+            occurrences = groups.get(name)
+            if occurrences is None or (len(line) > 3 and line[3] != "|"):
+                continue
+            seen[name] = occurrence = seen.get(name, 0) + 1
+            group = occurrences.get(occurrence)
+            if group is None:
+                continue
+            max_split, readers = group
+            parts = line.split("|", max_split)
+            field_count = len(parts)
+            for key, field_index, levels in readers:
+                # Same walk as FieldPath.get_from_fields, inlined for bulk scans
+                if field_index >= field_count:
+                    continue
+                value = parts[field_index]
+                for separator, index in levels:
+                    if separator in value:
+                        pieces = value.split(separator, index)
+                        if len(pieces) < index:
+                            break
+                        value = pieces[index - 1]
+                    elif index > 1:
+                        break
+                else:
+                    values[key] = value
+            remaining -= 1
+            if not remaining:
+                break  # Every requested segment has been read
+        return values
+
+class OffsetMap:
+    """Character offsets of every field, repetition and component in a message.
+
+    Segments are indexed when the map is built and each line is tokenized the first
+    time it is asked about, so a field path resolves to its (line, start, end) and a
+    (line, column) position to the component under it without re-splitting the text.
+    """
+    __slots__ = ("text", "lines", "line_starts", "segment_ids", "segment_lines", "parsed")
+
+    def __init__(self, message_text):
+        self.text = message_text
+        separator = segment_separator(message_text)
+        self.lines = message_text.split(separator)
+        self.line_starts = []
+        self.segment_ids = []  # (segment, occurrence) of each line, None if it is not a segment
+        self.segment_lines = {}  # (segment, occurrence) -> line index
+        self.parsed = {}  # line index -> (spans, columns), filled on demand
+        seen = {}
+        offset = 0
+        for line_idx, line in enumerate(self.lines):
+            self.line_starts.append(offset)
+            offset += len(line) + len(separator)
+            name = line[:3]
+            if len(name) < 3 or (len(line) > 3 and line[3] != "|"):
+                self.segment_ids.append(None)
+                continue
+            seen[name] = occurrence = seen.get(name, 0) + 1
+            self.segment_ids.append((name, occurrence))
+            self.segment_lines[(name, occurrence)] = line_idx
+
+    def _parse_line(self, line_idx):
+        # spans: (field_index, repetition, component, subcomponent) -> (start, end), with
+        # component/subcomponent 0 for the whole repetition/component.
+        # columns: the (field_index, repetition, component) under each column.
+        parsed = self.parsed.get(line_idx)
+        if parsed is not None:
+            return parsed
+        line = self.lines[line_idx]
+        spans = {}
+        columns = [None] * len(line)
+        start = 4
+        for field_index, field in enumerate(line.split("|")[1:], start=1):
+            if field_index == 1 and line[:3] == "MSH":
+                # MSH-2 holds the encoding characters, so it is never split
+                spans[(1, 1, 0, 0)] = (start, start + len(field))
+                columns[start:start + len(field)] = [(1, 1, 0)] * len(field)
+                start += len(field) + 1
+                continue
+            for repetition, rep_value in enumerate(field.split("~"), start=1):
+                spans[(field_index, repetition, 0, 0)] = (start, start + len(rep_value))
+                for component, comp_value in enumerate(rep_value.split("^"), start=1):
+                    end = start + len(comp_value)
+                    spans[(field_index, repetition, component, 0)] = (start, end)
+                    if "&" in comp_value:
+                        sub_start = start
+                        for subcomponent, sub_value in enumerate(comp_value.split("&"), start=1):
+                            spans[(field_index, repetition, component, subcomponent)] = (sub_start, sub_start + len(sub_value))
+                            sub_start += len(sub_value) + 1
+                    else:
+                        spans[(field_index, repetition, component, 1)] = (start, end)
+                    columns[start:end] = [(field_index, repetition, component)] * len(comp_value)
+                    start = end + 1
+        parsed = self.parsed[line_idx] = (spans, columns)
+        return parsed
+
+    def locate(self, accessor):
+        """(line_index, start, end) of the value a FieldPath addresses, or None."""
+        line_idx = self.segment_lines.get((accessor.segment, accessor.occurrence))
+        if line_idx is None:
+            return None
+        spans = self._parse_line(line_idx)[0]
+        if accessor.levels:
+            span = spans.get((accessor.field_index, accessor.repetition, accessor.component, accessor.subcomponent))
+        else:
+            span = spans.get((accessor.field_index, 1, 0, 0))  # MSH-2
+        return (line_idx, *span) if span is not None else None
+
+    def component_at(self, line_idx, column):
+        """(segment, occurrence, field_index, repetition, component) under a position, or None."""
+        if not 0 <= line_idx < len(self.lines) or self.segment_ids[line_idx] is None:
+            return None
+        columns = self._parse_line(line_idx)[1]
+        if 0 <= column < len(columns) and columns[column] is not None:
+            return (*self.segment_ids[line_idx], *columns[column])
+        return None
+
+    def span_at(self, line_idx, column):
+        """(line_index, start, end) of the component under a position, or None."""
+        position = self.component_at(line_idx, column)
+        if position is None:
+            return None
+        return (line_idx, *self.parsed[line_idx][0][(*position[2:], 0)])
+
+    def replace(self, accessor, new_value):
+        """Message text with the addressed value replaced, or None if it is not in the message."""
+        span = self.locate(accessor)
+        if span is None:
+            return None
+        line_idx, start, end = span
+        offset = self.line_starts[line_idx]
+        return self.text[:offset + start] + new_value + self.text[offset + end:]
+
+# Segment-level change between two versions of a message. Only the run of segments
+# that differs is kept, so every version shares its unchanged segments with the others.
+def segment_delta(old_text, new_text):
+    separator = segment_separator(old_text)
+    old_lines = old_text.split(separator)
+    new_lines = new_text.split(separator)
+    limit = min(len(old_lines), len(new_lines))
+    start = 0
+    while start < limit and old_lines[start] == new_lines[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old_lines[-1 - end] == new_lines[-1 - end]:
+        end += 1
+    return start, tuple(old_lines[start:len(old_lines) - end]), tuple(new_lines[start:len(new_lines) - end])
+
+def apply_segment_delta(text, delta, reverse=False):
+    start, old_segments, new_segments = delta
+    if reverse:
+        old_segments, new_segments = new_segments, old_segments
+    separator = segment_separator(text)
+    lines = text.split(separator)
+    lines[start:start + len(old_segments)] = new_segments
+    return separator.join(lines)
+
+def _field_label(segment_name, index):
+    return f"{segment_name}-{index + 1 if segment_name == 'MSH' else index}"
+
+def segment_field_changes(old_segment, new_segment):
+    """Describe the fields (or components) that differ between two versions of a segment."""
+    name = old_segment[:3]
+    old_fields = old_segment.split("|")
+    new_fields = new_segment.split("|")
+    changes = []
+    for i in range(1, max(len(old_fields), len(new_fields))):
+        old_value = old_fields[i] if i < len(old_fields) else ""
+        new_value = new_fields[i] if i < len(new_fields) else ""
+        if old_value == new_value:
+            continue
+        old_components = old_value.split("^")
+        new_components = new_value.split("^")
+        if name != "MSH" and max(len(old_components), len(new_components)) > 1:
+            for j in range(max(len(old_components), len(new_components))):
+                old_component = old_components[j] if j < len(old_components) else ""
+                new_component = new_components[j] if j < len(new_components) else ""
+                if old_component != new_component:
+                    changes.append(f"{_field_label(name, i)}.{j + 1}: {old_component!r} -> {new_component!r}")
+        else:
+            changes.append(f"{_field_label(name, i)}: {old_value!r} -> {new_value!r}")
+    return changes
+
+def message_diff(old_text, new_text):
+    """Segment/field-aware diff as display lines. Only the run of segments between the
+    common prefix and suffix is compared, so small edits to large messages stay cheap."""
+    start, old_segments, new_segments = segment_delta(old_text, new_text)
+    lines = []
+    matcher = difflib.SequenceMatcher(None, old_segments, new_segments, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if tag == "replace" and i2 - i1 == j2 - j1:
+            for offset, (old_segment, new_segment) in enumerate(zip(old_segments[i1:i2], new_segments[j1:j2])):
+                if old_segment[:3] == new_segment[:3]:
+                    lines.append(f"~ line {start + j1 + offset + 1} {new_segment[:3]}")
+                    lines.extend(f"    {change}" for change in segment_field_changes(old_segment, new_segment))
+                else:
+                    lines.append(f"- line {start + i1 + offset + 1} {old_segment}")
+                    lines.append(f"+ line {start + j1 + offset + 1} {new_segment}")
+            continue
+        lines.extend(f"- line {start + i + 1} {old_segments[i]}" for i in range(i1, i2))
+        lines.extend(f"+ line {start + j + 1} {new_segments[j]}" for j in range(j1, j2))
+    return lines
+
+class EditHistory:
+    """Undo/redo stacks of Editor operations. Each operation is a label and a list of
+    (message, delta) pairs; identical deltas within one operation are stored once."""
+
+    def __init__(self, limit=UNDO_LIMIT):
+        self.limit = limit
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def record(self, label, changes):
+        changes = [(message, delta) for message, delta in changes if delta[1] != delta[2]]
+        if not changes:
+            return
+        shared = {}
+        changes = [(message, shared.setdefault(delta, delta)) for message, delta in changes]
+        self.undo_stack.append((label, changes))
+        del self.undo_stack[:-self.limit]
+        self.redo_stack.clear()
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+# MLLP framing: <VT> message <FS><CR>, with \r between segments
+MLLP_START = b"\x0b"
+MLLP_END = b"\x1c\x0d"
+MLLP_READ_LIMIT = 16 * 1024 * 1024
+
+def mllp_frame(message_text):
+    segments = [line for line in message_text.splitlines() if line.strip()]
+    return MLLP_START + ("\r".join(segments) + "\r").encode("utf-8") + MLLP_END
+
+async def read_mllp_frame(reader):
+    data = await reader.readuntil(MLLP_END)
+    start = data.find(MLLP_START)
+    return data[start + 1:-len(MLLP_END)].decode("utf-8", errors="replace")
+
+def build_ack(message_text, ack_code="AA", text=""):
+    lines = message_text.splitlines()
+    sending_app = compile_field_path("MSH-3").get_from_lines(lines) or ""
+    sending_facility = compile_field_path("MSH-4").get_from_lines(lines) or ""
+    receiving_app = compile_field_path("MSH-5").get_from_lines(lines) or ""
+    receiving_facility = compile_field_path("MSH-6").get_from_lines(lines) or ""
+    trigger = compile_field_path("MSH-9.2").get_from_lines(lines) or ""
+    control_id = compile_field_path("MSH-10").get_from_lines(lines) or ""
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    return (f"MSH|^~\\&|{receiving_app}|{receiving_facility}|{sending_app}|{sending_facility}|{timestamp}||ACK^{trigger}|ACK{control_id}|P|2.5\r"
+            f"MSA|{ack_code}|{control_id}|{text}")
+
+AckResult = namedtuple("AckResult", ["control_id", "ack_code", "sent_at", "acked_at", "error"])
+
+class PendingAck:
+    """A message written to a connection and awaiting its ACK."""
+    __slots__ = ("control_id", "sent_at", "future", "timer", "resolved")
+
+    def __init__(self, control_id, future):
+        self.control_id = control_id
+        self.sent_at = None
+        self.future = future
+        self.timer = None
+        self.resolved = False
+
+class MLLPConnection:
+    """One persistent MLLP connection. Messages are written in the order they are queued and
+    up to `window` may await their ACK at once; ACKs come back in order on a connection, so
+    each one is matched to the oldest outstanding message and checked against its MSH-10.
+    The ACK timeout starts when a message is written, so messages still queued behind a
+    full window are never timed out."""
+
+    def __init__(self, host, port, window, ack_timeout=MLLP_ACK_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.queue = asyncio.Queue()
+        self.pending = deque()
+        self.slots = asyncio.Semaphore(window)
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.writer_task = asyncio.create_task(self.write_loop())
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=MLLP_READ_LIMIT)
+        self.reader_task = asyncio.create_task(self.read_loop(self.reader))
+
+    async def write_loop(self):
+        while True:
+            message_text, control_id, future = await self.queue.get()
+            # A message whose caller has given up on it is never sent
+            if future.done():
+                continue
+            await self.slots.acquire()
+            if future.done():
+                self.slots.release()
+                continue
+            entry = PendingAck(control_id, future)
+            try:
+                if self.writer is None or self.writer.is_closing():
+                    await self.connect()
+                entry.sent_at = time.time()
+                self.pending.append(entry)
+                self.writer.write(mllp_frame(message_text))
+                entry.timer = asyncio.get_running_loop().call_later(self.ack_timeout, self.expire, entry)
+                await self.writer.drain()
+            except (OSError, asyncio.IncompleteReadError) as e:
+                self.fail_pending(e)
+                self.resolve(entry, AckResult(control_id, None, time.time(), None, str(e)))
+
+    async def read_loop(self, reader):
+        try:
+            while True:
+                ack_text = await read_mllp_frame(reader)
+                if not self.pending:
+                    continue
+                entry = self.pending.popleft()
+                lines = ack_text.splitlines()
+                ack_code = compile_field_path("MSA-1").get_from_lines(lines)
+                acked_id = compile_field_path("MSA-2").get_from_lines(lines)
+                error = None if acked_id == entry.control_id else f"ACK for {acked_id!r} does not match {entry.control_id!r}"
+                self.resolve(entry, AckResult(entry.control_id, ack_code, entry.sent_at, time.time(), error))
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.fail_pending(e)
+            if self.writer is not None:
+                self.writer.close()
+
+    def expire(self, entry):
+        # The entry stays in pending, so a late ACK is still matched to it and discarded
+        # rather than being taken as the next message's ACK; its window slot is freed now
+        self.resolve(entry, AckResult(entry.control_id, None, entry.sent_at, None, "Timed out waiting for ACK"))
+
+    def resolve(self, entry, result):
+        # First outcome wins (ACK, timeout or connection failure) and frees the window slot once
+        if entry.resolved:
+            return
+        entry.resolved = True
+        if entry.timer is not None:
+            entry.timer.cancel()
+        if not entry.future.done():
+            entry.future.set_result(result)
+        self.slots.release()
+
+    def fail_pending(self, error):
+        while self.pending:
+            entry = self.pending.popleft()
+            self.resolve(entry, AckResult(entry.control_id, None, entry.sent_at, None, str(error) or "Connection closed"))
+
+    def send(self, message_text):
+        control_id = compile_field_path("MSH-10").get(message_text) or ""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((message_text, control_id, future))
+        return future
+
+    async def close(self):
+        self.writer_task.cancel()
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+
+class MLLPSender:
+    """Pool of persistent, pipelined MLLP connections to one destination. Messages sharing a
+    key (e.g. an MRN) always use the same connection, so a patient's S12/S14/ADT sequence
+    arrives in order."""
+
+    def __init__(self, host, port, connections=MLLP_CONNECTIONS, window=MLLP_WINDOW, ack_timeout=MLLP_ACK_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.connections = [MLLPConnection(host, port, window, ack_timeout) for _ in range(connections)]
+        self.next_connection = 0
+
+    async def send(self, message_text, key=None):
+        if key is None:
+            connection = self.connections[self.next_connection]
+            self.next_connection = (self.next_connection + 1) % len(self.connections)
+        else:
+            connection = self.connections[hash(key) % len(self.connections)]
+        return await connection.send(message_text)
+
+    async def send_all(self, keyed_messages):
+        """Send (key, message_text) pairs and return their AckResults in the same order."""
+        return await asyncio.gather(*(self.send(message_text, key) for key, message_text in keyed_messages))
+
+    async def close(self):
+        for connection in self.connections:
+            await connection.close()
+
+def send_messages_mllp(host, port, keyed_messages, connections=MLLP_CONNECTIONS, window=MLLP_WINDOW):
+    """Blocking helper: send (key, message_text) pairs over a fresh pool and return the AckResults."""
+    async def run():
+        sender = MLLPSender(host, port, connections=connections, window=window)
+        try:
+            return await sender.send_all(keyed_messages)
+        finally:
+            await sender.close()
+    return asyncio.run(run())
+
+# Message types the local listener accepts; anything else is rejected with AR
+MLLP_ACCEPTED_TYPES = {"SIU^S12", "SIU^S14", "SIU^S15", "ADT^A01"}
+
+ReceivedMessage = namedtuple("ReceivedMessage", ["control_id", "message_type", "received_at", "ack_code", "message_text"])
+
+class MLLPListener:
+    """Local asyncio MLLP endpoint for testing interfaces on one machine. Replies with
+    `ack_code` (or AE for a random `error_rate` fraction) after an optional `delay` in
+    seconds, rejects message types this tool does not generate with AR, and records
+    every message with its receive timestamp."""
+
+    def __init__(self, host="localhost", port=2575, ack_code="AA", delay=0.0, error_rate=0.0, keep_text=True):
+        self.host = host
+        self.port = port
+        self.ack_code = ack_code
+        self.delay = delay
+        self.error_rate = error_rate
+        self.keep_text = keep_text
+        self.server = None
+        self.loop = None
+        self.records = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port, limit=MLLP_READ_LIMIT)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def classify(self, message_text):
+        lines = message_text.splitlines()
+        message_type = "^".join(filter(None, [compile_field_path("MSH-9.1").get_from_lines(lines), compile_field_path("MSH-9.2").get_from_lines(lines)]))
+        if message_type not in MLLP_ACCEPTED_TYPES:
+            return message_type, "AR", f"Unsupported message type {message_type or '(none)'}"
+        if self.error_rate and random.random() < self.error_rate:
+            return message_type, "AE", "Simulated application error"
+        return message_type, self.ack_code, ""
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                message_text = await read_mllp_frame(reader)
+                received_at = time.time()
+                message_type, ack_code, ack_text = self.classify(message_text)
+                control_id = compile_field_path("MSH-10").get(message_text) or ""
+                self.records.append(ReceivedMessage(control_id, message_type, received_at, ack_code, message_text if self.keep_text else None))
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(mllp_frame(build_ack(message_text, ack_code, ack_text)))
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def start_in_thread(self):
+        """Run the listener on its own event loop in a daemon thread (for the GUI)."""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.loop.run_until_complete(self.start())
+            except OSError as e:
+                errors.append(e)
+                ready.set()
+                self.loop.close()
+                return
+            ready.set()
+            self.loop.run_forever()
+            self.loop.close()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def summary(self):
+        counts = {}
+        for record in self.records:
+            counts[record.message_type] = counts.get(record.message_type, 0) + 1
+        lines = [f"Received {len(self.records)} messages on port {self.port}"]
+        if len(self.records) > 1:
+            span = self.records[-1].received_at - self.records[0].received_at
+            lines.append(f"Throughput: {len(self.records) / max(span, 1e-6):.0f} msg/s over {span:.2f}s")
+        lines.extend(f"{message_type or '(none)'}: {count}" for message_type, count in sorted(counts.items()))
+        return "\n".join(lines)
+
+def summarize_latencies(latencies):
+    if not latencies:
+        return None
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "avg": sum(ordered) / len(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+def one_way_latencies(results, records):
+    """Match sender AckResults to listener records by MSH-10, in order of occurrence, and
+    return the send-to-receive delay of each matched message."""
+    received = {}
+    for record in records:
+        received.setdefault(record.control_id, deque()).append(record.received_at)
+    latencies = []
+    for result in results:
+        arrivals = received.get(result.control_id)
+        if result.sent_at is not None and arrivals:
+            latencies.append(arrivals.popleft() - result.sent_at)
+    return latencies
+
+class DeliveryError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+class FanOutDestination:
+    """One fan-out target with its own bounded queue, delivery workers and counters.
+    overflow="block" makes publishers wait for room when the queue is full, so nothing is
+    lost and memory stays bounded; overflow="drop_oldest" discards the oldest queued
+    message instead, so publishing never waits on this destination."""
+
+    def __init__(self, name, queue_size=FANOUT_QUEUE_SIZE, overflow="block", in_flight=FANOUT_IN_FLIGHT,
+                 attempts=FANOUT_ATTEMPTS, retry_delay=FANOUT_RETRY_DELAY):
+        self.name = name
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.in_flight = in_flight
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.last_error = None
+
+    async def open(self):
+        self.queue = asyncio.Queue(self.queue_size)
+        self.slots = asyncio.Semaphore(self.in_flight)
+        self.tasks = set()
+        self.key_tails = {}  # Latest delivery task per key; each one waits for the one before it
+        self.worker = asyncio.create_task(self.work())
+
+    async def publish(self, key, message_text):
+        if self.overflow == "drop_oldest":
+            while self.queue.full():
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.dropped += 1
+            self.queue.put_nowait((key, message_text))
+        else:
+            await self.queue.put((key, message_text))
+
+    async def work(self):
+        while True:
+            key, message_text = await self.queue.get()
+            await self.slots.acquire()
+            task = asyncio.create_task(self.deliver_with_retry(key, message_text, self.key_tails.get(key)))
+            self.key_tails[key] = task
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            task.add_done_callback(lambda task, key=key: self.release_key(key, task))
+
+    def release_key(self, key, task):
+        if self.key_tails.get(key) is task:
+            del self.key_tails[key]
+
+    async def deliver_with_retry(self, key, message_text, previous=None):
+        """Deliveries for different keys run concurrently, but one for the same key waits until
+        the previous one has finished, including its retries, so each key stays in order."""
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            for attempt in range(self.attempts):
+                try:
+                    await self.deliver(key, message_text)
+                    self.delivered += 1
+                    return
+                except (DeliveryError, OSError) as e:
+                    self.last_error = str(e)
+                    if attempt == self.attempts - 1 or not getattr(e, "retryable", True):
+                        break
+                    self.retried += 1
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+            self.failed += 1
+        finally:
+            self.slots.release()
+            self.queue.task_done()
+
+    async def deliver(self, key, message_text):
+        raise NotImplementedError
+
+    async def close(self):
+        await self.queue.join()
+        self.worker.cancel()
+
+    def summary(self):
+        line = f"{self.name}: {self.delivered} delivered, {self.failed} failed, {self.retried} retries, {self.dropped} dropped"
+        return line + (f" (last error: {self.last_error})" if self.failed and self.last_error else "")
+
+class MLLPDestination(FanOutDestination):
+    def __init__(self, host, port, **kwargs):
+        super().__init__(f"mllp://{host}:{port}", **kwargs)
+        self.host = host
+        self.port = port
+
+    async def open(self):
+        await super().open()
+        self.sender = MLLPSender(self.host, self.port, window=self.in_flight)
+
+    async def deliver(self, key, message_text):
+        result = await self.sender.send(message_text, key)
+        if result.error:
+            raise DeliveryError(result.error)
+        if result.ack_code in ("AR", "CR"):
+            raise DeliveryError(f"Rejected with {result.ack_code}", retryable=False)
+        if result.ack_code not in ("AA", "CA"):
+            raise DeliveryError(f"Application error {result.ack_code}")
+
+    async def close(self):
+        await super().close()
+        await self.sender.close()
+
+class FileDestination(FanOutDestination):
+    def __init__(self, directory, **kwargs):
+        super().__init__(f"file://{directory}", **kwargs)
+        self.directory = directory
+        self.counter = itertools.count()
+
+    async def deliver(self, key, message_text):
+        file_name = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', str(key))}-{next(self.counter):06}.hl7"
+        await asyncio.to_thread(atomic_write_text, os.path.join(self.directory, file_name), message_text)
+
+class StdoutDestination(FanOutDestination):
+    def __init__(self, **kwargs):
+        super().__init__("stdout", **kwargs)
+
+    async def deliver(self, key, message_text):
+        # Windowed and packaged builds run without a console
+        if sys.stdout is None:
+            raise DeliveryError("No console to write to", retryable=False)
+        sys.stdout.write(message_text.strip() + "\n\n")
+
+def parse_destination(spec, **kwargs):
+    """mllp://host:port (or plain host:port), file://directory or stdout."""
+    spec = spec.strip()
+    if spec == "stdout":
+        return StdoutDestination(**kwargs)
+    if spec.startswith("file://"):
+        directory = spec[len("file://"):]
+        if not os.path.isdir(directory):
+            raise ValueError(f"Not a directory: {directory}")
+        return FileDestination(directory, **kwargs)
+    host, _, port = spec[len("mllp://"):].rpartition(":") if spec.startswith("mllp://") else spec.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Unrecognized destination: {spec}")
+    return MLLPDestination(host, int(port), **kwargs)
+
+class FanOutSender:
+    """Publishes every message to all destinations. Each destination has its own inbox of
+    queue_size messages and a feeder task moving them into its queue, so the destinations
+    drain independently. The destination's overflow policy also applies to its inbox: with
+    "block", publish() waits only once a destination has a full inbox and queue behind it;
+    with "drop_oldest" it never waits and the oldest inbox message is dropped."""
+
+    def __init__(self, destinations):
+        self.destinations = destinations
+        self.feeders = []
+
+    async def open(self):
+        for destination in self.destinations:
+            await destination.open()
+            inbox = asyncio.Queue(destination.queue_size)
+            self.feeders.append((destination, inbox, asyncio.create_task(self.feed(destination, inbox))))
+
+    async def feed(self, destination, inbox):
+        while True:
+            item = await inbox.get()
+            if item is None:
+                return
+            await destination.publish(*item)
+
+    async def publish(self, key, message_text):
+        for destination, inbox, _ in self.feeders:
+            if destination.overflow == "drop_oldest":
+                while inbox.full():
+                    inbox.get_nowait()
+                    destination.dropped += 1
+                inbox.put_nowait((key, message_text))
+            else:
+                await inbox.put((key, message_text))
+
+    async def close(self):
+        for _, inbox, _ in self.feeders:
+            await inbox.put(None)
+        await asyncio.gather(*(feeder for _, _, feeder in self.feeders))
+        await asyncio.gather(*(destination.close() for destination in self.destinations))
+
+def fan_out_messages(destinations, keyed_messages):
+    """Blocking helper: publish (key, message_text) pairs to all destinations and wait for delivery."""
+    async def run():
+        sender = FanOutSender(destinations)
+        await sender.open()
+        try:
+            for key, message_text in keyed_messages:
+                await sender.publish(key, message_text)
+        finally:
+            await sender.close()
+    asyncio.run(run())
+
+def hl7_timestamp(value):
+    # Leading YYYYMMDDHHMMSS of a DTM value; None for placeholders or partial values
+    digits = value[:14] if value else ""
+    if len(digits) < 12 or not digits.isdigit():
+        return None
+    try:
+        return datetime.strptime(digits.ljust(14, "0"), "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+
+class ReplayScheduler:
+    """Heap-ordered replay of case messages at their MSH-7 times, in real time (speed 1)
+    or on an accelerated clock (speed N runs N times faster). The simulated clock starts
+    at the earliest queued message."""
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.heap = []
+        self.counter = itertools.count()
+        self.stopping = False
+        self.emitted = 0
+
+    def add(self, due, key, message_text):
+        heapq.heappush(self.heap, (due, next(self.counter), key, message_text))
+
+    def add_case(self, key, messages):
+        """Queue one case's messages. Scheduling (S12) and admission (ADT) messages carry the
+        scheduled time, so they are pulled forward to the case's first event to keep them
+        ahead of its S14 updates."""
+        timed = []
+        for message_text in messages:
+            lines = message_text.splitlines()
+            timed.append((hl7_timestamp(compile_field_path("MSH-7").get_from_lines(lines)),
+                          compile_field_path("MSH-9.2").get_from_lines(lines), message_text))
+        event_times = [due for due, trigger, _ in timed if trigger == "S14" and due is not None]
+        first_event = min(event_times) if event_times else None
+        previous = None
+        for due, trigger, message_text in timed:
+            if due is None:
+                due = previous or first_event or datetime.now()
+            elif trigger in ("S12", "A01") and first_event is not None:
+                due = min(due, first_event)
+            self.add(due, key, message_text)
+            previous = due
+
+    async def run(self, emit):
+        """Call emit(key, message_text) for each message when it falls due. Awaitables
+        returned by emit run concurrently and are awaited before run() returns."""
+        if not self.heap:
+            return
+        simulated_start = self.heap[0][0]
+        wall_start = time.monotonic()
+        in_flight = set()
+        while self.heap and not self.stopping:
+            due = self.heap[0][0]
+            wait = (due - simulated_start).total_seconds() / self.speed - (time.monotonic() - wall_start)
+            if wait > 0:
+                await asyncio.sleep(min(wait, 0.5))
+                continue
+            _, _, key, message_text = heapq.heappop(self.heap)
+            result = emit(key, message_text)
+            if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+                task = asyncio.ensure_future(result)
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            self.emitted += 1
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+def group_by_key(keyed_messages):
+    groups = {}
+    for key, message_text in keyed_messages:
+        groups.setdefault(key, []).append(message_text)
+    return groups
+
+# Segment layout of the messages this tool emits: (segment, required, repeats, max fields).
+# Field limits follow HL7 2.5, widened where the templates pad segments (OBX, NTE).
+message_structures = {
+    "SIU": [
+        ("MSH", True, False, 21),
+        ("SCH", True, False, 27),
+        ("ZCS", False, False, 10),
+        ("PID", True, False, 39),
+        ("PV1", False, False, 52),
+        ("RGS", True, False, 3),
+        ("OBX", False, True, 32),
+        ("AIS", False, True, 12),
+        ("NTE", False, True, 7),
+        ("AIG", False, True, 14),
+        ("AIL", False, True, 12),
+        ("AIP", False, True, 12),
+    ],
+    "ADT": [
+        ("MSH", True, False, 21),
+        ("EVN", True, False, 7),
+        ("PID", True, False, 39),
+        ("PV1", True, False, 52),
+        ("PV2", False, False, 49),
+        ("AL1", False, True, 6),
+    ],
+}
+
+# Repeating groups within a structure, as (first segment, last segment). After any segment of
+# a group, its first segment may appear again to start the next repetition, e.g. AIS NTE AIS NTE
+# for a case with two procedures.
+segment_groups = {
+    "SIU": [("AIS", "NTE")],
+}
+
+# Datatype checks by segment (empty values are allowed). OBX-5 takes its type from OBX-2.
+field_datatypes = {
+    "MSH": {"MSH-7": "DTM"},
+    "SCH": {"SCH-9": "NM", "SCH-11.4": "DTM"},
+    "PID": {"PID-1": "NM", "PID-7": "DTM"},
+    "PV1": {"PV1-44": "DTM"},
+    "EVN": {"EVN-2": "DTM"},
+    "OBX": {"OBX-1": "NM", "OBX-14": "DTM"},
+    "AIS": {"AIS-1": "NM", "AIS-4": "DTM", "AIS-5": "NM", "AIS-7": "NM"},
+    "NTE": {"NTE-1": "NM"},
+    "AIG": {"AIG-1": "NM", "AIG-8": "DTM", "AIG-9": "NM", "AIG-11": "NM"},
+    "AIL": {"AIL-1": "NM"},
+    "AIP": {"AIP-1": "NM", "AIP-6": "DTM", "AIP-7": "NM", "AIP-9": "NM"},
+    "AL1": {"AL1-1": "NM"},
+}
+datatype_patterns = {
+    "DTM": re.compile(r"\d{4}(\d{2}(\d{2}(\d{2}(\d{2}(\d{2}(\.\d{1,4})?)?)?)?)?)?([+-]\d{4})?"),
+    "NM": re.compile(r"[+-]?(\d+(\.\d*)?|\.\d+)"),
+}
+_datatype_checks = {
+    segment: [(compile_field_path(path), datatype_patterns[datatype], path, datatype) for path, datatype in checks.items()]
+    for segment, checks in field_datatypes.items()
+}
+_structure_positions = {key: {rule[0]: i for i, rule in enumerate(rules)} for key, rules in message_structures.items()}
+_group_ends = {key: {_structure_positions[key][first]: _structure_positions[key][last] for first, last in groups}
+               for key, groups in segment_groups.items()}
+_message_type = compile_field_path("MSH-9")
+_obx_value = compile_field_path("OBX-5")
+PLACEHOLDER_RE = re.compile(r"\{\w+\}")
+
+def validate_structure(message_text):
+    """Quick structural check of one message. Returns a list of problems, empty if none."""
+    errors = []
+    lines = [(number, line) for number, line in enumerate(message_text.splitlines(), 1) if line.strip()]
+    if not lines or not lines[0][1].startswith("MSH|"):
+        return ["Message must start with an MSH segment"]
+    message_type = _message_type.get_from_segment(lines[0][1]) or ""
+    structure = message_structures.get(message_type.split("^")[0])
+    if structure is None:
+        return [f"line {lines[0][0]}: Unsupported message type '{message_type}'"]
+    positions = _structure_positions[message_type.split("^")[0]]
+    group_ends = _group_ends.get(message_type.split("^")[0], {})
+    has_placeholders = "{" in message_text
+    position = 0
+    seen = set()
+    for number, line in lines:
+        if has_placeholders:
+            for placeholder in PLACEHOLDER_RE.findall(line):
+                errors.append(f"line {number}: Unfilled placeholder {placeholder}")
+        name = line[:3]
+        parts = line.split("|")
+        # Segments must follow the structure's order; repeatable ones may recur in place,
+        # and a repeating group may start over from its first segment
+        i = positions.get(name)
+        restarts_group = i is not None and i < position <= group_ends.get(i, -1)
+        if i is None or (i < position and not restarts_group):
+            errors.append(f"line {number}: {'Unexpected' if i is None else 'Out of order'} segment {name}")
+            continue
+        if name in seen and not structure[i][2]:
+            errors.append(f"line {number}: Segment {name} may only appear once")
+        position = i
+        seen.add(name)
+        field_count = len(parts) - 1 + (name == "MSH")
+        if field_count > structure[i][3]:
+            errors.append(f"line {number}: {name} has {field_count} fields, at most {structure[i][3]} allowed")
+        for accessor, pattern, path, datatype in _datatype_checks.get(name, ()):
+            if len(parts) <= accessor.field_index:
+                continue
+            value = parts[accessor.field_index]
+            # A whole field that matches has no separators, so every component of it is valid too
+            if not value or pattern.fullmatch(value):
+                continue
+            value = accessor.get_from_fields(parts)
+            if value and not pattern.fullmatch(value):
+                errors.append(f"line {number}: {path} '{value}' is not a valid {datatype}")
+        if name == "OBX" and len(parts) > 2 and parts[2] in datatype_patterns:
+            value = _obx_value.get_from_fields(parts)
+            if value and not datatype_patterns[parts[2]].fullmatch(value):
+                errors.append(f"line {number}: OBX-5 '{value}' is not a valid {parts[2]}")
+    for name, required, repeats, max_fields in structure:
+        if required and name not in seen:
+            errors.append(f"Missing required segment {name}")
+    return errors
+
+def normalize_message(message_text):
+    # Segment separators and blank lines don't change what hl7apy sees
+    return "\r".join(line.rstrip() for line in message_text.splitlines() if line.strip())
+
+def message_hash(message_text):
+    return hashlib.sha256(normalize_message(message_text).encode("utf-8")).hexdigest()
+
+def deep_validate(message_text):
+    """Full hl7apy parse and validation against the HL7 2.5 reference. Returns a list of problems."""
+    if parse_message is None:
+        raise RuntimeError("hl7apy is not installed")
+    try:
+        parse_message(normalize_message(message_text), validation_level=VALIDATION_LEVEL.STRICT, find_groups=True).validate()
+    except Exception as e:  # hl7apy raises a range of parse and validation errors
+        return [str(e)]
+    return []
+
+class ValidationCache:
+    """Deep validation results keyed by message hash, kept in a local SQLite file."""
+    LOOKUP_BATCH = 500  # Stay well under SQLite's bound-parameter limit
+
+    def __init__(self, path=VALIDATION_CACHE_PATH):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS validations (hash TEXT PRIMARY KEY, errors TEXT NOT NULL, validated_at REAL NOT NULL)"
+        )
+
+    def lookup(self, hashes):
+        hashes = list(hashes)
+        found = {}
+        for start in range(0, len(hashes), self.LOOKUP_BATCH):
+            batch = hashes[start:start + self.LOOKUP_BATCH]
+            rows = self.connection.execute(
+                f"SELECT hash, errors FROM validations WHERE hash IN ({','.join('?' * len(batch))})", batch
+            )
+            found.update((digest, json.loads(errors)) for digest, errors in rows)
+        return found
+
+    def store(self, results):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO validations VALUES (?, ?, ?)",
+                [(digest, json.dumps(errors), now) for digest, errors in results.items()]
+            )
+
+    def close(self):
+        self.connection.close()
+
+def deep_validate_corpus(message_texts, cache_path=VALIDATION_CACHE_PATH, workers=None):
+    """Deep-validate many messages across a process pool, skipping any whose normalized text
+    has been validated before. Returns (errors per message, number actually parsed)."""
+    hashes = [message_hash(text) for text in message_texts]
+    cache = ValidationCache(cache_path)
+    try:
+        results = cache.lookup(set(hashes))
+        pending = {}
+        for digest, text in zip(hashes, message_texts):
+            if digest not in results:
+                pending.setdefault(digest, text)
+        if pending:
+            # Small batches aren't worth the cost of starting worker processes
+            if len(pending) < PARALLEL_VALIDATION_THRESHOLD:
+                fresh = {digest: deep_validate(text) for digest, text in pending.items()}
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    chunksize = max(1, len(pending) // (4 * (workers or os.cpu_count() or 1)))
+                    fresh = dict(zip(pending, pool.map(deep_validate, pending.values(), chunksize=chunksize)))
+            cache.store(fresh)
+            results.update(fresh)
+    finally:
+        cache.close()
+    return [results[digest] for digest in hashes], len(pending)
+
+def text_lines(text):
+    """Split text into lines the way a Text widget counts them, keeping each newline."""
+    lines = text.split("\n")
+    last = lines.pop()
+    lines = [line + "\n" for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+SEPARATOR_RE = re.compile(r"[|^~&]")
+
+class SyntaxHighlighter:
+    """Colors segment names, separators and unfilled placeholders in a Text widget.
+
+    Only the lines passed to tag_lines() are re-tagged. Token positions are cached by
+    line text, so segments repeated across messages are scanned once.
+    """
+    tags = ("hl7_segment", "hl7_separator", "hl7_placeholder")
+    cache_limit = 4096
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.line_tokens = {}
+        widget.tag_configure("hl7_segment", foreground=SEGMENT_NAME_COLOR)
+        widget.tag_configure("hl7_separator", foreground=SEPARATOR_COLOR)
+        widget.tag_configure("hl7_placeholder", foreground=PLACEHOLDER_COLOR)
+
+    def tokens(self, line):
+        """(segment name length, separator columns, placeholder spans) for one line."""
+        tokens = self.line_tokens.get(line)
+        if tokens is None:
+            if len(self.line_tokens) >= self.cache_limit:
+                self.line_tokens.clear()
+            is_segment = len(line) >= 3 and line[:3].isalnum() and (len(line) == 3 or line[3] == "|")
+            tokens = self.line_tokens[line] = (
+                3 if is_segment else 0,
+                tuple(match.start() for match in SEPARATOR_RE.finditer(line)),
+                tuple(match.span() for match in PLACEHOLDER_RE.finditer(line)),
+            )
+        return tokens
+
+    def tag_lines(self, first, end):
+        """Re-tag the 0-based lines [first, end)."""
+        if end <= first:
+            return
+        widget = self.widget
+        start_index, end_index = f"{first + 1}.0", f"{end + 1}.0"
+        for tag in self.tags:
+            widget.tag_remove(tag, start_index, end_index)
+        segments, separators, placeholders = [], [], []
+        for row, line in enumerate(widget.get(start_index, end_index).split("\n")[:end - first], start=first + 1):
+            name_length, separator_columns, placeholder_spans = self.tokens(line)
+            if name_length:
+                segments += (f"{row}.0", f"{row}.{name_length}")
+            for column in separator_columns:
+                separators += (f"{row}.{column}", f"{row}.{column + 1}")
+            for start, stop in placeholder_spans:
+                placeholders += (f"{row}.{start}", f"{row}.{stop}")
+        # One call per tag for the whole range
+        for tag, indexes in zip(self.tags, (segments, separators, placeholders)):
+            if indexes:
+                widget.tag_add(tag, *indexes)
+
+class PreviewRenderer:
+    """Keeps a Text widget showing a given text while touching only the lines that change.
+
+    Replacements longer than one chunk are inserted a chunk at a time from idle callbacks
+    so very large messages don't freeze the UI. A newer render drops chunks still pending;
+    text() inserts them first so callers always read the complete text.
+    """
+
+    def __init__(self, widget, chunk_lines=PREVIEW_CHUNK_LINES, highlighter=None):
+        self.widget = widget
+        self.chunk_lines = chunk_lines
+        self.highlighter = highlighter
+        self.pending = None  # (after id, line to insert at, lines still to insert)
+
+    def render(self, text):
+        """Show text; returns the (first, end) 0-based line range that was replaced, or None."""
+        self.cancel()
+        widget = self.widget
+        old_lines = text_lines(widget.get("1.0", "end-1c"))
+        new_lines = text_lines(text)
+        limit = min(len(old_lines), len(new_lines))
+        start = 0
+        while start < limit and old_lines[start] == new_lines[start]:
+            start += 1
+        if start == len(old_lines) == len(new_lines):
+            return None
+        end = 0
+        while end < limit - start and old_lines[-1 - end] == new_lines[-1 - end]:
+            end += 1
+        changed = new_lines[start:len(new_lines) - end]
+        state = widget.cget("state")
+        widget.config(state="normal")
+        widget.delete(f"{start + 1}.0", f"{len(old_lines) - end + 1}.0")
+        widget.insert(f"{start + 1}.0", "".join(changed[:self.chunk_lines]))
+        widget.config(state=state)
+        if self.highlighter is not None:
+            self.highlighter.tag_lines(start, start + min(len(changed), self.chunk_lines))
+        if len(changed) > self.chunk_lines:
+            line = start + 1 + self.chunk_lines
+            self.pending = (widget.after_idle(self._insert_chunk), line, changed[self.chunk_lines:])
+        return start, start + len(changed)
+
+    def _insert_chunk(self):
+        _, line, remaining = self.pending
+        chunk = remaining[:self.chunk_lines]
+        self._insert(line, chunk)
+        if len(remaining) > self.chunk_lines:
+            self.pending = (self.widget.after_idle(self._insert_chunk), line + len(chunk), remaining[self.chunk_lines:])
+        else:
+            self.pending = None
+
+    def _insert(self, line, lines):
+        state = self.widget.cget("state")
+        self.widget.config(state="normal")
+        self.widget.insert(f"{line}.0", "".join(lines))
+        self.widget.config(state=state)
+        if self.highlighter is not None:
+            self.highlighter.tag_lines(line - 1, line - 1 + len(lines))
+
+    def cancel(self):
+        if self.pending is not None:
+            self.widget.after_cancel(self.pending[0])
+            self.pending = None
+
+    def flush(self):
+        if self.pending is not None:
+            _, line, remaining = self.pending
+            self.cancel()
+            self._insert(line, remaining)
+
+    def text(self):
+        self.flush()
+        return self.widget.get("1.0", "end-1c")
+
+def new_staff_entry(role=None, staff_id="{staffID}"):
+    staff = {"lastName": "", "firstName": "", "id": staff_id}
+    if role is not None:
+        staff["role"] = role
+    return staff
+
+class PatientRecord:
+    """One Creator patient as plain strings. Only the patient on screen is bound to Tk variables,
+    so records are cheap to keep by the thousand and can be handed to worker threads or processes."""
+    __slots__ = ("base_values", "procedure_specialty", "message_type", "fixed_staff", "additional_surgeons",
+                 "staff_members", "procedures", "allergies", "messages", "case_record", "session_line")
+
+    def __init__(self):
+        self.base_values = {p['key']: 'IP' if p['key'] == '{encounterType}' else '' for p in base_prompts}
+        self.procedure_specialty = "GEN"
+        self.message_type = "Scheduled & Case Events"
+        self.fixed_staff = {role_info["role"]: new_staff_entry(staff_id="{surgeonID}" if role_info["role"] == "Primary Surgeon" else "{staffID}")
+                            for role_info in fixed_roles}
+        self.additional_surgeons = []
+        self.staff_members = []
+        self.procedures = []
+        self.allergies = []
+        self.messages = []
+        self.case_record = None
+        self.session_line = None  # JSON line of a restored record not yet parsed
+
+    @classmethod
+    def from_session_line(cls, line):
+        record = cls.__new__(cls)
+        record.session_line = line
+        return record
+
+    def __getattr__(self, name):
+        # Only reached for unset slots: a restored record parses its session line on first use
+        if name == "session_line" or name not in PatientRecord.__slots__ or self.session_line is None:
+            raise AttributeError(name)
+        self.load_session_line(self.session_line)
+        return getattr(self, name)
+
+    def load_session_line(self, line):
+        self.load_session_data(json.loads(line))
+
+    def load_session_data(self, data):
+        self.__init__()
+        self.base_values.update(data["base_values"])
+        self.procedure_specialty = data["procedure_specialty"]
+        self.message_type = data["message_type"]
+        self.fixed_staff.update(data["fixed_staff"])
+        self.additional_surgeons = data["additional_surgeons"]
+        self.staff_members = data["staff_members"]
+        self.procedures = data["procedures"]
+        self.allergies = data["allergies"]
+        self.messages = [tuple(message) for message in data["messages"]]
+        case_record = data["case_record"]
+        if case_record is not None:
+            case_record["start"] = case_record["start"] and datetime.fromisoformat(case_record["start"])
+            case_record["event_times"] = {name: datetime.fromisoformat(dt) for name, dt in case_record["event_times"].items()}
+            case_record["staff"] = [tuple(staff) for staff in case_record["staff"]]
+        self.case_record = case_record
+
+    def to_session_line(self):
+        # A restored record nobody has looked at is written back unchanged, without parsing it
+        if self.session_line is not None:
+            return self.session_line
+        case_record = self.case_record
+        if case_record is not None:
+            case_record = dict(case_record, start=case_record["start"] and case_record["start"].isoformat(),
+                               event_times={name: dt.isoformat() for name, dt in case_record["event_times"].items()})
+        return json.dumps({
+            "base_values": self.base_values,
+            "procedure_specialty": self.procedure_specialty,
+            "message_type": self.message_type,
+            "fixed_staff": self.fixed_staff,
+            "additional_surgeons": self.additional_surgeons,
+            "staff_members": self.staff_members,
+            "procedures": self.procedures,
+            "allergies": self.allergies,
+            "messages": self.messages,
+            "case_record": case_record,
+        }, separators=(",", ":"))
+
+    def field_path(self, store, key):
+        """Path of store[key] within this record, as written to the autosave journal; None if not found."""
+        if store is self.base_values:
+            return ["base_values", key]
+        for role, staff in self.fixed_staff.items():
+            if staff is store:
+                return ["fixed_staff", role, key]
+        for name in ("procedures", "staff_members", "additional_surgeons"):
+            for index, item in enumerate(getattr(self, name)):
+                if item is store:
+                    return [name, index, key]
+        return None
+
+    def set_field(self, path, value):
+        if len(path) == 1:
+            setattr(self, path[0], value)
+            return
+        target = getattr(self, path[0])
+        for key in path[1:-1]:
+            target = target[key]
+        target[path[-1]] = value
+
+def write_session(path, patients, current_index, last_mrn):
+    header = {"format": SESSION_FORMAT, "version": SESSION_VERSION, "patients": len(patients),
+              "current": current_index, "last_mrn": last_mrn}
+    lines = [json.dumps(header)]
+    lines.extend(patient.to_session_line() for patient in patients)
+    atomic_write_text(path, "\n".join(lines) + "\n")
+
+def read_session(path):
+    """Returns (patients, header). Patient lines are kept as text until each record is first used."""
+    with open(path, 'r') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get("format") != SESSION_FORMAT:
+            raise ValueError(f"{os.path.basename(path)} is not a Creator session file")
+        if header["version"] > SESSION_VERSION:
+            raise ValueError(f"{os.path.basename(path)} was saved by a newer version of this application")
+        patients = [PatientRecord.from_session_line(line.rstrip("\n")) for line in f if line.strip()]
+    if len(patients) != header["patients"]:
+        raise ValueError(f"{os.path.basename(path)} is truncated")
+    return patients, header
+
+class Journal:
+    """Append-only JSON lines log of edits. append() only queues a record; a writer thread
+    writes what has queued up in batches, with one fsync per batch. If a write fails the
+    thread stops, keeps the error in `error` and later records are dropped."""
+
+    def __init__(self, path, flush_interval=JOURNAL_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.appended = 0  # Records since the journal was last compacted
+        self.condition = threading.Condition()
+        self.io_lock = threading.Lock()  # Held while the file is written or replaced
+        self.closing = threading.Event()
+        self.error = None
+        self.file = open(path, 'a')
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def append(self, record):
+        self.append_line(json.dumps(record, separators=(",", ":")))
+
+    def append_line(self, line):
+        with self.condition:
+            if self.error is not None:
+                return
+            self.pending.append(line)
+            self.appended += 1
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closing.is_set():
+                    self.condition.wait()
+            if not self.closing.is_set():
+                self.closing.wait(self.flush_interval)
+            with self.io_lock:
+                with self.condition:
+                    batch = self.pending
+                    self.pending = []
+                try:
+                    if batch:
+                        self.file.write("\n".join(batch) + "\n")
+                        self.file.flush()
+                        os.fsync(self.file.fileno())
+                except OSError as e:
+                    with self.condition:
+                        self.error = e
+                        self.pending = []
+                    return
+            if self.closing.is_set() and not batch:
+                return
+
+    def compact(self, lines):
+        """Replace the journal with lines that rebuild the current state. Records still queued
+        are dropped, as the snapshot was taken after they were made. If the replace fails the
+        journal is left as it was and appending carries on."""
+        with self.io_lock:
+            # Windows cannot replace a file that is still open
+            self.file.close()
+            try:
+                atomic_write_text(self.path, "".join(line + "\n" for line in lines))
+            finally:
+                self.file = open(self.path, 'a')
+            with self.condition:
+                self.pending = []
+                self.appended = 0
+
+    def close(self):
+        self.closing.set()
+        with self.condition:
+            self.condition.notify()
+        self.thread.join()
+        try:
+            self.file.close()
+        except OSError:
+            pass  # Unwritten data after a failed write; the error has already been reported
+
+def read_journal(path):
+    """Records in a journal, stopping at a torn last line left by a crash mid-write."""
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+def lock_file(path):
+    """Open path and take an exclusive lock on it, returning the open file, or None if
+    another process holds the lock. The OS drops the lock when its holder exits, so a
+    crashed instance never leaves a stale lock behind."""
+    f = open(path, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    f.seek(0)
+    f.truncate()
+    f.write(f"{os.getpid()}\n")  # For whoever finds the lock file; the lock itself is what counts
+    f.flush()
+    return f
+
 # Custom UppercaseEntry widget with dynamic width
 class UppercaseEntry(tk.Entry):
     def __init__(self, master, base_width=20, min_width=10, *args, **kwargs):
@@ -112,6 +2254,8 @@ class HL7MessageApp:
         self.default_height = 1232
         self.root.geometry(f"{self.default_width}x{self.default_height}")
         self.root.minsize(800, 600)
+        # Closing the window is a normal quit, so it confirms and discards the autosave journal too
+        self.root.protocol("WM_DELETE_WINDOW", self.quit)
         self.entry_widgets = []
         self.root.bind("<Configure>", self.on_window_resize)
 
@@ -123,6 +2267,8 @@ class HL7MessageApp:
         self.root.bind('<Control-q>', lambda event: self.quit())
         self.root.bind('<Control-e>', lambda event: self.set_mode("Editor"))
         self.root.bind('<Control-r>', lambda event: self.set_mode("Creator"))
+        self.root.bind('<Control-z>', lambda event: self.editor_undo() if self.mode == "Editor" else None)
+        self.root.bind('<Control-y>', lambda event: self.editor_redo() if self.mode == "Editor" else None)
 
         # Set dark theme for ttk widgets
         style = ttk.Style()
@@ -139,6 +2285,8 @@ class HL7MessageApp:
             self.procedures = pd.read_csv(os.path.join(DATA_DIR, "procedures.csv"))
             self.staff_names = pd.read_csv(os.path.join(DATA_DIR, "staff_names.csv"))
             self.surgeon_names = pd.read_csv(os.path.join(DATA_DIR, "surgeon_names.csv"))
+            self.surgeon_index = build_surgeon_index(self.surgeon_names)
+            self.surgeons_by_id = {str(row["ID"]): row for _, row in self.surgeon_names.iterrows()}
             self.patient_names = pd.read_csv(os.path.join(DATA_DIR, "patient_names.csv"))
             self.allergies = pd.read_csv(os.path.join(DATA_DIR, "allergies.csv"))
         except Exception as e:
@@ -155,6 +2303,7 @@ class HL7MessageApp:
         self.current_block = -1
         self.patient_blocks = []
         self.edited_messages = {}
+        self.edit_history = EditHistory()
         self.manual_entries = {}
         self.edit_fields = []
         self.last_mrn = 999  # Starting MRN for random patients
@@ -163,6 +2312,8 @@ class HL7MessageApp:
         self.matched_procedures = []  # List to store matched procedure items for navigation
         self.current_match_index = -1  # Index for navigating through matches
         self.autocomplete_suggestion = None  # Store autocomplete suggestion
+        self.mllp_listener = None  # Local MLLP listener started from the Tools menu
+        self.replay_scheduler = None  # Case-event replay started from the Tools menu
 
         # Menu bar
         self.menu_bar = tk.Menu(root)
@@ -170,14 +2321,42 @@ class HL7MessageApp:
         self.file_menu = tk.Menu(self.menu_bar, tearoff=0, font=DEFAULT_FONT)
         self.file_menu.add_command(label="New Patient (Ctrl+N)", command=self.create_new_patient)
         self.file_menu.add_command(label="Open File(s) (Ctrl+O)", command=self.open_files)
+        self.file_menu.add_command(label="Open from Corpus Store...", command=self.open_from_corpus)
+        self.file_menu.add_command(label="Open Session...", command=self.open_session)
         self.file_menu.add_command(label="Save (Ctrl+S)", command=self.save_files)
+        self.file_menu.add_command(label="Save All Messages", command=lambda: self.editor_save_files(only_dirty=False))
         self.file_menu.add_command(label="Save & Exit (Ctrl+Shift+S)", command=self.save_and_exit)
+        self.file_menu.add_command(label="Save Session...", command=self.save_session)
+        self.file_menu.add_command(label="Save as Archive...", command=self.save_archive)
+        self.file_menu.add_command(label="Save to Corpus Store...", command=self.save_to_corpus)
+        self.file_menu.add_command(label="Export Case Data...", command=self.export_case_data)
+        self.file_menu.add_command(label="Send via MLLP...", command=self.send_via_mllp)
+        self.file_menu.add_command(label="Fan Out to Destinations...", command=self.fan_out)
         self.file_menu.add_command(label="Quit (Ctrl+Q)", command=self.quit)
         self.menu_bar.add_cascade(label="File", menu=self.file_menu)
+        self.edit_menu = tk.Menu(self.menu_bar, tearoff=0, font=DEFAULT_FONT)
+        self.edit_menu.add_command(label="Undo (Ctrl+Z)", command=self.editor_undo)
+        self.edit_menu.add_command(label="Redo (Ctrl+Y)", command=self.editor_redo)
+        self.menu_bar.add_cascade(label="Edit", menu=self.edit_menu)
         view_menu = tk.Menu(self.menu_bar, tearoff=0, font=DEFAULT_FONT)
         view_menu.add_command(label="Creator (Ctrl+R)", command=lambda: self.set_mode("Creator"))
         view_menu.add_command(label="Editor (Ctrl+E)", command=lambda: self.set_mode("Editor"))
         self.menu_bar.add_cascade(label="View", menu=view_menu)
+        self.tools_menu = tk.Menu(self.menu_bar, tearoff=0, font=DEFAULT_FONT)
+        self.tools_menu.add_command(label="Generate OR Day...", command=self.generate_or_day)
+        self.tools_menu.add_separator()
+        self.tools_menu.add_command(label="Start MLLP Listener...", command=self.start_mllp_listener)
+        self.tools_menu.add_command(label="Stop MLLP Listener", command=self.stop_mllp_listener, state="disabled")
+        self.tools_menu.add_separator()
+        self.tools_menu.add_command(label="Replay Case Events...", command=self.start_replay)
+        self.tools_menu.add_command(label="Stop Replay", command=self.stop_replay, state="disabled")
+        self.tools_menu.add_separator()
+        self.tools_menu.add_command(label="Validate Messages", command=self.validate_messages)
+        self.tools_menu.add_command(label="Deep Validate (hl7apy)", command=lambda: self.validate_messages(deep=True),
+                                    state="normal" if parse_message is not None else "disabled")
+        self.tools_menu.add_command(label="Deep Validate Folder...", command=self.deep_validate_folder,
+                                    state="normal" if parse_message is not None else "disabled")
+        self.menu_bar.add_cascade(label="Tools", menu=self.tools_menu)
         help_menu = tk.Menu(self.menu_bar, tearoff=0, font=DEFAULT_FONT)
         help_menu.add_command(label="Help", command=self.open_help)
         help_menu.add_command(label="About", command=self.show_about)
@@ -187,6 +2366,12 @@ class HL7MessageApp:
         self.content_frame = tk.Frame(root, bg=BG_COLOR)
         self.content_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+        # Restore work from the autosave journal if the last run did not quit normally
+        self.journal = None
+        self.journal_lock = None
+        self.journal_compact_warned = False
+        self.start_journal()
+
         # Start in Creator mode
         self.set_mode("Creator")
 
@@ -203,11 +2388,23 @@ class HL7MessageApp:
             self.root.title("HL7 Message Creator")
             self.file_menu.entryconfig("New Patient (Ctrl+N)", state="normal")
             self.file_menu.entryconfig("Open File(s) (Ctrl+O)", state="disabled")
+            self.file_menu.entryconfig("Open from Corpus Store...", state="disabled")
+            self.file_menu.entryconfig("Save All Messages", state="disabled")
+            self.file_menu.entryconfig("Export Case Data...", state="normal")
+            self.file_menu.entryconfig("Open Session...", state="normal")
+            self.file_menu.entryconfig("Save Session...", state="normal")
+            self.menu_bar.entryconfig("Edit", state="disabled")
             self.setup_creator()
         elif mode == "Editor":
             self.root.title("HL7 Message Editor")
             self.file_menu.entryconfig("New Patient (Ctrl+N)", state="disabled")
             self.file_menu.entryconfig("Open File(s) (Ctrl+O)", state="normal")
+            self.file_menu.entryconfig("Open from Corpus Store...", state="normal")
+            self.file_menu.entryconfig("Save All Messages", state="normal")
+            self.file_menu.entryconfig("Export Case Data...", state="disabled")
+            self.file_menu.entryconfig("Open Session...", state="disabled")
+            self.file_menu.entryconfig("Save Session...", state="disabled")
+            self.menu_bar.entryconfig("Edit", state="normal")
             self.setup_editor()
 
     def open_help(self):
@@ -254,6 +2451,7 @@ The following shortcuts enhance your workflow:
 - **Ctrl+Q**: Quit the application
 - **Ctrl+E**: Switch to Editor Mode
 - **Ctrl+R**: Switch to Creator Mode
+- **Ctrl+Z / Ctrl+Y**: Undo / redo the last Editor change (Editor Mode only)
 
 **Getting Started** #getting-started
 1. Launch the application to enter **Creator Mode** by default.
@@ -293,7 +2491,7 @@ Creator Mode allows you to generate HL7 messages for new patients.
 
 *Assigning Staff and Surgeons* #assigning-staff-and-surgeons
 - Assign a **Primary Surgeon** and fixed roles (Circulator, Scrub, CRNA, Anesthesiologist) using the input fields.
-- Click **Random Surgeon** or **Random Staff** to populate from `surgeon_names.csv` or `staff_names.csv`.
+- Click **Random Surgeon** or **Random Staff** to populate from `surgeon_names.csv` or `staff_names.csv`. Random surgeons are chosen from those whose specialty matches the selected procedure.
 - Add extra surgeons or staff with **Add Surgeon** or **Add Staff Member**; remove them with **Remove Last Surgeon** or **Remove Last Staff Member**.
 - Enter custom roles for additional staff as needed.
 
@@ -302,6 +2500,17 @@ Creator Mode allows you to generate HL7 messages for new patients.
 - Preview the generated message in the text area below the input fields.
 - Save messages via **File > Save** (Ctrl+S) or **Save & Exit** (Ctrl+Shift+S), selecting an output directory.
 - Messages are saved as `.hl7` files, named with the patient’s name and a sequence number (e.g., `JohnDoe-00.hl7`).
+- **File > Save as Archive...** writes all messages into one compressed `.hl7.gz` (or `.hl7.zst`, if the zstandard package is installed) file, typically dozens of times smaller than loose `.hl7` files. Archives open in Editor Mode like a folder of files; messages are only decompressed when you view them.
+- **File > Save to Corpus Store...** adds all messages to a SQLite corpus file, indexed by MRN, patient name and scheduled date, alongside the trigger event, case event and procedure. In Editor Mode, **File > Open from Corpus Store...** loads one patient's messages by MRN or last name, even from a store of millions of messages, and saving writes edits back to the store.
+- **File > Save Session...** saves every patient in Creator Mode (fields, procedures, staff, allergies, message type and any generated messages) to a `.hl7session` file, and **File > Open Session...** restores them later, replacing the current patients. Sessions of thousands of patients open almost instantly: each patient is only read in full when you view it.
+- Work in progress is also autosaved as you type to `autosave_journal.jsonl` next to the application. If the application does not quit normally (a crash or power loss), you are offered to restore the patients and any unsaved Editor edits the next time it starts. Quitting with **File > Quit** or by closing the window discards the journal. If a second copy of the application is started while one is running, only the first autosaves.
+- **File > Export Case Data...** writes the data behind each generated case as tables (cases, staff, procedures, allergies and case event times) for analysis in pandas or similar tools. Tables are Parquet files if pyarrow is installed and NumPy `.npz` files otherwise.
+- **Tools > Generate OR Day...** creates a full day of random cases for a date: each case gets an OR, start time and duration so that no two cases overlap in the same room, with a turnover gap between cases. Longer cases are placed first; cases that don't fit before the end of the day are left out. Surgeons and staff are assigned so nobody is in two rooms at once, with the turnover gap between their cases; if there aren't enough people free, the summary says how many cases had to share.
+- Send messages straight to an interface engine with **File > Send via MLLP...**, entering the destination as host:port. Messages go over a pool of persistent connections, each patient's messages on the same connection and in order, and a summary of ACK codes and latency is shown when done. The same command sends all loaded messages in Editor Mode.
+- **File > Fan Out to Destinations...** sends every message to several places at once, e.g. `localhost:2575, file:///tmp/out, stdout`. Each destination has its own queue and retries failed deliveries, so a slow or unreachable one does not hold up the rest; a per-destination summary is shown when done.
+- To test without an interface engine, start a local receiver with **Tools > Start MLLP Listener...**. It accepts SIU^S12/S14/S15 and ADT^A01, replies with the ACK code you choose (optionally delayed or with a share of AE errors), and records when each message arrived. Sends to it also report send-to-receive latency; **Tools > Stop MLLP Listener** shows what it received.
+- **Tools > Validate Messages** checks every message's structure: required segments and their order, field counts, date/time and numeric fields, and leftover `{placeholders}`. The same check runs when saving direct edits. **Tools > Deep Validate (hl7apy)** runs the much slower full HL7 2.5 validation if hl7apy is installed, and **Tools > Deep Validate Folder...** does the same for every `.hl7` file under a folder. Deep validation uses all CPU cores and remembers its results in `validation_cache.sqlite`, so re-checking a corpus only parses the messages that changed.
+- **Tools > Replay Case Events...** plays the messages back as a live OR day feed: each message is sent over MLLP when its timestamp comes up, in real time (speed 1) or faster (e.g. 60 plays an hour per minute). Scheduling and ADT messages go out before the case's first event. Use **Tools > Stop Replay** to end early.
 
 **Editor Mode** #editor-mode
 Editor Mode is used to modify existing HL7 messages.
@@ -318,13 +2527,16 @@ Editor Mode is used to modify existing HL7 messages.
 
 *Editing Messages* #editing-messages
 - **Field-Based Editing**: Modify fields like **Patient MRN**, **Location OR**, or **Location Department** in the input area. Changes are reflected in the preview and highlighted in the message text.
+- **Click to Edit**: Click a value in the message preview to jump to its field in the input area; values without a field are highlighted.
+- **Syntax Coloring**: Segment names, separators and unfilled placeholders such as `{patientMRN}` are colored in both previews, including while you type in Direct Edit mode.
 - **Direct Edit Mode**: Click **Direct Edit** to manually edit the message text.
   - Make changes directly in the preview area.
   - Save edits to the current message (**Save to Current**) or all messages in the patient block (**Save to All**).
-- Apply field-based changes to the current message or all messages in the block using the **Apply** button and selecting **Current** or **All**.
+- Click **Show Diff** to see what changed in the current message compared with the file it was loaded from, field by field. **Changed Files** lists every loaded message that differs from its original file.
+- Apply field-based changes to the current message or all messages in the block using the **Apply** button and selecting **Current** or **All**. **All** writes only the fields you changed into each message, leaving the rest of every message intact.
 
 *Saving Changes* #saving-changes
-- Save edited messages via **File > Save** (Ctrl+S) or **Save & Exit** (Ctrl+Shift+S).
+- Save edited messages via **File > Save** (Ctrl+S) or **Save & Exit** (Ctrl+Shift+S). Only messages changed since they were loaded or last saved are written; use **File > Save All Messages** to write every loaded message.
 - Choose an output directory to store the modified `.hl7` files.
 - Validation checks are performed during direct edits, with warnings for any HL7 parsing errors.
 
@@ -390,28 +2602,124 @@ For further assistance, contact the application support team or refer to the **H
             return
         files = filedialog.askopenfilenames(
             title="Select HL7 Files",
-            filetypes=[("HL7 Files", "*.hl7")],
+            filetypes=[("HL7 Files", "*.hl7 *.hl7.gz *.hl7.zst"), ("HL7 Messages", "*.hl7"), ("HL7 Archives", "*.hl7.gz *.hl7.zst")],
             initialdir=DATA_DIR
         )
         if files:
+            # (path, loader) for every message; archive members are read when first shown
+            sources = []
+            for file_path in files:
+                if is_archive_path(file_path):
+                    try:
+                        archive = MessageArchive(file_path)
+                    except (ValueError, RuntimeError, OSError) as e:
+                        messagebox.showwarning("Cannot Open Archive", str(e))
+                        return
+                    sources.extend((os.path.join(file_path, name), lambda i=i, archive=archive: archive.read(i)) for i, name in enumerate(archive.names()))
+                else:
+                    sources.append((file_path, None))
             self.patient_blocks = []
+            self.edit_history.clear()
             patient_groups = {}
-            for file_path in files:
+            for file_path, loader in sources:
                 patient_name = os.path.basename(file_path).split('-')[0]
-                patient_groups.setdefault(patient_name, []).append(file_path)
+                patient_groups.setdefault(patient_name, []).append((file_path, loader))
             for patient_name, patient_files in patient_groups.items():
-                patient_files.sort()
+                patient_files.sort(key=lambda source: source[0])
                 messages = []
-                for file_path in patient_files:
-                    with open(file_path, 'r') as f:
-                        message_text = f.read()
-                    parsed_values = self.parse_hl7_message(message_text)
-                    messages.append({'file_path': file_path, 'message_text': message_text, 'parsed_values': parsed_values})
+                for file_path, loader in patient_files:
+                    message = {'file_path': file_path, 'message_text': None, 'original_text': None, 'saved_text': None,
+                               'parsed_values': None, 'dirty': False, 'changed': False, 'diff_cache': None, 'offset_map': None, 'loader': loader, 'corpus': None}
+                    if loader is None:
+                        self.editor_ensure_loaded(message)
+                    messages.append(message)
                 self.patient_blocks.append({'patient_name': patient_name, 'messages': messages})
             self.current_patient_index = 0
             self.current_message_index = 0
             self.editor_load_message()
 
+    def open_from_corpus(self):
+        if self.mode != "Editor":
+            messagebox.showwarning("Invalid Mode", "File opening is only available in Editor mode.")
+            return
+        store_path = filedialog.askopenfilename(title="Select Corpus Store", filetypes=[("Corpus Store", "*.sqlite")], initialdir=DATA_DIR)
+        if not store_path:
+            return
+        query = simpledialog.askstring("Open from Corpus Store", "Patient MRN or last name:", parent=self.root)
+        if not query or not query.strip():
+            return
+        query = query.strip()
+        try:
+            store = CorpusStore(store_path)
+            try:
+                rows = store.find(mrn=query) or store.find(last_name=query)
+            finally:
+                store.close()
+        except (ValueError, sqlite3.Error) as e:
+            messagebox.showerror("Cannot Open Corpus Store", str(e))
+            return
+        if not rows:
+            messagebox.showinfo("No Messages", f"No messages found for '{query}'")
+            return
+        self.patient_blocks = []
+        self.edit_history.clear()
+        patient_groups = {}
+        for message_id, name, mrn, last_name, first_name, body in rows:
+            patient_groups.setdefault((mrn, f"{first_name or 'First'}{last_name or 'Last'}"), []).append(
+                {'file_path': os.path.join(store_path, name), 'message_text': body, 'original_text': body, 'saved_text': body,
+                 'parsed_values': self.parse_hl7_message(body), 'dirty': False, 'changed': False, 'diff_cache': None,
+                 'offset_map': None, 'loader': None, 'corpus': (store_path, message_id)}
+            )
+        for (mrn, patient_name), messages in patient_groups.items():
+            self.patient_blocks.append({'patient_name': patient_name, 'messages': messages})
+        self.current_patient_index = 0
+        self.current_message_index = 0
+        self.editor_load_message()
+
+    def save_to_corpus(self):
+        if self.mode == "Creator":
+            new_messages = self.creator_named_messages()
+            messages = []
+        else:
+            messages = [self.editor_ensure_loaded(message) for patient_block in self.patient_blocks for message in patient_block['messages']]
+            new_messages = None
+        if not (new_messages or messages):
+            messagebox.showwarning("Nothing to Save", "Create patient messages or open files first.")
+            return
+        store_path = filedialog.asksaveasfilename(title="Save to Corpus Store", initialdir=DATA_DIR, defaultextension=".sqlite",
+                                                  filetypes=[("Corpus Store", "*.sqlite")], confirmoverwrite=False)
+        if not store_path:
+            return
+        try:
+            store = CorpusStore(store_path, create=True)
+            try:
+                # Messages opened from this store are updated in place; everything else is added
+                updates = [(message['corpus'][1], message['message_text']) for message in messages
+                           if message['corpus'] and message['corpus'][0] == store_path]
+                if new_messages is None:
+                    new_messages = [(os.path.basename(message['file_path']), message['message_text']) for message in messages
+                                    if not (message['corpus'] and message['corpus'][0] == store_path)]
+                store.update_messages(updates)
+                added = store.add_messages(new_messages)
+            finally:
+                store.close()
+        except (ValueError, sqlite3.Error) as e:
+            messagebox.showerror("Save Failed", str(e))
+            return
+        self.editor_mark_saved(messages)
+        messagebox.showinfo("Save Complete", f"Added {added} and updated {len(updates)} messages in {os.path.basename(store_path)}")
+
+    def editor_ensure_loaded(self, message):
+        if message['message_text'] is None:
+            if message['loader'] is None:
+                with open(message['file_path'], 'r') as f:
+                    message_text = f.read()
+            else:
+                message_text = message['loader']()
+            message['message_text'] = message['original_text'] = message['saved_text'] = message_text
+            message['parsed_values'] = self.parse_hl7_message(message_text)
+        return message
+
     def save_files(self):
         if self.mode == "Creator":
             self.creator_save_files()
@@ -426,36 +2734,626 @@ For further assistance, contact the application support team or refer to the **H
         )
         if not out_dir:
             return
-        total_messages = 0
-        total_patients = 0
+        named_messages = self.creator_named_messages()
+        write_files([(os.path.join(out_dir, file_name), msg) for file_name, msg in named_messages])
+        total_patients = sum(1 for patient in self.patients if patient.messages)
+        messagebox.showinfo("Save Complete", f"Saved {len(named_messages)} messages for {total_patients} patients to {out_dir}")
+
+    def creator_named_messages(self):
+        self.creator_load_records(range(len(self.patients)))
+        named_messages = []
         for patient in self.patients:
-            if patient['messages']:
-                total_patients += 1
-                total_messages += len(patient['messages'])
-                base_name = f"{patient['base_vars']['{patientFirstName}'].get() or 'First'}{patient['base_vars']['{patientLastName}'].get() or 'Last'}"
-                for msg, idx in patient['messages']:
-                    with open(os.path.join(out_dir, f"{base_name}-{idx}.hl7"), 'w') as f:
-                        f.write(msg)
-        messagebox.showinfo("Save Complete", f"Saved {total_messages} messages for {total_patients} patients to {out_dir}")
-
-    def editor_save_files(self):
-        out_dir = filedialog.askdirectory(
-            title="Select Save Directory",
-            initialdir=DATA_DIR,
-            mustexist=True
+            base_name = f"{patient.base_values['{patientFirstName}'] or 'First'}{patient.base_values['{patientLastName}'] or 'Last'}"
+            for msg, idx in patient.messages:
+                named_messages.append((f"{base_name}-{idx}.hl7", msg))
+        return named_messages
+
+    def save_session(self):
+        if not self.patients:
+            messagebox.showwarning("Nothing to Save", "Create a patient first.")
+            return
+        path = filedialog.asksaveasfilename(title="Save Session", initialdir=DATA_DIR, defaultextension=".hl7session",
+                                            filetypes=[("Creator Session", "*.hl7session")])
+        if not path:
+            return
+        try:
+            write_session(path, self.patients, self.current_patient_index, self.last_mrn)
+        except OSError as e:
+            messagebox.showerror("Save Failed", str(e))
+            return
+        messagebox.showinfo("Save Complete", f"Saved {len(self.patients)} patients to {os.path.basename(path)}")
+
+    def open_session(self):
+        if self.mode != "Creator":
+            messagebox.showwarning("Invalid Mode", "Sessions are only available in Creator mode.")
+            return
+        path = filedialog.askopenfilename(title="Open Session", initialdir=DATA_DIR,
+                                          filetypes=[("Creator Session", "*.hl7session"), ("All Files", "*.*")])
+        if not path:
+            return
+        if self.patients and not messagebox.askyesno("Open Session", "Replace the current patients with the saved session?"):
+            return
+        try:
+            patients, header = read_session(path)
+            last_mrn = header["last_mrn"]
+            current = min(max(header["current"], 0), len(patients) - 1)
+            # Decode the patient to be shown now, so a file this app cannot read fails before anything is replaced
+            if patients:
+                patients[current].load_session_line(patients[current].session_line)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            messagebox.showerror("Open Failed", str(e))
+            return
+        self.patients = patients
+        self.last_mrn = max(self.last_mrn, last_mrn)
+        if not patients:
+            self.current_patient_index = -1
+            self.create_new_patient()
+            return
+        self.current_patient_index = current
+        self.compact_journal()
+        self.creator_load_patient()
+
+    def start_journal(self):
+        # The lock stays held until quit, so another running copy never replays or deletes this journal
+        try:
+            self.journal_lock = lock_file(JOURNAL_LOCK_PATH)
+        except OSError as e:
+            messagebox.showwarning("Autosave Disabled", f"Could not lock the autosave journal: {e}")
+            return
+        if self.journal_lock is None:
+            messagebox.showwarning("Autosave Disabled", "Another copy of the application is running and using the autosave "
+                                                        "journal. Work in this window will not be autosaved.")
+            return
+        recovered = False
+        if os.path.exists(JOURNAL_PATH):
+            try:
+                records = read_journal(JOURNAL_PATH)
+            except OSError:
+                records = []
+            if records and messagebox.askyesno("Recover Unsaved Work", "The application did not quit normally last time. "
+                                               "Restore patients and Editor edits from the autosave journal?"):
+                self.replay_journal(records)
+                recovered = True
+        try:
+            if not recovered and os.path.exists(JOURNAL_PATH):
+                os.remove(JOURNAL_PATH)
+            self.journal = Journal(JOURNAL_PATH)
+        except OSError as e:
+            messagebox.showwarning("Autosave Disabled", f"Could not open the autosave journal: {e}")
+            return
+        if recovered:
+            self.compact_journal()
+        self.root.after(JOURNAL_COMPACT_INTERVAL, self.journal_compact_tick)
+
+    def replay_journal(self, records):
+        patients = []
+        current = -1
+        editor_edits = {}
+        for record in records:
+            try:
+                op = record["op"]
+                if op == "reset":
+                    patients = []
+                    self.last_mrn = max(self.last_mrn, record["last_mrn"])
+                elif op == "patient":
+                    if "line" in record:
+                        patient = PatientRecord.from_session_line(record["line"])
+                    else:
+                        patient = PatientRecord()
+                        patient.load_session_data(record["record"])
+                    if record["i"] == len(patients):
+                        patients.append(patient)
+                        current = record["i"]
+                    else:
+                        patients[record["i"]] = patient
+                    self.last_mrn = max(self.last_mrn, record["last_mrn"])
+                elif op == "set":
+                    patients[record["i"]].set_field(record["path"], record["value"])
+                elif op == "current":
+                    current = record["i"]
+                elif op == "editor":
+                    editor_edits[record["file"]] = self.replay_editor_record(record, editor_edits.get(record["file"]))
+                elif op == "saved":
+                    for file_path in record["files"]:
+                        editor_edits.pop(file_path, None)
+            except (KeyError, IndexError, TypeError, ValueError, OSError):
+                continue  # A record from a damaged journal; keep whatever else can be restored
+        self.patients = patients
+        self.current_patient_index = min(max(current, 0), len(patients) - 1)
+        # Recovered Editor edits are reopened as unsaved messages, ready for File > Save
+        patient_groups = {}
+        for file_path, record in editor_edits.items():
+            saved_text = None
+            if record["corpus"] is None and os.path.isfile(file_path):
+                with open(file_path, 'r') as f:
+                    saved_text = f.read()
+            if record["text"] == saved_text:
+                continue
+            message = {'file_path': file_path, 'message_text': record["text"], 'original_text': saved_text or record["text"], 'saved_text': saved_text,
+                       'parsed_values': self.parse_hl7_message(record["text"]), 'dirty': True, 'changed': saved_text is not None, 'diff_cache': None,
+                       'offset_map': None, 'loader': None, 'corpus': tuple(record["corpus"]) if record["corpus"] else None}
+            patient_groups.setdefault(os.path.basename(file_path).split('-')[0], []).append(message)
+        self.patient_blocks = [{'patient_name': patient_name, 'messages': sorted(messages, key=lambda message: message['file_path'])}
+                               for patient_name, messages in patient_groups.items()]
+        if self.patient_blocks:
+            restored = sum(len(patient_block['messages']) for patient_block in self.patient_blocks)
+            messagebox.showinfo("Recover Unsaved Work", f"Restored {len(patients)} patients and {restored} edited Editor messages. "
+                                                        "Switch to Editor Mode and use File > Save to write the messages.")
+
+    def replay_editor_record(self, record, previous):
+        """The {"file", "corpus", "text"} state an editor record leaves its message in."""
+        if "text" in record:
+            return record
+        if "base" in record:
+            base = record["base"]
+        elif "base_hash" in record:
+            with open(record["file"], 'r') as f:
+                base = f.read()
+            if hashlib.sha256(base.encode("utf-8")).hexdigest() != record["base_hash"]:
+                raise ValueError(f"{record['file']} has changed since it was edited")
+        else:
+            base = previous["text"]
+        return {"file": record["file"], "corpus": record["corpus"], "text": apply_segment_delta(base, record["delta"])}
+
+    def journal_active(self):
+        # The writer thread cannot show dialogs, so a failed write is reported on the next record
+        if self.journal is not None and self.journal.error is not None:
+            error = self.journal.error
+            self.journal.close()
+            self.journal = None
+            messagebox.showwarning("Autosave Disabled", f"Could not write the autosave journal, autosave is now off: {error}")
+        return self.journal is not None
+
+    def journal_append(self, record):
+        if self.journal_active():
+            self.journal.append(record)
+
+    def journal_patient(self, index=None):
+        # Records changed in code are journaled whole; typed edits go field by field through journal_field
+        if self.journal_active():
+            index = self.current_patient_index if index is None else index
+            self.journal.append_line(self.journal_patient_line(index, self.patients[index]))
+
+    def journal_patient_line(self, index, patient):
+        # A restored record nobody has looked at is journaled as its session line, still unparsed
+        # and as a JSON string, so a damaged line cannot break the journal around it
+        if patient.session_line is not None:
+            return f'{{"op":"patient","i":{index},"last_mrn":{self.last_mrn},"line":{json.dumps(patient.session_line)}}}'
+        return f'{{"op":"patient","i":{index},"last_mrn":{self.last_mrn},"record":{patient.to_session_line()}}}'
+
+    def journal_field(self, store, key):
+        patient = self.patients[self.current_patient_index]
+        path = patient.field_path(store, key)
+        if path is None:
+            self.journal_patient()
+        else:
+            self.journal_append({"op": "set", "i": self.current_patient_index, "path": path, "value": store[key]})
+
+    def journal_snapshot(self):
+        lines = [json.dumps({"op": "reset", "last_mrn": self.last_mrn})]
+        lines.extend(self.journal_patient_line(index, patient) for index, patient in enumerate(self.patients))
+        if self.mode == "Creator" and 0 <= self.current_patient_index < len(self.patients):
+            lines.append(json.dumps({"op": "current", "i": self.current_patient_index}))
+        lines.extend(json.dumps({"op": "editor", "file": message['file_path'], "corpus": message['corpus'], "text": message['message_text']})
+                     for patient_block in self.patient_blocks for message in patient_block['messages'] if message['dirty'])
+        return lines
+
+    def compact_journal(self):
+        if not self.journal_active():
+            return
+        try:
+            self.journal.compact(self.journal_snapshot())
+        except OSError as e:
+            # The journal keeps growing but is still complete; warn once rather than on every tick
+            if not self.journal_compact_warned:
+                self.journal_compact_warned = True
+                messagebox.showwarning("Autosave", f"Could not compact the autosave journal, it will keep growing: {e}")
+
+    def journal_compact_tick(self):
+        if self.journal_active() and self.journal.appended >= JOURNAL_COMPACT_RECORDS:
+            self.compact_journal()
+        self.root.after(JOURNAL_COMPACT_INTERVAL, self.journal_compact_tick)
+
+    def save_archive(self):
+        if self.mode == "Creator":
+            named_messages = self.creator_named_messages()
+        else:
+            messages = [self.editor_ensure_loaded(message) for patient_block in self.patient_blocks for message in patient_block['messages']]
+            named_messages = [(os.path.basename(message['file_path']), message['message_text']) for message in messages]
+        if not named_messages:
+            messagebox.showwarning("Nothing to Save", "Create patient messages or open files first.")
+            return
+        filetypes = [("Gzip Archive", "*.hl7.gz")] + ([("Zstandard Archive", "*.hl7.zst")] if zstandard is not None else [])
+        path = filedialog.asksaveasfilename(title="Save Message Archive", initialdir=DATA_DIR, defaultextension=".hl7.gz", filetypes=filetypes)
+        if not path:
+            return
+        if not is_archive_path(path):
+            path += ".hl7.gz"
+        try:
+            write_archive(path, named_messages)
+        except (RuntimeError, OSError) as e:
+            messagebox.showerror("Save Failed", str(e))
+            return
+        if self.mode == "Editor":
+            self.editor_mark_saved(messages)
+        raw_size = sum(len(msg.encode("utf-8")) for name, msg in named_messages)
+        messagebox.showinfo("Save Complete", f"Saved {len(named_messages)} messages to {os.path.basename(path)} "
+                                             f"({raw_size / max(os.path.getsize(path), 1):.0f}x smaller than loose files)")
+
+    def editor_save_files(self, only_dirty=True):
+        messages = [self.editor_ensure_loaded(message) for patient_block in self.patient_blocks for message in patient_block['messages']
+                    if message['dirty'] or not only_dirty]
+        if not messages:
+            messagebox.showinfo("Nothing to Save", "No messages have been changed since they were loaded or last saved.")
+            return
+        # Messages opened from a corpus store are written back to it; the rest go to a folder
+        store_updates = {}
+        file_messages = []
+        for message in messages:
+            if message['corpus']:
+                store_updates.setdefault(message['corpus'][0], []).append(message)
+            else:
+                file_messages.append(message)
+        out_dir = None
+        if file_messages:
+            out_dir = filedialog.askdirectory(
+                title="Select Save Directory",
+                initialdir=DATA_DIR,
+                mustexist=True
+            )
+            if not out_dir:
+                return
+            jobs = [(os.path.join(out_dir, os.path.basename(message['file_path'])), message['message_text']) for message in file_messages]
+            write_files(jobs)
+        for store_path, store_messages in store_updates.items():
+            try:
+                store = CorpusStore(store_path)
+                try:
+                    store.update_messages([(message['corpus'][1], message['message_text']) for message in store_messages])
+                finally:
+                    store.close()
+            except (ValueError, sqlite3.Error) as e:
+                messagebox.showerror("Save Failed", f"{os.path.basename(store_path)}: {e}")
+                return
+        self.editor_mark_saved(messages)
+        destinations = ([out_dir] if out_dir else []) + [os.path.basename(store_path) for store_path in store_updates]
+        messagebox.showinfo("Save Complete", f"Saved {len(messages)} {'edited' if only_dirty else 'loaded'} messages to {', '.join(destinations)}")
+
+    def collect_outgoing_messages(self):
+        # (key, message) pairs; the key keeps each patient's messages on one connection, in order
+        if self.mode == "Creator":
+            self.creator_load_records(range(len(self.patients)))
+            return [(patient.base_values['{patientMRN}'], msg) for patient in self.patients for msg, idx in patient.messages]
+        return [(patient_block['patient_name'], self.editor_ensure_loaded(message)['message_text']) for patient_block in self.patient_blocks for message in patient_block['messages']]
+
+    def send_via_mllp(self):
+        keyed_messages = self.collect_outgoing_messages()
+        if not keyed_messages:
+            messagebox.showwarning("Nothing to Send", "Create patient messages or open files first.")
+            return
+        destination = simpledialog.askstring("Send via MLLP", "Destination (host:port):", initialvalue=MLLP_DEFAULT_DESTINATION, parent=self.root)
+        if not destination:
+            return
+        host, _, port = destination.strip().rpartition(":")
+        if not host or not port.isdigit():
+            messagebox.showwarning("Invalid Destination", "Destination must be in host:port format.")
+            return
+
+        def worker():
+            started = time.time()
+            results = send_messages_mllp(host, int(port), keyed_messages)
+            elapsed = time.time() - started
+            self.root.after(0, lambda: self.show_mllp_results(destination, results, elapsed))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def fan_out(self):
+        keyed_messages = self.collect_outgoing_messages()
+        if not keyed_messages:
+            messagebox.showwarning("Nothing to Send", "Create patient messages or open files first.")
+            return
+        specs = simpledialog.askstring(
+            "Fan Out to Destinations",
+            "Comma-separated destinations (host:port, file://directory, stdout):",
+            initialvalue=MLLP_DEFAULT_DESTINATION, parent=self.root
         )
-        if not out_dir:
+        if not specs:
             return
-        total_messages = 0
-        for patient_block in self.patient_blocks:
-            for message in patient_block['messages']:
-                file_path = message['file_path']
-                edited_message = self.edited_messages.get(file_path, message['message_text'])
-                file_name = os.path.basename(file_path)
-                with open(os.path.join(out_dir, file_name), 'w') as f:
-                    f.write(edited_message)
-                total_messages += 1
-        messagebox.showinfo("Save Complete", f"Saved {total_messages} edited messages to {out_dir}")
+        try:
+            destinations = [parse_destination(spec) for spec in specs.split(",") if spec.strip()]
+        except ValueError as e:
+            messagebox.showwarning("Invalid Destination", str(e))
+            return
+
+        def worker():
+            started = time.time()
+            fan_out_messages(destinations, keyed_messages)
+            elapsed = time.time() - started
+            summary = f"Published {len(keyed_messages)} messages to {len(destinations)} destinations in {elapsed:.2f}s\n\n"
+            summary += "\n".join(destination.summary() for destination in destinations)
+            self.root.after(0, lambda: messagebox.showinfo("Fan Out Complete", summary))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def validate_messages(self, deep=False):
+        keyed_messages = self.collect_outgoing_messages()
+        if not keyed_messages:
+            messagebox.showwarning("Nothing to Validate", "Create patient messages or open files first.")
+            return
+        labels = [f"Message {number} ({key})" for number, (key, message_text) in enumerate(keyed_messages, 1)]
+        self.run_validation(labels, [message_text for key, message_text in keyed_messages], deep)
+
+    def deep_validate_folder(self):
+        directory = filedialog.askdirectory(title="Select Folder of HL7 Messages")
+        if not directory:
+            return
+        paths = sorted(os.path.join(folder, name) for folder, dirs, files in os.walk(directory) for name in files if name.lower().endswith(".hl7"))
+        if not paths:
+            messagebox.showwarning("Nothing to Validate", "No .hl7 files found in the selected folder.")
+            return
+        texts = []
+        for path in paths:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                texts.append(f.read())
+        self.run_validation([os.path.relpath(path, directory) for path in paths], texts, deep=True)
+
+    def run_validation(self, labels, texts, deep):
+        def worker():
+            started = time.time()
+            problems = []
+            parsed = len(texts)
+            try:
+                if deep:
+                    results, parsed = deep_validate_corpus(texts)
+                else:
+                    results = [validate_structure(text) for text in texts]
+            except Exception as e:
+                self.root.after(0, lambda message=str(e): messagebox.showerror("Validation Failed", message))
+                return
+            for label, errors in zip(labels, results):
+                problems.extend(f"{label}: {error}" for error in errors)
+            self.root.after(0, lambda: self.show_validation_results(len(texts), parsed, problems, time.time() - started, deep))
+
+        if deep:
+            threading.Thread(target=worker, daemon=True).start()
+        else:
+            worker()
+
+    def show_validation_results(self, count, parsed, problems, elapsed, deep):
+        title = "Deep Validation" if deep else "Validation"
+        summary = f"Checked {count} messages in {elapsed:.2f}s"
+        if deep and parsed < count:
+            summary += f" ({count - parsed} unchanged since their last validation)"
+        if not problems:
+            messagebox.showinfo(title, summary + "\n\nNo problems found.")
+            return
+        summary += f"\n{len(problems)} problems:\n\n" + "\n".join(problems[:20])
+        if len(problems) > 20:
+            summary += f"\n...and {len(problems) - 20} more"
+        messagebox.showwarning(title, summary)
+
+    def show_mllp_results(self, destination, results, elapsed):
+        counts = {}
+        latencies = []
+        errors = []
+        for result in results:
+            counts[result.ack_code or "No ACK"] = counts.get(result.ack_code or "No ACK", 0) + 1
+            if result.acked_at is not None:
+                latencies.append(result.acked_at - result.sent_at)
+            if result.error:
+                errors.append(result.error)
+        summary = f"Sent {len(results)} messages to {destination} in {elapsed:.2f}s ({len(results) / max(elapsed, 1e-6):.0f} msg/s)\n"
+        summary += ", ".join(f"{code}: {count}" for code, count in sorted(counts.items()))
+        if latencies:
+            summary += f"\nACK latency: avg {1000 * sum(latencies) / len(latencies):.1f} ms, max {1000 * max(latencies):.1f} ms"
+        if self.mllp_listener is not None:
+            first_sent = min((result.sent_at for result in results if result.sent_at is not None), default=None)
+            if first_sent is not None:
+                records = [record for record in self.mllp_listener.records if record.received_at >= first_sent]
+                stats = summarize_latencies(one_way_latencies(results, records))
+                if stats:
+                    summary += (f"\nLocal listener received {stats['count']}: p50 {1000 * stats['p50']:.1f} ms, "
+                                f"p95 {1000 * stats['p95']:.1f} ms, max {1000 * stats['max']:.1f} ms after send")
+        if errors:
+            summary += f"\n\nFirst error: {errors[0]}"
+            messagebox.showwarning("MLLP Send Complete", summary)
+        else:
+            messagebox.showinfo("MLLP Send Complete", summary)
+
+    def generate_or_day(self):
+        if self.mode != "Creator":
+            messagebox.showwarning("Invalid Mode", "Generating patients is only available in Creator mode.")
+            return
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Generate OR Day")
+        dialog.configure(bg=BG_COLOR)
+        fields = {}
+        defaults = [("Date (YYYYMMDD):", datetime.now().strftime("%Y%m%d")), ("Number of ORs:", "10"), ("Number of cases:", "40"),
+                    ("Day start (HHMM):", "0700"), ("Day end (HHMM):", "1900"), ("Turnover (minutes):", "30"), ("Department:", "MAIN OR")]
+        for row, (label, default) in enumerate(defaults):
+            tk.Label(dialog, text=label, fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).grid(row=row, column=0, sticky="w", padx=5, pady=2)
+            entry = UppercaseEntry(dialog, base_width=10, min_width=10, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+            entry.insert(0, default)
+            entry.grid(row=row, column=1, padx=5, pady=2)
+            fields[label] = entry
+
+        def generate():
+            try:
+                date = datetime.strptime(fields["Date (YYYYMMDD):"].get(), "%Y%m%d").strftime("%Y%m%d")
+                rooms = int(fields["Number of ORs:"].get())
+                count = int(fields["Number of cases:"].get())
+                day_start = datetime.strptime(fields["Day start (HHMM):"].get(), "%H%M")
+                day_end = datetime.strptime(fields["Day end (HHMM):"].get(), "%H%M")
+                turnover = int(fields["Turnover (minutes):"].get())
+                if rooms < 1 or count < 1 or turnover < 0 or day_end <= day_start:
+                    raise ValueError
+            except ValueError:
+                messagebox.showwarning("Invalid Input", "Enter a valid date, positive OR and case counts, a day start before the day end and a turnover in minutes.", parent=dialog)
+                return
+            department = fields["Department:"].get()
+            dialog.destroy()
+            started = time.time()
+            patients = []
+            for _ in range(count):
+                patient = self.new_patient_record()
+                self.randomize_patient(patient)
+                patients.append(patient)
+            durations = [int(patient.base_values['{duration}']) for patient in patients]
+            placements = schedule_or_day(durations, rooms, day_start.hour * 60 + day_start.minute, day_end.hour * 60 + day_end.minute, turnover)
+            scheduled = []
+            # Book people in case start order, each onto the whole case plus turnover
+            rosters = [(RosterAllocator(map(str, self.surgeon_names["ID"]), gap=turnover), self.surgeons_by_id),
+                       (RosterAllocator(map(str, self.staff_names["ID"]), gap=turnover), {str(row["ID"]): row for _, row in self.staff_names.iterrows()})]
+            double_booked = 0
+            cases = sorted(((placement, patient) for placement, patient in zip(placements, patients) if placement is not None), key=lambda case: case[0][1])
+            for (room, start), patient in cases:
+                patient.base_values['{YYYYMMDD}'] = date
+                patient.base_values['{scheduledTime}'] = f"{start // 60:02}{start % 60:02}00"
+                patient.base_values['{locationOR}'] = f"OR{room + 1}"
+                patient.base_values['{locationDepartment}'] = department
+                patient.base_values['{addOn}'] = "N"
+                if not self.assign_roster(patient, rosters, start, start + int(patient.base_values['{duration}'])):
+                    double_booked += 1
+                self.generate_patient_messages(patient)
+                scheduled.append(patient)
+            scheduled.sort(key=lambda patient: (patient.base_values['{locationOR}'][2:].zfill(4), patient.base_values['{scheduledTime}']))
+            if not scheduled:
+                messagebox.showwarning("Nothing Scheduled", "No cases fit in the day with these settings.")
+                return
+            self.current_patient_index = len(self.patients)
+            self.patients.extend(scheduled)
+            self.compact_journal()
+            self.creator_load_patient()
+            summary = f"Scheduled {len(scheduled)} of {count} cases in {rooms} ORs in {time.time() - started:.2f}s."
+            if len(scheduled) < count:
+                summary += f"\n{count - len(scheduled)} cases did not fit before the end of the day."
+            if double_booked:
+                summary += f"\n{double_booked} cases share staff with another case; add staff to the CSV files or use fewer ORs to avoid this."
+            messagebox.showinfo("OR Day Generated", summary)
+
+        tk.Button(dialog, text="Generate", command=generate, fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).grid(row=len(defaults), column=0, columnspan=2, pady=5)
+
+    def assign_roster(self, patient, rosters, start, end):
+        # Book conflict-free surgeons and staff for a case from (allocator, rows by ID) pairs.
+        # Roles nobody is free for keep their random pick; returns False if that happened.
+        fixed = patient.fixed_staff
+        surgeon_roles = [fixed["Primary Surgeon"]] + patient.additional_surgeons
+        staff_roles = [fixed[role] for role in ["Circulator", "Scrub", "CRNA", "Anesthesiologist"]] + patient.staff_members
+        complete = True
+        # Surgeons: weighted picks for the case's specialty first, then anyone in the
+        # specialty, then anyone at all
+        sampler = self.surgeon_sampler(patient)
+        preferred = [sampler.sample() for _ in surgeon_roles] + sampler.items + rosters[0][0].people
+        for (roster, rows), assignments, candidates in zip(rosters, (surgeon_roles, staff_roles), (list(dict.fromkeys(preferred)), None)):
+            chosen = roster.allocate(start, end, count=len(assignments), candidates=candidates)
+            complete = complete and len(chosen) == len(assignments)
+            for assignment, person in zip(assignments, chosen):
+                assignment["firstName"] = rows[person]["First Name"]
+                assignment["lastName"] = rows[person]["Last Name"]
+                assignment["id"] = person
+        return complete
+
+    def start_mllp_listener(self):
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Start MLLP Listener")
+        dialog.configure(bg=BG_COLOR)
+        fields = {}
+        for row, (label, default) in enumerate([("Port:", "2575"), ("ACK code (AA/AE/AR):", "AA"), ("ACK delay (ms):", "0"), ("AE error rate (0-1):", "0")]):
+            tk.Label(dialog, text=label, fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).grid(row=row, column=0, sticky="w", padx=5, pady=2)
+            entry = UppercaseEntry(dialog, base_width=10, min_width=10, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+            entry.insert(0, default)
+            entry.grid(row=row, column=1, padx=5, pady=2)
+            fields[label] = entry
+
+        def start():
+            try:
+                port = int(fields["Port:"].get())
+                ack_code = fields["ACK code (AA/AE/AR):"].get()
+                delay = float(fields["ACK delay (ms):"].get()) / 1000
+                error_rate = float(fields["AE error rate (0-1):"].get())
+                if ack_code not in ("AA", "AE", "AR") or not 0 <= error_rate <= 1:
+                    raise ValueError
+            except ValueError:
+                messagebox.showwarning("Invalid Input", "Enter a numeric port, AA/AE/AR, a delay in ms and an error rate between 0 and 1.", parent=dialog)
+                return
+            listener = MLLPListener(port=port, ack_code=ack_code, delay=delay, error_rate=error_rate)
+            try:
+                listener.start_in_thread()
+            except OSError as e:
+                messagebox.showerror("Listener Failed", f"Could not listen on port {port}: {e}", parent=dialog)
+                return
+            self.mllp_listener = listener
+            self.tools_menu.entryconfig("Start MLLP Listener...", state="disabled")
+            self.tools_menu.entryconfig("Stop MLLP Listener", state="normal")
+            dialog.destroy()
+            messagebox.showinfo("Listener Started", f"MLLP listener running on localhost:{listener.port}")
+
+        tk.Button(dialog, text="Start", command=start, fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).grid(row=4, column=0, columnspan=2, pady=5)
+
+    def stop_mllp_listener(self):
+        if self.mllp_listener is None:
+            return
+        self.mllp_listener.stop_thread()
+        summary = self.mllp_listener.summary()
+        self.mllp_listener = None
+        self.tools_menu.entryconfig("Start MLLP Listener...", state="normal")
+        self.tools_menu.entryconfig("Stop MLLP Listener", state="disabled")
+        messagebox.showinfo("Listener Stopped", summary)
+
+    def start_replay(self):
+        keyed_messages = self.collect_outgoing_messages()
+        if not keyed_messages:
+            messagebox.showwarning("Nothing to Replay", "Create patient messages or open files first.")
+            return
+        destination = simpledialog.askstring("Replay Case Events", "Destination (host:port):", initialvalue=MLLP_DEFAULT_DESTINATION, parent=self.root)
+        if not destination:
+            return
+        host, _, port = destination.strip().rpartition(":")
+        if not host or not port.isdigit():
+            messagebox.showwarning("Invalid Destination", "Destination must be in host:port format.")
+            return
+        speed = simpledialog.askfloat("Replay Case Events", "Speed (1 = real time, 60 = one hour per minute):", initialvalue=60, minvalue=0.01, parent=self.root)
+        if not speed:
+            return
+        scheduler = ReplayScheduler(speed=speed)
+        for key, messages in group_by_key(keyed_messages).items():
+            scheduler.add_case(key, messages)
+        self.replay_scheduler = scheduler
+        self.tools_menu.entryconfig("Replay Case Events...", state="disabled")
+        self.tools_menu.entryconfig("Stop Replay", state="normal")
+
+        async def replay():
+            sender = MLLPSender(host, int(port))
+            results = []
+
+            async def emit(key, message_text):
+                results.append(await sender.send(message_text, key))
+
+            try:
+                await scheduler.run(emit)
+            finally:
+                await sender.close()
+            return results
+
+        def worker():
+            started = time.time()
+            results = asyncio.run(replay())
+            self.root.after(0, lambda: self.finish_replay(destination, results, time.time() - started))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def stop_replay(self):
+        if self.replay_scheduler is not None:
+            self.replay_scheduler.stopping = True
+
+    def finish_replay(self, destination, results, elapsed):
+        remaining = len(self.replay_scheduler.heap)
+        self.replay_scheduler = None
+        self.tools_menu.entryconfig("Replay Case Events...", state="normal")
+        self.tools_menu.entryconfig("Stop Replay", state="disabled")
+        if remaining:
+            messagebox.showinfo("Replay Stopped", f"Replay stopped with {remaining} messages not sent.")
+        self.show_mllp_results(destination, results, elapsed)
 
     def save_and_exit(self):
         self.save_files()
@@ -463,25 +3361,33 @@ For further assistance, contact the application support team or refer to the **H
 
     def quit(self):
         if messagebox.askyesno("Confirm Quit", "Unsaved changes will be lost. Quit?"):
+            if self.journal is not None:
+                self.journal.close()
+            if self.journal_lock is not None:
+                if os.path.exists(JOURNAL_PATH):
+                    os.remove(JOURNAL_PATH)
+                self.journal_lock.close()
             self.root.quit()
 
     ### Date/Time/DOB Methods
     def set_today_date(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            patient["base_vars"]["{YYYYMMDD}"].set(datetime.now().strftime("%Y%m%d"))
+            patient.base_values["{YYYYMMDD}"] = datetime.now().strftime("%Y%m%d")
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def adjust_date(self, days):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            date_str = patient["base_vars"]["{YYYYMMDD}"].get()
+            date_str = patient.base_values["{YYYYMMDD}"]
             if date_str == "{YYYYMMDD}" or not date_str:
                 return
             try:
                 date = datetime.strptime(date_str, "%Y%m%d")
                 new_date = date + timedelta(days=days)
-                patient["base_vars"]["{YYYYMMDD}"].set(new_date.strftime("%Y%m%d"))
+                patient.base_values["{YYYYMMDD}"] = new_date.strftime("%Y%m%d")
+                self.creator_refresh_fields()
                 self.creator_update_preview()
             except ValueError:
                 messagebox.showwarning("Invalid Input", "Date must be in YYYYMMDD format.")
@@ -489,21 +3395,23 @@ For further assistance, contact the application support team or refer to the **H
     def set_now_time(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            patient["base_vars"]["{scheduledTime}"].set(datetime.now().strftime("%H%M%S"))
+            patient.base_values["{scheduledTime}"] = datetime.now().strftime("%H%M%S")
+            self.creator_refresh_fields()
             self.update_time_button_states()
             self.creator_update_preview()
 
     def adjust_time(self, hours):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            time_str = patient["base_vars"]["{scheduledTime}"].get()
+            time_str = patient.base_values["{scheduledTime}"]
             if time_str == "{scheduledTime}" or not time_str:
                 return
             try:
                 time = datetime.strptime(time_str, "%H%M%S")
                 new_time = time + timedelta(hours=hours)
                 if 0 <= new_time.hour <= 23:
-                    patient["base_vars"]["{scheduledTime}"].set(new_time.strftime("%H%M%S"))
+                    patient.base_values["{scheduledTime}"] = new_time.strftime("%H%M%S")
+                    self.creator_refresh_fields()
                     self.update_time_button_states()
                     self.creator_update_preview()
                 else:
@@ -513,7 +3421,7 @@ For further assistance, contact the application support team or refer to the **H
 
     def update_time_button_states(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            time_str = self.patients[self.current_patient_index]["base_vars"]["{scheduledTime}"].get()
+            time_str = self.patients[self.current_patient_index].base_values["{scheduledTime}"]
             if time_str == "{scheduledTime}" or not time_str:
                 self.time_minus_button.config(state="normal", fg=TEXT_COLOR)
                 self.time_plus_button.config(state="normal", fg=TEXT_COLOR)
@@ -532,7 +3440,8 @@ For further assistance, contact the application support team or refer to the **H
             end_date = datetime(2025, 12, 31)
             days = (end_date - start_date).days
             random_date = start_date + timedelta(days=random.randint(0, days))
-            self.patients[self.current_patient_index]["base_vars"]["{patientDOB}"].set(random_date.strftime("%Y%m%d"))
+            self.patients[self.current_patient_index].base_values["{patientDOB}"] = random_date.strftime("%Y%m%d")
+            self.creator_refresh_fields()
             self.update_dob_age()
             self.creator_update_preview()
 
@@ -548,7 +3457,8 @@ For further assistance, contact the application support team or refer to the **H
                 month = random.randint(1, 12)
                 day = random.randint(1, 28)  # Safe for all months
                 dob = datetime(birth_year, month, day)
-                self.patients[self.current_patient_index]["base_vars"]["{patientDOB}"].set(dob.strftime("%Y%m%d"))
+                self.patients[self.current_patient_index].base_values["{patientDOB}"] = dob.strftime("%Y%m%d")
+                self.creator_refresh_fields()
                 self.update_dob_age()
                 self.creator_update_preview()
             except ValueError:
@@ -556,7 +3466,7 @@ For further assistance, contact the application support team or refer to the **H
 
     def update_dob_age(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            dob_str = self.patients[self.current_patient_index]["base_vars"]["{patientDOB}"].get()
+            dob_str = self.patients[self.current_patient_index].base_values["{patientDOB}"]
             if dob_str == "{patientDOB}" or not dob_str:
                 self.dob_age_var.set("")
                 return
@@ -600,6 +3510,7 @@ For further assistance, contact the application support team or refer to the **H
             self.creator_content_frame, width=160, height=20, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR, font=DEFAULT_FONT
         )
         self.creator_preview_text.pack(fill=tk.X, pady=(0, 10))
+        self.creator_renderer = PreviewRenderer(self.creator_preview_text, highlighter=SyntaxHighlighter(self.creator_preview_text))
 
         # Top buttons with message type radio buttons
         self.creator_button_frame_top = tk.Frame(self.creator_content_frame, bg=BG_COLOR)
@@ -614,11 +3525,15 @@ For further assistance, contact the application support team or refer to the **H
         # Message type radio buttons frame
         message_type_frame = tk.Frame(self.creator_button_frame_top, bg=BG_COLOR)
         message_type_frame.pack(side=tk.RIGHT)
-        dummy_var = tk.StringVar(value="Scheduled & Case Events")  # Default
+        # Widget variables show the current patient only; creator_load_patient points them at its record
+        self.creator_bindings = {}
+        self.creator_loading = False
+        self.message_type_var = tk.StringVar(value="Scheduled & Case Events")  # Default
+        self.message_type_var.trace_add("write", self.creator_message_type_written)
         options = ["Scheduled", "Scheduled & Case Events", "Scheduled & Canceled"]
         for option in options:
             rb = tk.Radiobutton(
-                message_type_frame, text=option, variable=dummy_var, value=option,
+                message_type_frame, text=option, variable=self.message_type_var, value=option,
                 bg=BG_COLOR, fg=TEXT_COLOR, selectcolor=PREVIEW_BG, font=DEFAULT_FONT
             )
             rb.pack(side=tk.LEFT, padx=5)
@@ -627,6 +3542,7 @@ For further assistance, contact the application support team or refer to the **H
         self.base_prompts_frame = tk.Frame(self.creator_content_frame, bg=BG_COLOR)
         self.base_prompts_frame.pack(fill=tk.X, pady=5)
         self.base_entries = {}
+        self.base_vars = {}
         self.staff_entries = {}
         self.additional_staff = []
         self.additional_surgeons = []
@@ -794,36 +3710,38 @@ For further assistance, contact the application support team or refer to the **H
     def apply_procedure_selection(self, proc_name, proc_id, proc_desc, proc_needs, proc_cpt, proc_specialty):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            if not patient["base_vars"]["{procedure}"].get() and not patient["procedures"]:
-                patient["base_vars"]["{procedure}"].set(proc_name)
-                patient["base_vars"]["{procedureId}"].set(proc_id)
-                patient["base_vars"]["{procedureDescription}"].set(proc_desc)
-                patient["base_vars"]["{specialNeeds}"].set(proc_needs)
-                patient["base_vars"]["{cptCode}"].set(proc_cpt)
-                patient['procedure_specialty'].set(proc_specialty)
+            if not patient.base_values["{procedure}"] and not patient.procedures:
+                patient.base_values["{procedure}"] = proc_name
+                patient.base_values["{procedureId}"] = proc_id
+                patient.base_values["{procedureDescription}"] = proc_desc
+                patient.base_values["{specialNeeds}"] = proc_needs
+                patient.base_values["{cptCode}"] = proc_cpt
+                patient.procedure_specialty = proc_specialty
             else:
                 new_proc = {
-                    "{procedure}": tk.StringVar(value=proc_name),
-                    "{procedureId}": tk.StringVar(value=proc_id),
-                    "{procedureDescription}": tk.StringVar(value=proc_desc),
-                    "{specialNeeds}": tk.StringVar(value=proc_needs),
+                    "{procedure}": proc_name,
+                    "{procedureId}": proc_id,
+                    "{procedureDescription}": proc_desc,
+                    "{specialNeeds}": proc_needs,
                 }
-                patient["procedures"].append(new_proc)
+                patient.procedures.append(new_proc)
                 self.add_procedure_fields(new_proc)
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def choose_random_procedure(self):
         if 0 <= self.current_patient_index < len(self.patients):
             proc = self.procedures.sample(1).iloc[0]
             patient = self.patients[self.current_patient_index]
-            if patient["procedures"]:
-                last_proc = patient["procedures"][-1]
+            if patient.procedures:
+                last_proc = patient.procedures[-1]
                 for key, value in zip(["{procedure}", "{procedureId}", "{procedureDescription}", "{specialNeeds}"], [proc["name"], proc["id"], proc["description"], proc["special_needs"]]):
-                    last_proc[key].set(value)
+                    last_proc[key] = value
             else:
-                for key, value in zip(["{procedure}", "{procedureId}", "{procedureDescription}", "{specialNeeds}", "{cptCode}"], [proc["name"], proc["id"], proc["description"], proc["special_needs"], proc["cpt"]]):
-                    patient["base_vars"][key].set(value)
-                patient['procedure_specialty'].set(proc["specialty"])
+                for key, value in zip(["{procedure}", "{procedureId}", "{procedureDescription}", "{specialNeeds}", "{cptCode}"], [proc["name"], proc["id"], proc["description"], proc["special_needs"], str(proc["cpt"])]):
+                    patient.base_values[key] = value
+                patient.procedure_specialty = proc["specialty"]
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def toggle_procedure_browser(self):
@@ -877,11 +3795,12 @@ For further assistance, contact the application support team or refer to the **H
 
     def setup_base_prompts(self):
         self.encounter_radios = []
-        dummy_var = tk.StringVar()  # Temporary variable for radio buttons before patient is loaded
         for prompt in base_prompts:
             frame = tk.Frame(self.base_prompts_frame, bg=BG_COLOR)
             frame.pack(fill=tk.X, pady=2)
             tk.Label(frame, text=prompt['prompt'], fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=5)
+            var = self.creator_var()
+            self.base_vars[prompt['key']] = var
             if prompt['key'] == "{encounterType}":
                 radio_frame = tk.Frame(frame, bg=BG_COLOR)
                 radio_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
@@ -895,13 +3814,13 @@ For further assistance, contact the application support team or refer to the **H
                 }
                 for option, code in encounter_options.items():
                     rb = tk.Radiobutton(
-                        radio_frame, text=option, variable=dummy_var, value=code,
+                        radio_frame, text=option, variable=var, value=code,
                         bg=BG_COLOR, fg=TEXT_COLOR, selectcolor=PREVIEW_BG, font=DEFAULT_FONT
                     )
                     rb.pack(side=tk.LEFT, padx=5)
                     self.encounter_radios.append(rb)
             else:
-                entry = UppercaseEntry(frame, base_width=20, min_width=10, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+                entry = UppercaseEntry(frame, base_width=20, min_width=10, textvariable=var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
                 entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
                 self.base_entries[prompt['key']] = entry
                 self.entry_widgets.append(entry)
@@ -943,31 +3862,20 @@ For further assistance, contact the application support team or refer to the **H
 
         self.staff_group_frame = tk.Frame(self.base_prompts_frame, bg=BG_COLOR)
         self.staff_group_frame.pack(fill=tk.X, pady=10)
-        self.fixed_roles = [
-            {"role": "Primary Surgeon", "code": "1.1^Primary", "last_key": "{primaryLastName}", "first_key": "{primaryFirstName}"},
-            {"role": "Circulator", "code": "4.20^Circulator", "last_key": "{lastName}", "first_key": "{firstName}"},
-            {"role": "Scrub", "code": "4.150^Scrub", "last_key": "{lastName}", "first_key": "{firstName}"},
-            {"role": "CRNA", "code": "2.20^ANE CRNA", "last_key": "{lastName}", "first_key": "{firstName}"},
-            {"role": "Anesthesiologist", "code": "2.139^Anesthesiologist", "last_key": "{lastName}", "first_key": "{firstName}"},
-        ]
+        self.fixed_roles = fixed_roles
         for i, role_info in enumerate(self.fixed_roles):
             row_frame = tk.Frame(self.staff_group_frame, bg=BG_COLOR)
             row_frame.grid(row=i, column=0, sticky="w", pady=2)
             tk.Label(row_frame, text=f"{role_info['role']}:", fg=TEXT_COLOR, bg=BG_COLOR, width=15, anchor="w", font=DEFAULT_FONT).pack(side=tk.LEFT, padx=5)
             tk.Label(row_frame, text="Last:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-            last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+            last_var = self.creator_var()
+            first_var = self.creator_var()
+            last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=last_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
             last_entry.pack(side=tk.LEFT, padx=2)
             tk.Label(row_frame, text="First:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-            first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+            first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=first_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
             first_entry.pack(side=tk.LEFT, padx=2)
-            last_var = tk.StringVar()
-            first_var = tk.StringVar()
-            id_var = tk.StringVar(value="{surgeonID}" if role_info["role"] == "Primary Surgeon" else "{staffID}")
-            last_entry.config(textvariable=last_var)
-            first_entry.config(textvariable=first_var)
-            last_var.trace_add("write", lambda *args: self.creator_update_preview())
-            first_var.trace_add("write", lambda *args: self.creator_update_preview())
-            self.staff_entries[role_info["role"]] = {"lastName": last_var, "firstName": first_var, "id": id_var}
+            self.staff_entries[role_info["role"]] = {"lastName": last_var, "firstName": first_var}
             self.entry_widgets.append(last_entry)
             self.entry_widgets.append(first_entry)
 
@@ -975,134 +3883,147 @@ For further assistance, contact the application support team or refer to the **H
         if 0 <= self.current_patient_index < len(self.patients):
             name = self.patient_names.sample(1).iloc[0]
             patient = self.patients[self.current_patient_index]
-            patient["base_vars"]["{patientFirstName}"].set(name["First Name"])
-            patient["base_vars"]["{patientLastName}"].set(name["Last Name"])
+            patient.base_values["{patientFirstName}"] = name["First Name"]
+            patient.base_values["{patientLastName}"] = name["Last Name"]
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
+    def surgeon_sampler(self, patient):
+        # Surgeons for the patient's procedure specialty, or all surgeons if none cover it
+        specialty = patient.procedure_specialty if patient.base_values['{procedure}'] else ""
+        return self.surgeon_index.get(specialty, self.surgeon_index[""])
+
     def random_surgeon(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            surgeon = self.surgeon_names.sample(1).iloc[0]
-            self.staff_entries["Primary Surgeon"]["firstName"].set(surgeon["First Name"])
-            self.staff_entries["Primary Surgeon"]["lastName"].set(surgeon["Last Name"])
-            self.staff_entries["Primary Surgeon"]["id"].set(str(surgeon["ID"]))
-            for additional_surgeon in patient['additional_surgeons']:
-                additional_surgeon_surgeon = self.surgeon_names.sample(1).iloc[0]
-                additional_surgeon["firstName"].set(additional_surgeon_surgeon["First Name"])
-                additional_surgeon["lastName"].set(additional_surgeon_surgeon["Last Name"])
-                additional_surgeon["id"].set(str(additional_surgeon_surgeon["ID"]))
+            sampler = self.surgeon_sampler(patient)
+            surgeon = self.surgeons_by_id[sampler.sample()]
+            patient.fixed_staff["Primary Surgeon"]["firstName"] = surgeon["First Name"]
+            patient.fixed_staff["Primary Surgeon"]["lastName"] = surgeon["Last Name"]
+            patient.fixed_staff["Primary Surgeon"]["id"] = str(surgeon["ID"])
+            for additional_surgeon in patient.additional_surgeons:
+                additional_surgeon_surgeon = self.surgeons_by_id[sampler.sample()]
+                additional_surgeon["firstName"] = additional_surgeon_surgeon["First Name"]
+                additional_surgeon["lastName"] = additional_surgeon_surgeon["Last Name"]
+                additional_surgeon["id"] = str(additional_surgeon_surgeon["ID"])
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
     def random_staff(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            num_fixed_roles = 4  # Circulator, Scrub, CRNA, Anesthesiologist
-            num_additional_staff = len(patient['staff_members'])
-            total_roles = num_fixed_roles + num_additional_staff
-            if total_roles > len(self.staff_names):
+            if 4 + len(patient.staff_members) > len(self.staff_names):
                 messagebox.showwarning("Insufficient Staff", "Not enough unique staff members for all roles. Using duplicates.")
-                unique_staff = self.staff_names.sample(total_roles, replace=True)
-            else:
-                unique_staff = self.staff_names.sample(total_roles, replace=False)
-            for i, role in enumerate(["Circulator", "Scrub", "CRNA", "Anesthesiologist"]):
-                staff = unique_staff.iloc[i]
-                self.staff_entries[role]["firstName"].set(staff["First Name"])
-                self.staff_entries[role]["lastName"].set(staff["Last Name"])
-                self.staff_entries[role]["id"].set(str(staff["ID"]))
-            for j, staff_member in enumerate(patient['staff_members']):
-                staff = unique_staff.iloc[num_fixed_roles + j]
-                staff_member["firstName"].set(staff["First Name"])
-                staff_member["lastName"].set(staff["Last Name"])
-                staff_member["id"].set(str(staff["ID"]))
+            self.assign_random_staff(patient)
+            self.creator_refresh_fields()
             self.creator_update_preview()
 
+    def assign_random_staff(self, patient):
+        num_fixed_roles = 4  # Circulator, Scrub, CRNA, Anesthesiologist
+        num_additional_staff = len(patient.staff_members)
+        total_roles = num_fixed_roles + num_additional_staff
+        unique_staff = self.staff_names.sample(total_roles, replace=total_roles > len(self.staff_names))
+        for i, role in enumerate(["Circulator", "Scrub", "CRNA", "Anesthesiologist"]):
+            staff = unique_staff.iloc[i]
+            patient.fixed_staff[role]["firstName"] = staff["First Name"]
+            patient.fixed_staff[role]["lastName"] = staff["Last Name"]
+            patient.fixed_staff[role]["id"] = str(staff["ID"])
+        for j, staff_member in enumerate(patient.staff_members):
+            staff = unique_staff.iloc[num_fixed_roles + j]
+            staff_member["firstName"] = staff["First Name"]
+            staff_member["lastName"] = staff["Last Name"]
+            staff_member["id"] = str(staff["ID"])
+
     def add_surgeon(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            surgeon = {"role": tk.StringVar(value="Assistant Surgeon"), "lastName": tk.StringVar(value=""), "firstName": tk.StringVar(value=""), "id": tk.StringVar(value="{staffID}")}
-            self.patients[self.current_patient_index]['additional_surgeons'].append(surgeon)
+            surgeon = new_staff_entry("Assistant Surgeon")
+            self.patients[self.current_patient_index].additional_surgeons.append(surgeon)
             self.add_surgeon_fields(surgeon)
+            self.journal_patient()
 
     def remove_last_surgeon(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            if patient['additional_surgeons']:
-                patient['additional_surgeons'].pop()
+            if patient.additional_surgeons:
+                patient.additional_surgeons.pop()
                 self.additional_surgeons[-1]['frame'].destroy()
                 self.additional_surgeons.pop()
+                self.journal_patient()
             else:
-                self.staff_entries["Primary Surgeon"]["lastName"].set("")
-                self.staff_entries["Primary Surgeon"]["firstName"].set("")
-                self.staff_entries["Primary Surgeon"]["id"].set("{surgeonID}")
+                patient.fixed_staff["Primary Surgeon"].update(lastName="", firstName="", id="{surgeonID}")
+                self.creator_refresh_fields()
             self.creator_update_preview()
 
     def add_staff_member(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            staff = {"role": tk.StringVar(value="Staff"), "lastName": tk.StringVar(value=""), "firstName": tk.StringVar(value=""), "id": tk.StringVar(value="{staffID}")}
-            self.patients[self.current_patient_index]['staff_members'].append(staff)
+            staff = new_staff_entry("Staff")
+            self.patients[self.current_patient_index].staff_members.append(staff)
             self.add_staff_fields(staff)
+            self.journal_patient()
 
     def remove_last_staff_member(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            if patient['staff_members']:
-                patient['staff_members'].pop()
+            if patient.staff_members:
+                patient.staff_members.pop()
                 self.additional_staff[-1]['frame'].destroy()
                 self.additional_staff.pop()
+                self.journal_patient()
             else:
-                for role in ["Circulator", "Scrub", "CRNA", "Anesthesiologist"]:
-                    if self.staff_entries[role]["lastName"].get() or self.staff_entries[role]["firstName"].get():
-                        self.staff_entries[role]["lastName"].set("")
-                        self.staff_entries[role]["firstName"].set("")
-                        self.staff_entries[role]["id"].set("{staffID}")
-                        return
-                if self.staff_entries["Primary Surgeon"]["lastName"].get() or self.staff_entries["Primary Surgeon"]["firstName"].get():
-                    self.staff_entries["Primary Surgeon"]["lastName"].set("")
-                    self.staff_entries["Primary Surgeon"]["firstName"].set("")
-                    self.staff_entries["Primary Surgeon"]["id"].set("{surgeonID}")
+                for role in ["Circulator", "Scrub", "CRNA", "Anesthesiologist", "Primary Surgeon"]:
+                    staff = patient.fixed_staff[role]
+                    if staff["lastName"] or staff["firstName"]:
+                        staff.update(lastName="", firstName="", id="{surgeonID}" if role == "Primary Surgeon" else "{staffID}")
+                        break
+                self.creator_refresh_fields()
             self.creator_update_preview()
 
     def random_patient_full(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            patient = self.patients[self.current_patient_index]
-            name = self.patient_names.sample(1).iloc[0]
-            first_name = name["First Name"]
-            last_name = name["Last Name"]
-            patient["base_vars"]["{patientFirstName}"].set(first_name)
-            patient["base_vars"]["{patientLastName}"].set(last_name)
-            gender = "F" if first_name.lower()[-1] in ['a', 'e', 'i'] else "M"
-            patient["base_vars"]["{patientGender}"].set(gender)
-            self.random_dob()
-            self.last_mrn += 1
-            patient["base_vars"]["{patientMRN}"].set(str(self.last_mrn))
-            duration = random.randint(60, 120)
-            patient["base_vars"]["{duration}"].set(str(duration))
-            proc = self.procedures.sample(1).iloc[0]
-            patient["base_vars"]["{procedure}"].set(proc["name"])
-            patient["base_vars"]["{procedureId}"].set(proc["id"])
-            patient["base_vars"]["{procedureDescription}"].set(proc["description"])
-            patient["base_vars"]["{specialNeeds}"].set(proc["special_needs"])
-            patient["base_vars"]["{cptCode}"].set(proc["cpt"])
-            patient['procedure_specialty'].set(proc["specialty"])
-            surgeon = self.surgeon_names.sample(1).iloc[0]
-            self.staff_entries["Primary Surgeon"]["firstName"].set(surgeon["First Name"])
-            self.staff_entries["Primary Surgeon"]["lastName"].set(surgeon["Last Name"])
-            self.staff_entries["Primary Surgeon"]["id"].set(str(surgeon["ID"]))
-            self.random_staff()  # Call to assign unique staff
-            patient["base_vars"]["{YYYYMMDD}"].set(datetime.now().strftime("%Y%m%d"))
-            patient["base_vars"]["{scheduledTime}"].set(datetime.now().strftime("%H%M%S"))
+            self.randomize_patient(self.patients[self.current_patient_index])
+            self.creator_refresh_fields()
+            self.update_dob_age()
             self.creator_update_preview()
 
+    def randomize_patient(self, patient):
+        name = self.patient_names.sample(1).iloc[0]
+        first_name = name["First Name"]
+        last_name = name["Last Name"]
+        patient.base_values["{patientFirstName}"] = first_name
+        patient.base_values["{patientLastName}"] = last_name
+        gender = "F" if first_name.lower()[-1] in ['a', 'e', 'i'] else "M"
+        patient.base_values["{patientGender}"] = gender
+        start_date = datetime(1940, 1, 1)
+        random_date = start_date + timedelta(days=random.randint(0, (datetime(2025, 12, 31) - start_date).days))
+        patient.base_values["{patientDOB}"] = random_date.strftime("%Y%m%d")
+        self.last_mrn += 1
+        patient.base_values["{patientMRN}"] = str(self.last_mrn)
+        duration = random.randint(60, 120)
+        patient.base_values["{duration}"] = str(duration)
+        proc = self.procedures.sample(1).iloc[0]
+        patient.base_values["{procedure}"] = proc["name"]
+        patient.base_values["{procedureId}"] = proc["id"]
+        patient.base_values["{procedureDescription}"] = proc["description"]
+        patient.base_values["{specialNeeds}"] = proc["special_needs"]
+        patient.base_values["{cptCode}"] = str(proc["cpt"])
+        patient.procedure_specialty = proc["specialty"]
+        surgeon = self.surgeons_by_id[self.surgeon_sampler(patient).sample()]
+        patient.fixed_staff["Primary Surgeon"]["firstName"] = surgeon["First Name"]
+        patient.fixed_staff["Primary Surgeon"]["lastName"] = surgeon["Last Name"]
+        patient.fixed_staff["Primary Surgeon"]["id"] = str(surgeon["ID"])
+        self.assign_random_staff(patient)
+        patient.base_values["{YYYYMMDD}"] = datetime.now().strftime("%Y%m%d")
+        patient.base_values["{scheduledTime}"] = datetime.now().strftime("%H%M%S")
+
     def clear_all(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            for var in patient['base_vars'].values():
-                var.set("")
-            patient['base_vars']['{encounterType}'].set("IP")  # Reset to default
-            patient['message_type'].set("Scheduled & Case Events")  # Reset to default
-            for role in self.staff_entries:
-                self.staff_entries[role]["lastName"].set("")
-                self.staff_entries[role]["firstName"].set("")
-                self.staff_entries[role]["id"].set("{surgeonID}" if role == "Primary Surgeon" else "{staffID}")
+            for key in patient.base_values:
+                patient.base_values[key] = ""
+            patient.base_values['{encounterType}'] = "IP"  # Reset to default
+            patient.message_type = "Scheduled & Case Events"  # Reset to default
+            for role, staff in patient.fixed_staff.items():
+                staff.update(lastName="", firstName="", id="{surgeonID}" if role == "Primary Surgeon" else "{staffID}")
             for item in self.additional_staff + self.additional_surgeons:
                 item['frame'].destroy()
             self.additional_staff = []
@@ -1110,10 +4031,11 @@ For further assistance, contact the application support team or refer to the **H
             for frame in self.procedure_frames:
                 frame.destroy()
             self.procedure_frames = []
-            patient['procedures'] = []
-            patient['staff_members'] = []
-            patient['additional_surgeons'] = []
-            patient['allergies'] = []
+            patient.procedures = []
+            patient.staff_members = []
+            patient.additional_surgeons = []
+            patient.allergies = []
+            self.creator_refresh_fields()
             self.update_allergies_display()
             self.creator_update_preview()
 
@@ -1121,17 +4043,16 @@ For further assistance, contact the application support team or refer to the **H
         row = len(self.staff_entries) + len(self.additional_staff)
         row_frame = tk.Frame(self.staff_group_frame, bg=BG_COLOR)
         row_frame.grid(row=row, column=0, sticky="w", pady=2)
-        role_entry = UppercaseEntry(row_frame, base_width=15, min_width=10, textvariable=staff["role"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        role_var, last_var, first_var = (self.bind_creator_var(self.creator_var(), staff, key) for key in ("role", "lastName", "firstName"))
+        role_entry = UppercaseEntry(row_frame, base_width=15, min_width=10, textvariable=role_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         role_entry.pack(side=tk.LEFT, padx=5)
         tk.Label(row_frame, text=":", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT)
         tk.Label(row_frame, text="Last:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-        last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=staff["lastName"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=last_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         last_entry.pack(side=tk.LEFT, padx=2)
         tk.Label(row_frame, text="First:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-        first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=staff["firstName"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=first_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         first_entry.pack(side=tk.LEFT, padx=2)
-        for var in [staff["role"], staff["lastName"], staff["firstName"]]:
-            var.trace_add("write", lambda *args: self.creator_update_preview())
         self.additional_staff.append({"frame": row_frame, "vars": staff})
         self.entry_widgets.extend([role_entry, last_entry, first_entry])
 
@@ -1139,17 +4060,16 @@ For further assistance, contact the application support team or refer to the **H
         row = len(self.staff_entries) + len(self.additional_surgeons)
         row_frame = tk.Frame(self.staff_group_frame, bg=BG_COLOR)
         row_frame.grid(row=row, column=0, sticky="w", pady=2)
-        role_entry = UppercaseEntry(row_frame, base_width=15, min_width=10, textvariable=surgeon["role"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        role_var, last_var, first_var = (self.bind_creator_var(self.creator_var(), surgeon, key) for key in ("role", "lastName", "firstName"))
+        role_entry = UppercaseEntry(row_frame, base_width=15, min_width=10, textvariable=role_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         role_entry.pack(side=tk.LEFT, padx=5)
         tk.Label(row_frame, text=":", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT)
         tk.Label(row_frame, text="Last:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-        last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=surgeon["lastName"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        last_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=last_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         last_entry.pack(side=tk.LEFT, padx=2)
         tk.Label(row_frame, text="First:", fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=2)
-        first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=surgeon["firstName"], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+        first_entry = UppercaseEntry(row_frame, base_width=18, min_width=10, textvariable=first_var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
         first_entry.pack(side=tk.LEFT, padx=2)
-        for var in [surgeon["role"], surgeon["lastName"], surgeon["firstName"]]:
-            var.trace_add("write", lambda *args: self.creator_update_preview())
         self.additional_surgeons.append({"frame": row_frame, "vars": surgeon})
         self.entry_widgets.extend([role_entry, last_entry, first_entry])
 
@@ -1164,72 +4084,120 @@ For further assistance, contact the application support team or refer to the **H
         if self.mode != "Creator":
             messagebox.showwarning("Invalid Mode", "New Patient is only available in Creator mode.")
             return
-        patient = {
-            'base_vars': {p['key']: tk.StringVar(value='IP' if p['key'] == '{encounterType}' else '') for p in base_prompts},
-            'procedures': [],
-            'staff_members': [],
-            'additional_surgeons': [],
-            'allergies': [],
-            'messages': [],
-            'procedure_specialty': tk.StringVar(value="GEN"),
-            'message_type': tk.StringVar(value="Scheduled & Case Events")  # Default message type
-        }
-        self.patients.append(patient)
+        self.patients.append(self.new_patient_record())
         self.current_patient_index = len(self.patients) - 1
+        self.journal_patient()
         self.creator_load_patient()
 
+    def new_patient_record(self):
+        return PatientRecord()
+
+    def creator_var(self):
+        var = tk.StringVar()
+        var.trace_add("write", self.creator_var_written)
+        return var
+
+    def bind_creator_var(self, var, store, key):
+        # Point a widget variable at one field of the current patient's record
+        self.creator_bindings.pop(str(var), None)
+        var.set(store[key])
+        self.creator_bindings[str(var)] = (var, store, key)
+        return var
+
+    def creator_var_written(self, name, *args):
+        binding = self.creator_bindings.get(name)
+        if binding is not None:
+            var, store, key = binding
+            store[key] = var.get()
+            if not self.creator_loading:
+                self.journal_field(store, key)
+                self.creator_update_preview()
+
+    def creator_message_type_written(self, *args):
+        if 0 <= self.current_patient_index < len(self.patients):
+            self.patients[self.current_patient_index].message_type = self.message_type_var.get()
+            if not self.creator_loading:
+                self.journal_append({"op": "set", "i": self.current_patient_index, "path": ["message_type"], "value": self.message_type_var.get()})
+                self.creator_update_preview()
+
+    def creator_refresh_fields(self):
+        # Show record values that were changed in code rather than typed
+        self.creator_loading = True
+        for var, store, key in self.creator_bindings.values():
+            if var.get() != store[key]:
+                var.set(store[key])
+        self.message_type_var.set(self.patients[self.current_patient_index].message_type)
+        self.creator_loading = False
+        self.journal_patient()
+
+    def creator_load_records(self, indexes):
+        """Decode restored session records before they are used. One that cannot be read is
+        replaced with an empty patient, with a warning naming it."""
+        damaged = []
+        for index in indexes:
+            patient = self.patients[index]
+            if patient.session_line is None:
+                continue
+            try:
+                patient.load_session_line(patient.session_line)
+            except (ValueError, KeyError, TypeError) as e:
+                self.patients[index] = PatientRecord()
+                self.journal_patient(index)
+                damaged.append(f"Patient {index + 1}: {e!r}")
+        if damaged:
+            messagebox.showwarning("Damaged Session Records", "These patients could not be read from the session file "
+                                   "and were replaced with empty patients:\n\n" + "\n".join(damaged[:20]))
+
     def creator_load_patient(self):
+        self.creator_load_records([self.current_patient_index])
         patient = self.patients[self.current_patient_index]
-        for rb in self.encounter_radios:
-            rb.config(variable=patient['base_vars']['{encounterType}'])
-        for rb in self.message_type_radios:
-            rb.config(variable=patient['message_type'])
-        for key, entry in self.base_entries.items():
-            var = patient['base_vars'][key]
-            entry.config(textvariable=var)
-            if var.trace_info():
-                var.trace_remove("write", var.trace_info()[0][1])
-            var.trace_add("write", lambda *args: self.creator_update_preview())
-        patient['message_type'].trace_add("write", lambda *args: self.creator_update_preview())
-        for role in self.staff_entries:
-            self.staff_entries[role]["lastName"].set("")
-            self.staff_entries[role]["firstName"].set("")
-            self.staff_entries[role]["id"].set("{surgeonID}" if role == "Primary Surgeon" else "{staffID}")
+        self.creator_loading = True
+        self.creator_bindings = {}
+        for key, var in self.base_vars.items():
+            self.bind_creator_var(var, patient.base_values, key)
+        for role, entries in self.staff_entries.items():
+            for key, var in entries.items():
+                self.bind_creator_var(var, patient.fixed_staff[role], key)
+        self.message_type_var.set(patient.message_type)
         for item in self.additional_staff + self.additional_surgeons:
             item['frame'].destroy()
         self.additional_staff = []
         self.additional_surgeons = []
-        for staff in patient['staff_members']:
+        for staff in patient.staff_members:
             self.add_staff_fields(staff)
-        for surgeon in patient['additional_surgeons']:
+        for surgeon in patient.additional_surgeons:
             self.add_surgeon_fields(surgeon)
         for widget in self.procedures_frame.winfo_children():
             widget.destroy()
         self.procedure_frames = []
-        for proc in patient['procedures']:
+        for proc in patient.procedures:
             self.add_procedure_fields(proc)
+        self.creator_loading = False
         self.update_allergies_display()
         self.creator_update_preview()
         self.creator_update_button_states()
 
     def add_procedure(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            proc = {f['key']: tk.StringVar(value="") for f in procedure_fields}
-            self.patients[self.current_patient_index]['procedures'].append(proc)
+            proc = {f['key']: "" for f in procedure_fields}
+            self.patients[self.current_patient_index].procedures.append(proc)
             self.add_procedure_fields(proc)
+            self.journal_patient()
             self.creator_update_preview()
 
     def remove_last_procedure(self):
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
-            if patient['procedures']:
-                patient['procedures'].pop()
+            if patient.procedures:
+                patient.procedures.pop()
                 if self.procedure_frames:
                     self.procedure_frames[-1].destroy()
                     self.procedure_frames.pop()
+                self.journal_patient()
             else:
                 for key in ["{procedure}", "{procedureDescription}", "{specialNeeds}", "{procedureId}", "{cptCode}"]:
-                    patient['base_vars'][key].set("")
+                    patient.base_values[key] = ""
+                self.creator_refresh_fields()
             self.creator_update_preview()
 
     def add_procedure_fields(self, proc):
@@ -1240,9 +4208,9 @@ For further assistance, contact the application support team or refer to the **H
             subframe = tk.Frame(frame, bg=BG_COLOR)
             subframe.pack(fill=tk.X, pady=2)
             tk.Label(subframe, text=field['prompt'], fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=5)
-            entry = UppercaseEntry(subframe, base_width=20, min_width=10, textvariable=proc[field['key']], bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
+            var = self.bind_creator_var(self.creator_var(), proc, field['key'])
+            entry = UppercaseEntry(subframe, base_width=20, min_width=10, textvariable=var, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR)
             entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
-            proc[field['key']].trace_add("write", lambda *args: self.creator_update_preview())
             self.entry_widgets.append(entry)
 
     def populate_allergy_tree(self, filter_text=""):
@@ -1264,7 +4232,8 @@ For further assistance, contact the application support team or refer to the **H
             values = self.allergy_tree.item(item[0], "values")
             if values:
                 allergy = {"allergyID": values[0], "allergyName": values[1], "allergyReaction": values[2], "allergySeverity": values[3]}
-                self.patients[self.current_patient_index]['allergies'].append(allergy)
+                self.patients[self.current_patient_index].allergies.append(allergy)
+                self.journal_patient()
                 self.update_allergies_display()
                 self.creator_update_preview()
 
@@ -1274,13 +4243,14 @@ For further assistance, contact the application support team or refer to the **H
             values = self.allergy_tree.item(item[0], "values")
             if values:
                 allergy = {"allergyID": values[0], "allergyName": values[1], "allergyReaction": values[2], "allergySeverity": values[3]}
-                self.patients[self.current_patient_index]['allergies'].append(allergy)
+                self.patients[self.current_patient_index].allergies.append(allergy)
+                self.journal_patient()
                 self.update_allergies_display()
                 self.creator_update_preview()
 
     def update_allergies_display(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            allergies = self.patients[self.current_patient_index]['allergies']
+            allergies = self.patients[self.current_patient_index].allergies
             if allergies:
                 display_text = ", ".join([allergy['allergyName'] for allergy in allergies])
             else:
@@ -1291,16 +4261,16 @@ For further assistance, contact the application support team or refer to the **H
         if 0 <= self.current_patient_index < len(self.patients):
             patient = self.patients[self.current_patient_index]
             template = self.build_template(patient)
-            template = self.add_staff_segment(template)
-            message_type = patient['message_type'].get()
+            template = self.add_staff_segment(template, patient)
+            message_type = patient.message_type
             if message_type == "Scheduled & Case Events":
                 preview_template = template  # Full template with OBX for event messages
                 trigger_event = "S14"
             else:
                 preview_template = "\n".join(line for line in template.splitlines() if not line.startswith("OBX"))  # Without OBX
                 trigger_event = "S12" if message_type == "Scheduled" else "S15"
-            base_values = {k: v.get() for k, v in patient['base_vars'].items()}
-            base_values["{specialty}"] = patient['procedure_specialty'].get()
+            base_values = dict(patient.base_values)
+            base_values["{specialty}"] = patient.procedure_specialty
             preview_text = preview_template
             for key, val in base_values.items():
                 if val:
@@ -1308,8 +4278,8 @@ For further assistance, contact the application support team or refer to the **H
             preview_text = preview_text.replace("{triggerEvent}", trigger_event)
             # Add ADT message preview
             al1_segments = []
-            if patient['allergies']:
-                for i, allergy in enumerate(patient['allergies'], start=1):
+            if patient.allergies:
+                for i, allergy in enumerate(patient.allergies, start=1):
                     reaction = allergy['allergyReaction'] if allergy['allergyReaction'] else ""
                     severity = allergy['allergySeverity'] if allergy['allergySeverity'] else ""
                     al1_segment = f"AL1|{i}||{allergy['allergyID']}^{allergy['allergyName']}|{severity}|{reaction}|"
@@ -1322,13 +4292,12 @@ For further assistance, contact the application support team or refer to the **H
                     adt_preview = adt_preview.replace(key, val)
             adt_preview = adt_preview.replace("{eventTime}", base_values.get("{scheduledTime}", "{eventTime}"))
             preview_text += "\n\n" + adt_preview
-            self.creator_preview_text.delete(1.0, tk.END)
-            self.creator_preview_text.insert(tk.END, preview_text)
+            self.creator_renderer.render(preview_text)
 
     def build_template(self, patient):
         template = default_hl7
-        for i, proc in enumerate(patient['procedures'], start=2):
-            proc_values = {k: v.get() for k, v in proc.items() if v.get()}
+        for i, proc in enumerate(patient.procedures, start=2):
+            proc_values = {k: v for k, v in proc.items() if v}
             template = self.add_procedure_segments(template, i, proc_values)
         return template
 
@@ -1358,40 +4327,40 @@ For further assistance, contact the application support team or refer to the **H
         lines[insert_idx:insert_idx] = new_block
         return "\n".join(lines)
 
-    def add_staff_segment(self, template):
+    def add_staff_segment(self, template, patient):
         lines = template.splitlines()
         lines = [line for line in lines if not line.startswith("AIP|")]
         insert_idx = next(i for i, line in enumerate(lines) if line.startswith("AIL|")) + 1
         new_aip_lines = []
-        patient = self.patients[self.current_patient_index]
-        specialty = patient['procedure_specialty'].get() if patient['base_vars']['{procedure}'].get() else "GEN"
-        primary_last = self.staff_entries["Primary Surgeon"]["lastName"].get() or "{primaryLastName}"
-        primary_first = self.staff_entries["Primary Surgeon"]["firstName"].get() or "{primaryFirstName}"
-        surgeon_id = self.staff_entries["Primary Surgeon"]["id"].get() or "{surgeonID}"
+        staff_entries = patient.fixed_staff
+        specialty = patient.procedure_specialty if patient.base_values['{procedure}'] else "GEN"
+        primary_last = staff_entries["Primary Surgeon"]["lastName"] or "{primaryLastName}"
+        primary_first = staff_entries["Primary Surgeon"]["firstName"] or "{primaryFirstName}"
+        surgeon_id = staff_entries["Primary Surgeon"]["id"] or "{surgeonID}"
         aip_line = f"AIP|1||{surgeon_id}^{primary_last}^{primary_first}^W^^^^^EPIC^^^^PROVID|1.1^Primary Surgeon|{specialty}|{{YYYYMMDD}}{{scheduledTime}}|0|S|{{duration}}|S"
         new_aip_lines.append(aip_line)
-        for i, surgeon in enumerate(patient['additional_surgeons'], start=2):
-            last_name = surgeon["lastName"].get() or "{lastName}"
-            first_name = surgeon["firstName"].get() or "{firstName}"
-            staff_id = surgeon["id"].get() or "{staffID}"
+        for i, surgeon in enumerate(patient.additional_surgeons, start=2):
+            last_name = surgeon["lastName"] or "{lastName}"
+            first_name = surgeon["firstName"] or "{firstName}"
+            staff_id = surgeon["id"] or "{staffID}"
             role_code = f"1.{i}^Assistant Surgeon"
             aip_line = f"AIP|{i}||{staff_id}^{last_name}^{first_name}^W^^^^^EPIC^^^^PROVID|{role_code}|{specialty}|{{YYYYMMDD}}{{scheduledTime}}|0|S|{{duration}}|S"
             new_aip_lines.append(aip_line)
-        aip_count = len(patient['additional_surgeons']) + 1
+        aip_count = len(patient.additional_surgeons) + 1
         for role in ["Circulator", "Scrub", "CRNA", "Anesthesiologist"]:
             aip_count += 1
-            last_name = self.staff_entries[role]["lastName"].get() or "{lastName}"
-            first_name = self.staff_entries[role]["firstName"].get() or "{firstName}"
-            staff_id = self.staff_entries[role]["id"].get() or "{staffID}"
+            last_name = staff_entries[role]["lastName"] or "{lastName}"
+            first_name = staff_entries[role]["firstName"] or "{firstName}"
+            staff_id = staff_entries[role]["id"] or "{staffID}"
             role_info = next(r for r in self.fixed_roles if r["role"] == role)
             aip_line = f"AIP|{aip_count}||{staff_id}^{last_name}^{first_name}^W^^^^^EPIC^^^^PROVID|{role_info['code']}|GEN|{{YYYYMMDD}}{{scheduledTime}}|0|S|{{duration}}|S"
             new_aip_lines.append(aip_line)
-        for staff in patient['staff_members']:
+        for staff in patient.staff_members:
             aip_count += 1
-            role = staff["role"].get() or "Staff"
-            last_name = staff["lastName"].get() or "{lastName}"
-            first_name = staff["firstName"].get() or "{firstName}"
-            staff_id = staff["id"].get() or "{staffID}"
+            role = staff["role"] or "Staff"
+            last_name = staff["lastName"] or "{lastName}"
+            first_name = staff["firstName"] or "{firstName}"
+            staff_id = staff["id"] or "{staffID}"
             aip_line = f"AIP|{aip_count}||{staff_id}^{last_name}^{first_name}^L^^^^^^EPIC^^^^PROVID|{role}||{{YYYYMMDD}}{{scheduledTime}}|0|S|{{duration}}|S"
             new_aip_lines.append(aip_line)
         lines[insert_idx:insert_idx] = new_aip_lines
@@ -1403,8 +4372,8 @@ For further assistance, contact the application support team or refer to the **H
                 template = template.replace(key, val)
         return template
 
-    def build_event_messages(self, template, base_values, duration_min):
-        message_type = self.patients[self.current_patient_index]['message_type'].get()
+    def build_event_messages(self, patient, template, base_values, duration_min, event_times=None):
+        message_type = patient.message_type
         s12_template = "\n".join(line for line in template.splitlines() if not line.startswith("OBX"))
         event_template = template  # Full template with OBX for event messages
         scheduled_time = base_values.get("{scheduledTime}", "{scheduledTime}")
@@ -1426,32 +4395,7 @@ For further assistance, contact the application support team or refer to the **H
             messages.append((s12_msg, "00"))
             # Event messages with S14
             if is_valid_scheduled_time:
-                base_dt = datetime.strptime("19700101" + scheduled_time, "%Y%m%d%H%M%S")
-                event_dts = {}
-                for event_name, offset in case_events:
-                    if isinstance(offset, str):
-                        if offset.startswith("duration"):
-                            parts = offset.split("-")
-                            if len(parts) == 2 and parts[1].isdigit():
-                                delta = int(parts[1])
-                                minutes = duration_min - delta
-                            else:
-                                minutes = 0
-                        else:
-                            match = re.match(r"(\w+)([+-]\d+)", offset)
-                            if match:
-                                base_event, delta_str = match.groups()
-                                delta = int(delta_str)
-                                if base_event in event_dts:
-                                    base_event_dt = event_dts[base_event]
-                                    event_dt = base_event_dt + timedelta(minutes=delta + random.randint(-2, 2))
-                                    event_dts[event_name] = event_dt
-                                    continue
-                            minutes = 0
-                    else:
-                        minutes = offset
-                    event_dt = base_dt + timedelta(minutes=minutes + random.randint(-2, 2))
-                    event_dts[event_name] = event_dt
+                event_dts = event_times or compute_case_event_times(datetime.strptime("19700101" + scheduled_time, "%Y%m%d%H%M%S"), duration_min)
                 for i, (event_name, _) in enumerate(case_events):
                     event_replacements = base_values.copy()
                     event_replacements["{triggerEvent}"] = "S14"
@@ -1483,41 +4427,84 @@ For further assistance, contact the application support team or refer to the **H
 
     def create_patient(self):
         if 0 <= self.current_patient_index < len(self.patients):
-            patient = self.patients[self.current_patient_index]
-            template = self.build_template(patient)
-            template = self.add_staff_segment(template)
-            base_values = {k: v.get() for k, v in patient['base_vars'].items()}
-            base_values["{specialty}"] = patient['procedure_specialty'].get()
-            duration = base_values.get("{duration}", "")
-            duration_min = int(duration) if duration.isdigit() else random.randint(60, 120)
-            siu_messages = self.build_event_messages(template, base_values, duration_min)
-            patient['messages'] = siu_messages
-            # Generate ADT message
-            al1_segments = []
-            if patient['allergies']:
-                for i, allergy in enumerate(patient['allergies'], start=1):
-                    reaction = allergy['allergyReaction'] if allergy['allergyReaction'] else ""
-                    severity = allergy['allergySeverity'] if allergy['allergySeverity'] else ""
-                    al1_segment = f"AL1|{i}||{allergy['allergyID']}^{allergy['allergyName']}|{severity}|{reaction}|"
-                    al1_segments.append(al1_segment)
-            else:
-                al1_segments = ["AL1|1||NKA^No Known Allergies||"]
-            adt_message = adt_template.replace("{AL1_segments}", "\n".join(al1_segments))
-            for key, val in base_values.items():
-                if val:
-                    adt_message = adt_message.replace(key, val)
-            adt_message = adt_message.replace("{eventTime}", base_values.get("{scheduledTime}", "{eventTime}"))
-            patient['messages'].append((adt_message, "ADT"))
+            self.generate_patient_messages(self.patients[self.current_patient_index])
+            self.journal_patient()
             messagebox.showinfo("Success", "Patient messages generated. Edit fields as needed.")
 
+    def generate_patient_messages(self, patient):
+        template = self.build_template(patient)
+        template = self.add_staff_segment(template, patient)
+        base_values = dict(patient.base_values)
+        base_values["{specialty}"] = patient.procedure_specialty
+        duration = base_values.get("{duration}", "")
+        duration_min = int(duration) if duration.isdigit() else random.randint(60, 120)
+        start_dt = case_start(base_values)
+        event_times = compute_case_event_times(start_dt, duration_min) if start_dt and patient.message_type == "Scheduled & Case Events" else {}
+        siu_messages = self.build_event_messages(patient, template, base_values, duration_min, event_times)
+        patient.messages = siu_messages
+        patient.case_record = self.creator_case_record(patient, base_values, duration_min, start_dt, event_times)
+        # Generate ADT message
+        al1_segments = []
+        if patient.allergies:
+            for i, allergy in enumerate(patient.allergies, start=1):
+                reaction = allergy['allergyReaction'] if allergy['allergyReaction'] else ""
+                severity = allergy['allergySeverity'] if allergy['allergySeverity'] else ""
+                al1_segment = f"AL1|{i}||{allergy['allergyID']}^{allergy['allergyName']}|{severity}|{reaction}|"
+                al1_segments.append(al1_segment)
+        else:
+            al1_segments = ["AL1|1||NKA^No Known Allergies||"]
+        adt_message = adt_template.replace("{AL1_segments}", "\n".join(al1_segments))
+        for key, val in base_values.items():
+            if val:
+                adt_message = adt_message.replace(key, val)
+        adt_message = adt_message.replace("{eventTime}", base_values.get("{scheduledTime}", "{eventTime}"))
+        patient.messages.append((adt_message, "ADT"))
+
+    def creator_case_record(self, patient, base_values, duration_min, start_dt, event_times):
+        # Snapshot of what the messages were built from, for the case data export
+        staff_entries = patient.fixed_staff
+        staff = [("Primary Surgeon", *(staff_entries["Primary Surgeon"][k] for k in ("id", "lastName", "firstName")))]
+        staff += [(surgeon["role"], surgeon["id"], surgeon["lastName"], surgeon["firstName"]) for surgeon in patient.additional_surgeons]
+        staff += [(role, *(staff_entries[role][k] for k in ("id", "lastName", "firstName"))) for role in ["Circulator", "Scrub", "CRNA", "Anesthesiologist"]]
+        staff += [(member["role"] or "Staff", member["id"], member["lastName"], member["firstName"]) for member in patient.staff_members]
+        return {
+            'values': dict(base_values),
+            'message_type': patient.message_type,
+            'duration_min': duration_min,
+            'start': start_dt,
+            'staff': [(role, "" if staff_id.startswith("{") else staff_id, last_name, first_name) for role, staff_id, last_name, first_name in staff],
+            'procedures': [dict(proc) for proc in patient.procedures],
+            'allergies': [dict(allergy) for allergy in patient.allergies],
+            'event_times': dict(event_times),
+        }
+
+    def export_case_data(self):
+        self.creator_load_records(range(len(self.patients)))
+        records = [patient.case_record for patient in self.patients if patient.messages and patient.case_record is not None]
+        if not records:
+            messagebox.showwarning("Nothing to Export", "Create patient messages first.")
+            return
+        out_dir = filedialog.askdirectory(title="Select Export Directory", initialdir=DATA_DIR, mustexist=True)
+        if not out_dir:
+            return
+        try:
+            counts = export_case_records(out_dir, records)
+        except OSError as e:
+            messagebox.showerror("Export Failed", str(e))
+            return
+        summary = ", ".join(f"{table}: {count} rows" for table, count in counts.items())
+        messagebox.showinfo("Export Complete", f"Exported {len(records)} cases as {'Parquet' if pa is not None else 'NumPy .npz'} to {out_dir}\n\n{summary}")
+
     def creator_prev_patient(self):
         if self.current_patient_index > 0:
             self.current_patient_index -= 1
+            self.journal_append({"op": "current", "i": self.current_patient_index})
             self.creator_load_patient()
 
     def creator_next_patient(self):
         if self.current_patient_index < len(self.patients) - 1:
             self.current_patient_index += 1
+            self.journal_append({"op": "current", "i": self.current_patient_index})
             self.creator_load_patient()
 
     ### Editor Mode
@@ -1552,11 +4539,26 @@ For further assistance, contact the application support team or refer to the **H
         self.apply_mode = tk.StringVar(value="Current")
         tk.OptionMenu(self.apply_frame, self.apply_mode, "Current", "All").pack(side=tk.LEFT, padx=5)
         tk.Button(self.apply_frame, text="Apply", command=self.editor_apply_changes, fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.LEFT, padx=5)
+        tk.Button(self.apply_frame, text="Changed Files", command=self.show_changed_files, fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT).pack(side=tk.RIGHT, padx=5)
+        self.diff_button = tk.Button(self.apply_frame, text="Show Diff", command=self.toggle_diff_pane, fg=TEXT_COLOR, bg=BG_COLOR, font=DEFAULT_FONT)
+        self.diff_button.pack(side=tk.RIGHT, padx=5)
 
         self.editor_preview_text = scrolledtext.ScrolledText(
             self.editor_content_frame, width=80, height=20, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR, font=DEFAULT_FONT, state="disabled"
         )
         self.editor_preview_text.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        self.editor_preview_text.bind("<ButtonRelease-1>", self.editor_click_field)
+        self.editor_highlighter = SyntaxHighlighter(self.editor_preview_text)
+        self.editor_renderer = PreviewRenderer(self.editor_preview_text, highlighter=self.editor_highlighter)
+        # Direct edits re-tag only the lines between where a keystroke started and ended
+        self.edit_start_line = 1
+        self.editor_preview_text.bind("<KeyPress>", self.editor_mark_edit_start)
+        self.editor_preview_text.bind("<KeyRelease>", self.editor_retag_edited_lines)
+        self.preview_offset_map = None
+        self.editor_diff_text = scrolledtext.ScrolledText(
+            self.editor_content_frame, width=80, height=8, bg=PREVIEW_BG, fg=TEXT_COLOR, insertbackground=TEXT_COLOR, font=DEFAULT_FONT, state="disabled"
+        )
+        self.diff_pane_visible = False
 
         self.direct_edit_frame = tk.Frame(self.editor_content_frame, bg=BG_COLOR)
         self.direct_edit_frame.pack(fill=tk.X, pady=5)
@@ -1587,30 +4589,13 @@ For further assistance, contact the application support team or refer to the **H
         self.editor_update_preview()
 
     def parse_hl7_message(self, message_text):
-        parsed_values = {}
-        lines = message_text.splitlines()
-        for line in lines:
-            if line.startswith("AIL"):
-                parts = line.split("|")
-                if len(parts) > 3:
-                    location_parts = parts[3].split("^")
-                    if len(location_parts) >= 2:
-                        parsed_values["{locationOR}"] = location_parts[1]
-                        parsed_values["{locationDepartment}"] = location_parts[3]
-            elif line.startswith("PID"):
-                parts = line.split("|")
-                if len(parts) > 3:
-                    parsed_values["{patientMRN}"] = parts[3].split("^")[0]
-        return parsed_values
+        return editor_field_extractor.extract(message_text)
 
     def editor_load_message(self):
         if 0 <= self.current_patient_index < len(self.patient_blocks) and 0 <= self.current_message_index < len(self.patient_blocks[self.current_patient_index]['messages']):
-            message = self.patient_blocks[self.current_patient_index]['messages'][self.current_message_index]
+            message = self.editor_ensure_loaded(self.patient_blocks[self.current_patient_index]['messages'][self.current_message_index])
             self.editor_context_label.config(text=f"Patient: {self.patient_blocks[self.current_patient_index]['patient_name']}, Message {self.current_message_index + 1} of {len(self.patient_blocks[self.current_patient_index]['messages'])}")
-            self.editor_preview_text.config(state="normal")
-            self.editor_preview_text.delete(1.0, tk.END)
-            self.editor_preview_text.insert(tk.END, message['message_text'])
-            self.editor_preview_text.config(state="disabled")
+            self.editor_renderer.render(message['message_text'])
             parsed_values = message['parsed_values']
             for key, entry in self.editor_base_entries.items():
                 value = parsed_values.get(key, "")
@@ -1620,48 +4605,169 @@ For further assistance, contact the application support team or refer to the **H
                 else:
                     entry.delete(0, tk.END)
                     entry.insert(0, value)
+            self.editor_update_diff()
         else:
             self.editor_context_label.config(text="No messages loaded")
-            self.editor_preview_text.config(state="normal")
-            self.editor_preview_text.delete(1.0, tk.END)
-            self.editor_preview_text.insert(tk.END, "No patient blocks found.\n")
-            self.editor_preview_text.config(state="disabled")
+            self.editor_renderer.render("No patient blocks found.\n")
+
+    def editor_offset_map(self):
+        # Offsets of the previewed text, cached on the current message and rebuilt only when the text changes
+        text = self.editor_renderer.text()
+        message = None
+        if 0 <= self.current_patient_index < len(self.patient_blocks):
+            messages = self.patient_blocks[self.current_patient_index]['messages']
+            if 0 <= self.current_message_index < len(messages):
+                message = messages[self.current_message_index]
+        offsets = message['offset_map'] if message is not None else self.preview_offset_map
+        if offsets is None or offsets.text != text:
+            offsets = OffsetMap(text)
+            if message is not None:
+                message['offset_map'] = offsets
+            else:
+                self.preview_offset_map = offsets
+        return offsets
 
     def editor_update_preview_from_input(self, key):
         value = self.editor_base_entries[key].get()
-        message_text = self.editor_preview_text.get("1.0", tk.END).strip()
-        message_text = message_text.replace(key, value)
-        self.editor_preview_text.config(state="normal")
-        self.editor_preview_text.delete(1.0, tk.END)
-        self.editor_preview_text.insert(tk.END, message_text)
-        self.editor_preview_text.config(state="disabled")
+        accessor = editor_field_accessors.get(key)
+        message_text = self.editor_offset_map().replace(accessor, value) if accessor is not None else None
+        if message_text is None:
+            message_text = self.editor_renderer.text().replace(key, value)
+        self.editor_renderer.render(message_text)
         self.editor_highlight_field(key)
 
-    def editor_highlight_field(self, key):
+    def editor_highlight_span(self, span):
         self.editor_preview_text.tag_remove("highlight", "1.0", tk.END)
-        message = self.editor_preview_text.get("1.0", tk.END).strip()
-        field_map = {
-            "{locationDepartment}": ("AIL", 3, 2),
-            "{locationOR}": ("AIL", 3, 1),
-            "{patientMRN}": ("PID", 3, 1),
-            # Add more mappings as needed
-        }
-        if key in field_map:
-            segment, field_idx, component_idx = field_map[key]
-            for i, line in enumerate(message.splitlines()):
-                if line.startswith(segment):
-                    parts = line.split("|")
-                    if len(parts) > field_idx:
-                        field = parts[field_idx]
-                        components = field.split("^")
-                        if len(components) >= component_idx:
-                            value = components[component_idx - 1]
-                            start_idx = line.find(value)
-                            start_pos = f"{i+1}.{start_idx}"
-                            end_pos = f"{i+1}.{start_idx + len(value)}"
-                            self.editor_preview_text.tag_add("highlight", start_pos, end_pos)
-                            self.editor_preview_text.tag_config("highlight", background="yellow", foreground="black")
-                            break
+        if span:
+            line_idx, start, end = span
+            self.editor_preview_text.tag_add("highlight", f"{line_idx+1}.{start}", f"{line_idx+1}.{end}")
+            self.editor_preview_text.tag_config("highlight", background="yellow", foreground="black")
+            self.editor_preview_text.tag_raise("highlight")
+
+    def editor_highlight_field(self, key):
+        accessor = editor_field_accessors.get(key)
+        self.editor_highlight_span(self.editor_offset_map().locate(accessor) if accessor is not None else None)
+
+    def editor_mark_edit_start(self, event):
+        self.edit_start_line = int(self.editor_preview_text.index("insert").split(".")[0])
+
+    def editor_retag_edited_lines(self, event):
+        if not self.direct_edit_mode:
+            return
+        line = int(self.editor_preview_text.index("insert").split(".")[0])
+        # Include a line either side for newlines typed or deleted at the edges
+        first = max(min(line, self.edit_start_line) - 2, 0)
+        self.editor_highlighter.tag_lines(first, max(line, self.edit_start_line) + 1)
+
+    def editor_click_field(self, event):
+        # Clicking a value in the preview focuses its Editor field, or highlights it if it has none
+        if self.direct_edit_mode:
+            return
+        line, column = map(int, self.editor_preview_text.index(f"@{event.x},{event.y}").split("."))
+        offsets = self.editor_offset_map()
+        position = offsets.component_at(line - 1, column)
+        if position is None:
+            return
+        key = editor_field_keys.get((*position, 0)) or editor_field_keys.get((*position[:4], 0, 0))
+        if key is not None:
+            entry = self.editor_base_entries[key]
+            entry.focus_set()
+            entry.select_range(0, tk.END)
+            self.editor_highlight_field(key)
+        else:
+            self.editor_highlight_span(offsets.span_at(line - 1, column))
+
+    def editor_set_message_text(self, message, updated_text):
+        """Store an edit and return its (message, delta) for the undo history."""
+        delta = segment_delta(message['message_text'], updated_text)
+        self.journal_editor_delta(message, delta)
+        self.message_backups[message['file_path']] = message['message_text']
+        self.edited_messages[message['file_path']] = updated_text
+        message['message_text'] = updated_text
+        message['parsed_values'] = self.parse_hl7_message(updated_text)
+        message['dirty'] = updated_text != message['saved_text']
+        message['changed'] = updated_text != message['original_text']
+        return message, delta
+
+    def journal_editor_delta(self, message, delta):
+        # Edits are journaled as segment deltas. A message with unsaved edits already has its text
+        # in the journal; a clean one starts from its saved text, which a file still holding it is
+        # re-read for on recovery (checked by hash) and anything else carries once
+        record = {"op": "editor", "file": message['file_path'], "corpus": message['corpus'], "delta": delta}
+        if not message['dirty']:
+            if message['corpus'] is None and message['loader'] is None and message['saved_text'] == message['original_text']:
+                record["base_hash"] = hashlib.sha256(message['saved_text'].encode("utf-8")).hexdigest()
+            else:
+                record["base"] = message['saved_text']
+        self.journal_append(record)
+
+    def editor_mark_saved(self, messages):
+        for message in messages:
+            message['saved_text'] = message['message_text']
+            message['dirty'] = False
+        if messages:
+            self.journal_append({"op": "saved", "files": [message['file_path'] for message in messages]})
+
+    def editor_message_diff(self, message):
+        # Cached per message and keyed on the text object, which is replaced on every edit
+        cache = message['diff_cache']
+        if cache is None or cache[0] is not message['message_text']:
+            cache = message['diff_cache'] = (message['message_text'], message_diff(message['original_text'], message['message_text']))
+        return cache[1]
+
+    def toggle_diff_pane(self):
+        self.diff_pane_visible = not self.diff_pane_visible
+        if self.diff_pane_visible:
+            self.editor_diff_text.pack(fill=tk.X, pady=(0, 10), before=self.direct_edit_frame)
+            self.editor_update_diff()
+        else:
+            self.editor_diff_text.pack_forget()
+        self.diff_button.config(text="Hide Diff" if self.diff_pane_visible else "Show Diff")
+
+    def editor_update_diff(self):
+        if not self.diff_pane_visible:
+            return
+        self.editor_diff_text.config(state="normal")
+        self.editor_diff_text.delete(1.0, tk.END)
+        if 0 <= self.current_patient_index < len(self.patient_blocks) and 0 <= self.current_message_index < len(self.patient_blocks[self.current_patient_index]['messages']):
+            message = self.patient_blocks[self.current_patient_index]['messages'][self.current_message_index]
+            diff_lines = self.editor_message_diff(message)
+            self.editor_diff_text.insert(tk.END, "\n".join(diff_lines) if diff_lines else "No changes from the original file.")
+        self.editor_diff_text.config(state="disabled")
+
+    def show_changed_files(self):
+        changed = []
+        unsaved = 0
+        for patient_block in self.patient_blocks:
+            for message in patient_block['messages']:
+                if message['changed']:
+                    changed.append(os.path.basename(message['file_path']) + (" (unsaved)" if message['dirty'] else ""))
+                if message['dirty']:
+                    unsaved += 1
+        total = sum(len(patient_block['messages']) for patient_block in self.patient_blocks)
+        summary = f"{len(changed)} of {total} loaded messages differ from their original files, {unsaved} with unsaved changes."
+        if changed:
+            summary += "\n\n" + "\n".join(changed[:50])
+            if len(changed) > 50:
+                summary += f"\n... and {len(changed) - 50} more"
+        messagebox.showinfo("Changed Files", summary)
+
+    def editor_undo(self):
+        self.editor_step_history(self.edit_history.undo_stack, self.edit_history.redo_stack, reverse=True)
+
+    def editor_redo(self):
+        self.editor_step_history(self.edit_history.redo_stack, self.edit_history.undo_stack, reverse=False)
+
+    def editor_step_history(self, source, target, reverse):
+        if not source:
+            return
+        label, changes = source.pop()
+        for message, delta in changes:
+            updated_text = apply_segment_delta(message['message_text'], delta, reverse=reverse)
+            self.editor_set_message_text(message, updated_text)
+        target.append((label, changes))
+        self.editor_load_message()
+        self.editor_context_label.config(text=f"{'Undid' if reverse else 'Redid'} {label} ({len(changes)} messages)")
 
     def editor_apply_changes(self):
         if self.apply_mode.get() == "Current":
@@ -1672,24 +4778,36 @@ For further assistance, contact the application support team or refer to the **H
     def apply_to_current_message(self):
         if 0 <= self.current_patient_index < len(self.patient_blocks) and 0 <= self.current_message_index < len(self.patient_blocks[self.current_patient_index]['messages']):
             message = self.patient_blocks[self.current_patient_index]['messages'][self.current_message_index]
-            original_text = message['message_text']
-            self.message_backups[message['file_path']] = original_text
-            updated_text = self.editor_preview_text.get("1.0", tk.END).strip()
-            self.edited_messages[message['file_path']] = updated_text
-            message['message_text'] = updated_text
+            updated_text = self.editor_renderer.text()
+            self.edit_history.record("Apply to Current", [self.editor_set_message_text(message, updated_text)])
+            self.editor_update_diff()
             messagebox.showinfo("Applied", "Changes applied to current message")
         else:
             messagebox.showwarning("No Message", "No message selected")
 
+    def editor_changed_fields(self):
+        # Entry values that differ from what the displayed message was loaded with
+        message = self.patient_blocks[self.current_patient_index]['messages'][self.current_message_index]
+        changes = {}
+        for key in editor_field_accessors:
+            value = self.editor_base_entries[key].get()
+            if value and value != message['parsed_values'].get(key, ""):
+                changes[key] = value
+        return changes
+
     def apply_to_all_messages(self):
         if 0 <= self.current_patient_index < len(self.patient_blocks):
             patient_block = self.patient_blocks[self.current_patient_index]
+            changes = self.editor_changed_fields()
+            history = []
             for message in patient_block['messages']:
-                original_text = message['message_text']
-                self.message_backups[message['file_path']] = original_text
-                updated_text = self.editor_preview_text.get("1.0", tk.END).strip()
-                self.edited_messages[message['file_path']] = updated_text
-                message['message_text'] = updated_text
+                updated_text = self.editor_ensure_loaded(message)['message_text']
+                for key, value in changes.items():
+                    updated_text = editor_field_accessors[key].set(updated_text, value)
+                if updated_text != message['message_text']:
+                    history.append(self.editor_set_message_text(message, updated_text))
+            self.edit_history.record("Apply to All", history)
+            self.editor_load_message()
             messagebox.showinfo("Applied", f"Changes applied to all {len(patient_block['messages'])} messages in this patient block")
         else:
             messagebox.showwarning("No Patient Block", "No patient block selected")
@@ -1704,34 +4822,33 @@ For further assistance, contact the application support team or refer to the **H
     def save_direct_edit_current(self):
         if 0 <= self.current_patient_index < len(self.patient_blocks) and 0 <= self.current_message_index < len(self.patient_blocks[self.current_patient_index]['messages']):
             message = self.patient_blocks[self.current_patient_index]['messages'][self.current_message_index]
-            original_text = message['message_text']
-            self.message_backups[message['file_path']] = original_text
-            updated_text = self.editor_preview_text.get("1.0", tk.END).strip()
-            try:
-                #parse_message(updated_text)  # Validate HL7 message
-                self.edited_messages[message['file_path']] = updated_text
-                message['message_text'] = updated_text
-                messagebox.showinfo("Saved", "Direct edits saved to current message")
-            except ValidationError as e:
-                messagebox.showwarning("Validation Error", f"Invalid HL7 message: {e}")
+            updated_text = self.editor_renderer.text()
+            if not self.confirm_structure(updated_text):
+                return
+            self.edit_history.record("Direct Edit", [self.editor_set_message_text(message, updated_text)])
+            self.editor_update_diff()
+            messagebox.showinfo("Saved", "Direct edits saved to current message")
 
     def save_direct_edit_all(self):
         if 0 <= self.current_patient_index < len(self.patient_blocks):
             patient_block = self.patient_blocks[self.current_patient_index]
-            updated_text = self.editor_preview_text.get("1.0", tk.END).strip()
-            try:
-                #parse_message(updated_text)  # Validate HL7 message
-                for message in patient_block['messages']:
-                    original_text = message['message_text']
-                    self.message_backups[message['file_path']] = original_text
-                    self.edited_messages[message['file_path']] = updated_text
-                    message['message_text'] = updated_text
-                messagebox.showinfo("Saved", f"Direct edits saved to all {len(patient_block['messages'])} messages in this patient block")
-            except ValidationError as e:
-                messagebox.showwarning("Validation Error", f"Invalid HL7 message: {e}")
+            updated_text = self.editor_renderer.text()
+            if not self.confirm_structure(updated_text):
+                return
+            history = [self.editor_set_message_text(self.editor_ensure_loaded(message), updated_text) for message in patient_block['messages']]
+            self.edit_history.record("Direct Edit to All", history)
+            self.editor_update_diff()
+            messagebox.showinfo("Saved", f"Direct edits saved to all {len(patient_block['messages'])} messages in this patient block")
         else:
             messagebox.showwarning("No Patient Block", "No patient block selected")
 
+    def confirm_structure(self, message_text):
+        errors = validate_structure(message_text)
+        if not errors:
+            return True
+        shown = "\n".join(errors[:10]) + (f"\n...and {len(errors) - 10} more" if len(errors) > 10 else "")
+        return messagebox.askyesno("Validation Error", f"The edited message has problems:\n\n{shown}\n\nSave anyway?")
+
     def editor_prev_message(self):
         if self.current_patient_index >= 0 and self.current_message_index > 0:
             self.current_message_index -= 1
@@ -1785,7 +4902,40 @@ procedure_fields = [
     {"prompt": "Special Needs:", "key": "{specialNeeds}"},
 ]
 
+fixed_roles = [
+    {"role": "Primary Surgeon", "code": "1.1^Primary", "last_key": "{primaryLastName}", "first_key": "{primaryFirstName}"},
+    {"role": "Circulator", "code": "4.20^Circulator", "last_key": "{lastName}", "first_key": "{firstName}"},
+    {"role": "Scrub", "code": "4.150^Scrub", "last_key": "{lastName}", "first_key": "{firstName}"},
+    {"role": "CRNA", "code": "2.20^ANE CRNA", "last_key": "{lastName}", "first_key": "{firstName}"},
+    {"role": "Anesthesiologist", "code": "2.139^Anesthesiologist", "last_key": "{lastName}", "first_key": "{firstName}"},
+]
+
+# Where each Editor field lives in a message. Adding a field here is all the Editor
+# needs to load, highlight and bulk-edit it.
+editor_field_paths = {
+    "{patientFirstName}": "PID-5.2",
+    "{patientLastName}": "PID-5.1",
+    "{patientGender}": "PID-8",
+    "{patientDOB}": "PID-7",
+    "{patientMRN}": "PID-3.1",
+    "{encounterType}": "PV1-2",
+    "{duration}": "SCH-9",
+    "{procedure}": "AIS-3.2",
+    "{procedureId}": "AIS-3.1",
+    "{cptCode}": "ZCS-7.1",
+    "{procedureDescription}": "NTE-3",
+    "{specialNeeds}": "NTE[2]-3",
+    "{locationDepartment}": "AIL-3.4",
+    "{locationOR}": "AIL-3.2",
+    "{addOn}": "ZCS-2",
+}
+editor_field_accessors = {key: compile_field_path(path) for key, path in editor_field_paths.items()}
+editor_field_keys = {(a.segment, a.occurrence, a.field_index, a.repetition, a.component, a.subcomponent): key
+                     for key, a in editor_field_accessors.items()}
+editor_field_extractor = FieldExtractor(editor_field_paths)
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Deep validation workers in the packaged build
     root = tk.Tk()
     app = HL7MessageApp(root)
     root.mainloop()
\ No newline at end of file
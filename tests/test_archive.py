@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+app_module = pytest.importorskip("HL7MessageCreatorFileView24Allergies")
+
+def test_names_with_separators_round_trip(tmp_path):
+    path = str(tmp_path / "messages.hl7.gz")
+    named_messages = [("tab\there.hl7", "MSH|1"), ("new\nline.hl7", "MSH|2"), ("sep \x1c.hl7", "MSH|3")]
+
+    assert app_module.write_archive(path, named_messages) == 3
+
+    archive = app_module.MessageArchive(path)
+    assert archive.names() == [name for name, _ in named_messages]
+    assert [archive.read(i) for i in range(len(archive))] == [text for _, text in named_messages]
@@ -0,0 +1,32 @@
+import os
+import stat
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+app_module = pytest.importorskip("HL7MessageCreatorFileView24Allergies")
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="POSIX permission bits")
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+def test_replacing_a_file_keeps_its_mode(tmp_path):
+    path = tmp_path / "message.hl7"
+    path.write_text("old")
+    os.chmod(path, 0o640)
+
+    app_module.atomic_write_text(str(path), "new")
+
+    assert path.read_text() == "new"
+    assert mode(path) == 0o640
+
+def test_new_files_follow_the_umask(tmp_path):
+    path = tmp_path / "message.hl7"
+    app_module.atomic_write_text(str(path), "new")
+    archive_path = tmp_path / "messages.hl7.gz"
+    app_module.write_archive(str(archive_path), [("a.hl7", "MSH|1")])
+
+    assert mode(path) == 0o666 & ~app_module._UMASK
+    assert mode(archive_path) == 0o666 & ~app_module._UMASK
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+app_module = pytest.importorskip("HL7MessageCreatorFileView24Allergies")
+
+MESSAGE = "MSH|^~\\&|||||20250101080000||SIU^S12|1|P|2.5\nPID|1||1000||DOE^JOHN\n"
+
+def test_save_creates_store_and_open_reads_it(tmp_path):
+    path = str(tmp_path / "corpus.sqlite")
+    store = app_module.CorpusStore(path, create=True)
+    assert store.add_messages([("a.hl7", MESSAGE)]) == 1
+    store.close()
+
+    store = app_module.CorpusStore(path)
+    assert [row[1] for row in store.find(last_name="doe")] == ["a.hl7"]
+    store.close()
+
+def test_other_sqlite_files_are_left_alone(tmp_path):
+    path = str(tmp_path / "other.sqlite")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE notes (body TEXT)")
+    connection.commit()
+    connection.close()
+    before = open(path, "rb").read()
+
+    for create in (False, True):
+        with pytest.raises(ValueError, match="not a corpus store"):
+            app_module.CorpusStore(path, create=create)
+    assert open(path, "rb").read() == before
+
+def test_open_does_not_create_missing_or_empty_stores(tmp_path):
+    with pytest.raises(ValueError):
+        app_module.CorpusStore(str(tmp_path / "missing.sqlite"))
+    assert not os.path.exists(tmp_path / "missing.sqlite")
+
+    empty = tmp_path / "empty.sqlite"
+    empty.write_bytes(b"")
+    with pytest.raises(ValueError):
+        app_module.CorpusStore(str(empty))
+    assert empty.read_bytes() == b""
+
+def test_non_database_file_raises_sqlite_error(tmp_path):
+    path = tmp_path / "notes.sqlite"
+    path.write_text("not a database " * 100)
+    with pytest.raises(sqlite3.DatabaseError):
+        app_module.CorpusStore(str(path))
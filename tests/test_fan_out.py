@@ -0,0 +1,95 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+app_module = pytest.importorskip("HL7MessageCreatorFileView24Allergies")
+
+class RecordingDestination(app_module.FanOutDestination):
+    def __init__(self, name, delay=0.0, **kwargs):
+        super().__init__(name, **kwargs)
+        self.delay = delay
+        self.received = []
+
+    async def deliver(self, key, message_text):
+        await asyncio.sleep(self.delay)
+        self.received.append((key, message_text, time.monotonic()))
+
+def test_slow_destination_does_not_hold_up_the_others():
+    # Inbox and queue together buffer the whole stream for the slow destination
+    slow = RecordingDestination("slow", delay=0.05, queue_size=5, in_flight=1)
+    fast = RecordingDestination("fast", queue_size=5, in_flight=1)
+    keyed_messages = [("A", f"MSG{i}") for i in range(10)]
+
+    app_module.fan_out_messages([slow, fast], keyed_messages)
+
+    assert [message for _, message, _ in fast.received] == [message for _, message in keyed_messages]
+    assert [message for _, message, _ in slow.received] == [message for _, message in keyed_messages]
+    # The fast destination finished before the slow one had delivered half of its messages
+    assert fast.received[-1][2] < slow.received[4][2]
+
+def test_full_slow_destination_pushes_back_on_the_publisher():
+    slow = RecordingDestination("slow", delay=0.02, queue_size=2, in_flight=1)
+    published = []
+
+    async def run():
+        sender = app_module.FanOutSender([slow])
+        await sender.open()
+        for i in range(20):
+            await sender.publish("A", f"MSG{i}")
+            published.append(len(slow.received))
+        await sender.close()
+
+    asyncio.run(run())
+    assert len(slow.received) == 20
+    # Publishing never ran further ahead of delivery than the inbox and queue plus the
+    # messages held by the feeder, the worker and the delivery in flight
+    assert max(i + 1 - delivered for i, delivered in enumerate(published)) <= 2 + 2 + 3
+
+def test_drop_oldest_never_waits_on_a_slow_destination():
+    slow = RecordingDestination("slow", delay=0.05, queue_size=2, in_flight=1, overflow="drop_oldest")
+    fast = RecordingDestination("fast", queue_size=2, in_flight=1, overflow="drop_oldest")
+    keyed_messages = [("A", f"MSG{i}") for i in range(20)]
+
+    app_module.fan_out_messages([slow, fast], keyed_messages)
+
+    assert slow.dropped > 0
+    assert len(slow.received) + slow.dropped == 20
+    assert len(fast.received) + fast.dropped == 20
+    assert slow.received[-1][1] == "MSG19"
+
+def test_stdout_destination_without_a_console(monkeypatch):
+    destination = app_module.StdoutDestination()
+    monkeypatch.setattr(sys, "stdout", None)
+
+    app_module.fan_out_messages([destination], [("A", "MSH|1")])
+
+    assert destination.failed == 1 and destination.retried == 0
+
+class FlakyDestination(RecordingDestination):
+    """Fails the first attempt at each message listed in flaky."""
+
+    def __init__(self, name, flaky, **kwargs):
+        super().__init__(name, **kwargs)
+        self.flaky = set(flaky)
+
+    async def deliver(self, key, message_text):
+        if message_text in self.flaky:
+            self.flaky.discard(message_text)
+            raise app_module.DeliveryError("try again")
+        await super().deliver(key, message_text)
+
+def test_retry_holds_back_later_messages_for_the_same_key():
+    destination = FlakyDestination("flaky", flaky={"A0", "B1"}, delay=0.001, retry_delay=0.02)
+    keyed_messages = [(key, f"{key}{i}") for i in range(5) for key in "ABC"]
+
+    app_module.fan_out_messages([destination], keyed_messages)
+
+    for key in "ABC":
+        assert [message for k, message, _ in destination.received if k == key] == [f"{key}{i}" for i in range(5)]
+    assert destination.retried == 2 and destination.failed == 0
+    # Keys without failures were not held up by the retries
+    assert [message for _, message, _ in destination.received][-1] in ("A4", "B4")
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+app_module = pytest.importorskip("HL7MessageCreatorFileView24Allergies")
+
+ORIGINAL = "MSH|^~\\&|APP|FAC\nPID|1||1000||DOE^JOHN\nPV1|1|I|OR1\n"
+
+def make_app():
+    app = app_module.HL7MessageApp.__new__(app_module.HL7MessageApp)
+    app.records = []
+    app.journal_append = app.records.append
+    app.parse_hl7_message = lambda text: {}
+    app.message_backups = {}
+    app.edited_messages = {}
+    return app
+
+def make_message(file_path, text=ORIGINAL, saved_text=None):
+    saved_text = text if saved_text is None else saved_text
+    return {'file_path': file_path, 'message_text': text, 'original_text': text, 'saved_text': saved_text,
+            'dirty': text != saved_text, 'changed': False, 'corpus': None, 'loader': None}
+
+def replay(app, records):
+    edits = {}
+    for record in records:
+        edits[record["file"]] = app.replay_editor_record(record, edits.get(record["file"]))
+    return {file_path: edit["text"] for file_path, edit in edits.items()}
+
+def test_edits_are_journaled_as_deltas_and_replayed(tmp_path):
+    path = tmp_path / "DOE-00.hl7"
+    path.write_text(ORIGINAL)
+    app = make_app()
+    message = make_message(str(path))
+
+    app.editor_set_message_text(message, ORIGINAL.replace("OR1", "OR2"))
+    app.editor_set_message_text(message, message['message_text'].replace("DOE^JOHN", "DOE^JANE"))
+
+    assert all("text" not in record and "base" not in record for record in app.records)
+    assert "base_hash" in app.records[0] and "base_hash" not in app.records[1]
+    assert replay(app, app.records) == {str(path): message['message_text']}
+
+def test_message_saved_elsewhere_carries_its_base(tmp_path):
+    path = tmp_path / "DOE-00.hl7"
+    path.write_text(ORIGINAL)
+    app = make_app()
+    saved = ORIGINAL.replace("OR1", "OR5")
+    message = make_message(str(path), text=saved, saved_text=saved)
+    message['original_text'] = ORIGINAL
+
+    app.editor_set_message_text(message, saved.replace("PV1|1|I", "PV1|1|O"))
+
+    assert app.records[0]["base"] == saved
+    assert replay(app, app.records) == {str(path): message['message_text']}
+
+def test_file_changed_on_disk_is_not_patched(tmp_path):
+    path = tmp_path / "DOE-00.hl7"
+    path.write_text(ORIGINAL)
+    app = make_app()
+    app.editor_set_message_text(make_message(str(path)), ORIGINAL.replace("OR1", "OR2"))
+    path.write_text(ORIGINAL.replace("PID|1", "PID|2"))
+
+    with pytest.raises(ValueError):
+        replay(app, app.records)
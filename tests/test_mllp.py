@@ -0,0 +1,58 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+app_module = pytest.importorskip("HL7MessageCreatorFileView24Allergies")
+
+def make_message(number):
+    return f"MSH|^~\\&|APP|FAC|REC|RFAC|20250101080000||SIU^S12|CTRL{number}|P|2.5\nSCH|{number}\n"
+
+def test_queued_messages_do_not_time_out_behind_a_full_window():
+    async def run():
+        listener = app_module.MLLPListener(port=0, delay=0.05)
+        await listener.start()
+        sender = app_module.MLLPSender("localhost", listener.port, connections=1, window=1, ack_timeout=1)
+        try:
+            results = await sender.send_all([("A", make_message(i)) for i in range(60)])
+        finally:
+            await sender.close()
+            await listener.stop()
+        return results, listener.records
+
+    results, records = asyncio.run(run())
+    assert [result.error for result in results] == [None] * 60
+    assert [result.ack_code for result in results] == ["AA"] * 60
+    assert len(records) == 60
+
+def test_unanswered_messages_time_out_and_free_their_window_slot():
+    async def run():
+        received = []
+
+        async def silent(reader, writer):
+            try:
+                while True:
+                    received.append(await app_module.read_mllp_frame(reader))
+            except (OSError, asyncio.IncompleteReadError):
+                writer.close()
+
+        server = await asyncio.start_server(silent, "localhost", 0)
+        port = server.sockets[0].getsockname()[1]
+        sender = app_module.MLLPSender("localhost", port, connections=1, window=1, ack_timeout=0.1)
+        started = time.monotonic()
+        try:
+            results = await sender.send_all([("A", make_message(i)) for i in range(3)])
+        finally:
+            await sender.close()
+            server.close()
+            await server.wait_closed()
+        return results, received, time.monotonic() - started
+
+    results, received, elapsed = asyncio.run(run())
+    assert [result.error for result in results] == ["Timed out waiting for ACK"] * 3
+    # Each message was written once its predecessor timed out, not all timed out while queued
+    assert len(received) == 3
+    assert elapsed >= 0.3
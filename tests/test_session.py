@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+app_module = pytest.importorskip("HL7MessageCreatorFileView24Allergies")
+
+def make_app(monkeypatch, path):
+    app = app_module.HL7MessageApp.__new__(app_module.HL7MessageApp)
+    app.mode = "Creator"
+    app.patients = []
+    app.current_patient_index = -1
+    app.last_mrn = 1000
+    app.journal = None
+    app.shown = []
+    app.creator_load_patient = lambda: app.shown.append(app.current_patient_index)
+    app.errors = []
+    monkeypatch.setattr(app_module.filedialog, "askopenfilename", lambda **kwargs: str(path))
+    monkeypatch.setattr(app_module.messagebox, "showerror", lambda *args, **kwargs: app.errors.append(args))
+    monkeypatch.setattr(app_module.messagebox, "showwarning", lambda *args, **kwargs: app.errors.append(args))
+    return app
+
+def write_lines(path, current, lines):
+    header = f'{{"format": "{app_module.SESSION_FORMAT}", "version": 1, "patients": {len(lines)}, "current": {current}, "last_mrn": 1005}}'
+    path.write_text("\n".join([header] + lines) + "\n")
+
+def test_unreadable_current_record_fails_before_patients_are_replaced(tmp_path, monkeypatch):
+    path = tmp_path / "bad.hl7session"
+    write_lines(path, 0, ['{"base_values": {}, "environment": "TEST"}'])
+    app = make_app(monkeypatch, path)
+    existing = app.patients
+
+    app.open_session()
+
+    assert app.errors and app.errors[0][0] == "Open Failed"
+    assert app.patients is existing and app.shown == []
+
+def test_damaged_record_is_replaced_when_first_used(tmp_path, monkeypatch):
+    path = tmp_path / "session.hl7session"
+    good = app_module.PatientRecord()
+    good.base_values["{patientLastName}"] = "DOE"
+    write_lines(path, 0, [good.to_session_line(), '{"base_values": {"{patientLastName}": "TORN'])
+    app = make_app(monkeypatch, path)
+
+    app.open_session()
+    assert app.errors == [] and app.shown == [0]
+
+    app.creator_load_records(range(len(app.patients)))
+    assert app.errors[0][0] == "Damaged Session Records" and "Patient 2" in app.errors[0][1]
+    assert app.patients[0].base_values["{patientLastName}"] == "DOE"
+    assert app.patients[1].base_values["{patientLastName}"] == ""
+
+def test_legacy_app_sessions_are_not_opened(tmp_path):
+    legacy = pytest.importorskip("HL7MessageCreatorFileView20")
+    path = tmp_path / "legacy.hl7session"
+    legacy.write_session(str(path), [legacy.PatientRecord("TEST")], 0, 1000)
+
+    with pytest.raises(ValueError, match="not a Creator session file"):
+        app_module.read_session(str(path))
@@ -0,0 +1,48 @@
+import itertools
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+app_module = pytest.importorskip("HL7MessageCreatorFileView24Allergies")
+
+base_values = {
+    "{patientFirstName}": "JOHN", "{patientLastName}": "DOE", "{patientGender}": "M", "{patientDOB}": "19800101",
+    "{patientMRN}": "1000", "{encounterType}": "IP", "{YYYYMMDD}": "20250101", "{scheduledTime}": "080000",
+    "{duration}": "90", "{procedure}": "APPENDECTOMY", "{procedureId}": "P100", "{cptCode}": "44950",
+    "{procedureDescription}": "LAPAROSCOPIC", "{specialNeeds}": "NONE", "{locationDepartment}": "MAIN OR",
+    "{locationOR}": "OR1", "{addOn}": "N",
+}
+
+def make_patient(procedures, extra_staff, allergies, message_type):
+    patient = app_module.PatientRecord()
+    patient.base_values.update(base_values)
+    patient.message_type = message_type
+    for role, staff in patient.fixed_staff.items():
+        staff.update(lastName=role.split()[-1].upper(), firstName="PAT", id="2000")
+    for i in range(procedures):
+        patient.procedures.append({"{procedure}": f"PROC{i}", "{procedureId}": f"P{i}", "{procedureDescription}": f"DESC{i}", "{specialNeeds}": "NONE"})
+    for i in range(extra_staff):
+        patient.additional_surgeons.append(dict(app_module.new_staff_entry("Assistant Surgeon", "3000"), lastName=f"ASST{i}", firstName="SAM"))
+        patient.staff_members.append(dict(app_module.new_staff_entry("Staff", "4000"), lastName=f"STAFF{i}", firstName="ALEX"))
+    for i in range(allergies):
+        patient.allergies.append({"allergyID": f"A{i}", "allergyName": f"ALLERGEN{i}", "allergyReaction": "HIVES", "allergySeverity": "MO"})
+    return patient
+
+@pytest.mark.parametrize("procedures, extra_staff, allergies, message_type", list(itertools.product(
+    [1, 2, 3], [0, 2], [0, 2], ["Scheduled", "Scheduled & Case Events", "Scheduled & Canceled"])))
+def test_generated_messages_validate(procedures, extra_staff, allergies, message_type):
+    random.seed(procedures)
+    app = app_module.HL7MessageApp.__new__(app_module.HL7MessageApp)
+    app.fixed_roles = app_module.fixed_roles
+    patient = make_patient(procedures, extra_staff, allergies, message_type)
+    app.generate_patient_messages(patient)
+    assert patient.messages
+    for message_text, index in patient.messages:
+        assert app_module.validate_structure(message_text) == [], (index, message_text)
+
+def test_resource_group_order_is_still_checked():
+    message_text = "\n".join(["MSH|^~\\&|||||20250101080000||SIU^S12|1|P|2.5", "SCH|1", "PID|1", "RGS|1", "AIL|1", "AIS|1"])
+    assert "line 6: Out of order segment AIS" in app_module.validate_structure(message_text)